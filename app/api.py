@@ -8,65 +8,394 @@ Endpoints pour:
 - GraphRAG QA (fusion graph + vector + LLM)
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
+import atexit
+import logging
 import math
+import orjson
 import os
 import tempfile
 import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, wraps
+from pathlib import Path
 from werkzeug.utils import secure_filename
 
-from ticker_agent import TickerAgent
-from financial_data_agent import FinancialDataAgent
-from graph_agent import GraphAgent
-from sec_filing_agent import SECParserAgent
-from llm_synthesis_agent import LLMSynthesisAgent
-from vector_store_agent import VectorStoreAgent
-from source_discovery_agent import SourceDiscoveryAgent
-from entity_extraction_agent import EntityExtractionAgent
-from graphrag_agent import GraphRAGAgent
+import neo4j_driver
+from qa_cache import SemanticQACache
 
 app = Flask(__name__)
 CORS(app)
 
+# Logs des agents (graphe, GraphRAG, données financières): LOG_LEVEL=DEBUG pour le détail
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(message)s")
+
 # ============================================
-# Initialisation des agents
+# Initialisation des agents (paresseuse)
 # ============================================
-print("\n" + "=" * 50)
-print("🚀 Initialisation des agents...")
-print("=" * 50)
+# Chaque agent (et son module: modèle d'embeddings, driver Neo4j, client
+# Ollama...) n'est importé et construit qu'au premier endpoint qui l'utilise.
+
+_agents_lock = threading.RLock()
+
+
+def lazy_agent(factory):
+    """Construit l'agent au premier appel (thread-safe) puis le réutilise."""
+    cached = lru_cache(maxsize=1)(factory)
+
+    @wraps(factory)
+    def getter():
+        with _agents_lock:
+            return cached()
+
+    return getter
+
+
+@lazy_agent
+def get_ticker_agent():
+    from ticker_agent import TickerAgent
+    return TickerAgent()
+
+
+@lazy_agent
+def get_financial_agent():
+    from financial_data_agent import FinancialDataAgent
+    return FinancialDataAgent()
+
+
+@lazy_agent
+def get_graph_agent():
+    from graph_agent import GraphAgent
+    return GraphAgent(password="Caluboss18")
+
+
+@lazy_agent
+def get_sec_parser():
+    from sec_filing_agent import SECParserAgent
+    return SECParserAgent()
+
+
+@lazy_agent
+def get_llm_synthesis():
+    from llm_synthesis_agent import LLMSynthesisAgent
+    return LLMSynthesisAgent()
+
+
+@lazy_agent
+def get_vector_agent():
+    from vector_store_agent import VectorStoreAgent
+    return VectorStoreAgent()
+
+
+@lazy_agent
+def get_source_agent():
+    from source_discovery_agent import SourceDiscoveryAgent
+    return SourceDiscoveryAgent()
+
+
+@lazy_agent
+def get_entity_agent():
+    from entity_extraction_agent import EntityExtractionAgent
+    return EntityExtractionAgent()
 
-ticker_agent = TickerAgent()
-financial_agent = FinancialDataAgent()
-graph_agent = GraphAgent(password="Caluboss18")
-sec_parser = SECParserAgent()
-llm_synthesis = LLMSynthesisAgent()
-vector_agent = VectorStoreAgent()
-source_agent = SourceDiscoveryAgent()
-entity_agent = EntityExtractionAgent()
-graphrag_agent = GraphRAGAgent(vector_store=vector_agent, graph_password="Caluboss18")
 
-print("=" * 50)
-print("✓ Tous les agents sont prêts!")
-print("=" * 50 + "\n")
+@lazy_agent
+def get_graphrag_agent():
+    from graphrag_agent import GraphRAGAgent
+    return GraphRAGAgent(vector_store=get_vector_agent(), graph_password="Caluboss18")
+
+
+def warm_up_llm(model: str = "llama3.2", keep_alive: str = "1h"):
+    """
+    Charge le modèle dans Ollama et l'y garde (keep_alive), pour que le
+    premier /api/qa après le démarrage ne paie pas le chargement des poids.
+    """
+    try:
+        import ollama
+        ollama.Client().generate(
+            model=model,
+            prompt=" ",
+            options={"num_predict": 1},
+            keep_alive=keep_alive
+        )
+        print(f"✓ Modèle {model} préchargé dans Ollama")
+    except Exception as e:
+        print(f"⚠ Préchargement du modèle impossible: {e}")
+
+
+# Préchargement en arrière-plan pour ne pas bloquer le démarrage
+if os.getenv("OLLAMA_WARMUP", "1") == "1":
+    threading.Thread(target=warm_up_llm, daemon=True).start()
 
 
 # ============================================
 # Utilitaires
 # ============================================
 
-def clean_nan(data):
-    """Remplace récursivement tous les NaN par None."""
-    if isinstance(data, dict):
-        return {key: clean_nan(value) for key, value in data.items()}
-    elif isinstance(data, list):
-        return [clean_nan(item) for item in data]
-    elif isinstance(data, float):
-        if math.isnan(data) or math.isinf(data):
-            return None
-        return data
-    else:
-        return data
+_ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _json_default(obj):
+    """Fallback orjson pour les types non natifs (ex: DateTime Neo4j)."""
+    if hasattr(obj, "iso_format"):
+        return obj.iso_format()
+    raise TypeError
+
+
+def to_json(data) -> bytes:
+    """
+    Sérialise en JSON avec orjson.
+    orjson écrit NaN/Inf en null côté C, sans parcours récursif en Python.
+    """
+    return orjson.dumps(data, default=_json_default, option=_ORJSON_OPTIONS)
+
+
+def json_response(data, status: int = 200):
+    """Construit une réponse Flask JSON via to_json."""
+    return app.response_class(
+        to_json(data),
+        status=status,
+        mimetype='application/json'
+    )
+
+
+# Cache sémantique /api/qa: une question quasi identique (cosinus > 0.95)
+# renvoie la réponse déjà calculée. Vidé à chaque écriture dans le graphe
+# ou le vector store (dans tous les workers, via QA_CACHE_DIR), persisté à
+# l'arrêt du process.
+qa_cache = SemanticQACache(
+    threshold=float(os.getenv("QA_CACHE_THRESHOLD", "0.95")),
+    cache_dir=os.getenv("QA_CACHE_DIR", "./.qa_cache"),
+    dumps=to_json,
+    # Modèle des embeddings de questions (VectorStoreAgent.embed)
+    embedding_model=(
+        "minishlab/potion-base-8M" if os.getenv("EMBEDDING_BACKEND") == "model2vec"
+        else "all-MiniLM-L6-v2"
+    )
+)
+atexit.register(qa_cache.save)
+atexit.register(neo4j_driver.close_drivers)
+
+
+def finite_or_none(data: dict) -> dict:
+    """Remplace les NaN/Inf d'un dict plat par None (écriture Neo4j)."""
+    return {
+        key: None if isinstance(value, float) and not math.isfinite(value) else value
+        for key, value in data.items()
+    }
+
+
+
+# Chemins dont l'existence a déjà été vérifiée récemment (LRU borné, résultat
+# positif gardé KNOWN_PATHS_TTL secondes: un fichier supprimé depuis est revu)
+KNOWN_PATHS_MAX = 1024
+KNOWN_PATHS_TTL = 60  # secondes
+_known_paths = OrderedDict()  # chemin -> instant de la vérification
+_known_paths_lock = threading.Lock()
+
+
+def path_exists(path: str) -> bool:
+    """os.path.exists avec cache borné (taille et durée) des résultats positifs."""
+    now = time.monotonic()
+    with _known_paths_lock:
+        checked_at = _known_paths.get(path)
+        if checked_at is not None and now - checked_at < KNOWN_PATHS_TTL:
+            _known_paths.move_to_end(path)
+            return True
+
+    if not Path(path).exists():
+        with _known_paths_lock:
+            _known_paths.pop(path, None)
+        return False
+
+    with _known_paths_lock:
+        _known_paths[path] = now
+        _known_paths.move_to_end(path)
+        while len(_known_paths) > KNOWN_PATHS_MAX:
+            _known_paths.popitem(last=False)
+    return True
+
+
+INGEST_WORKERS = 8
+
+
+def ingest_all_sources(sources: list) -> list:
+    """
+    Ingère les sources en parallèle (lecture disque / parsing I/O-bound).
+    L'ordre est conservé et les sources en erreur sont ignorées.
+    """
+    source_agent = get_source_agent()
+
+    with ThreadPoolExecutor(max_workers=INGEST_WORKERS) as executor:
+        contents = list(executor.map(source_agent.ingest_source, sources))
+
+    ingested = []
+    for source, content in zip(sources, contents):
+        if "error" not in content:
+            content["source_info"] = source
+            ingested.append(content)
+
+    return ingested
+
+
+def vector_documents(ingested: list, source_label: str) -> list:
+    """Prépare les contenus ingérés pour VectorStoreAgent.add_documents."""
+    documents = []
+
+    for content in ingested:
+        text = content.get("text_content", "")
+        source_info = content.get("source_info", {})
+
+        if text and len(text) > 50:
+            documents.append({
+                "ticker": source_info.get("name", "doc"),
+                "text": text,  # Taille bornée par add_documents
+                "metadata": {
+                    "section": source_info.get("type", "document"),
+                    "source": source_label,
+                    "path": source_info.get("path", "")
+                }
+            })
+
+    return documents
+
+
+def dedupe_extractions(extractions: list) -> list:
+    """
+    Retire des extractions les entités et relations déjà vues dans un
+    document précédent du batch (un MERGE Neo4j par élément unique).
+    Une entité est identifiée par (nom normalisé, type).
+    """
+    seen_entities = set()
+    seen_relations = set()
+    deduped = []
+
+    for extraction in extractions:
+        entities = []
+        for entity in extraction.get("entities", []):
+            key = (str(entity.get("name", "")).strip().lower(), entity.get("type"))
+            if key not in seen_entities:
+                seen_entities.add(key)
+                entities.append(entity)
+
+        relations = []
+        for rel in extraction.get("relations", []):
+            key = (
+                str(rel.get("source", "")).strip().lower(),
+                rel.get("relation"),
+                str(rel.get("target", "")).strip().lower()
+            )
+            if key not in seen_relations:
+                seen_relations.add(key)
+                relations.append(rel)
+
+        deduped.append({**extraction, "entities": entities, "relations": relations})
+
+    return deduped
+
+# ============================================
+# Jobs en arrière-plan
+# ============================================
+
+# Les pipelines longs (ingestion, extraction LLM, écritures Neo4j) peuvent
+# tourner hors du worker HTTP: la requête retourne 202 + job_id immédiatement.
+job_executor = ThreadPoolExecutor(max_workers=int(os.getenv("PIPELINE_WORKERS", "2")))
+
+# État des jobs: un fichier JSON par job, partagé par les workers gunicorn
+# (le statut est lisible quel que soit le worker qui reçoit le polling)
+JOBS_DIR = Path(os.getenv("JOBS_DIR", "./.jobs"))
+MAX_JOBS = 500
+jobs_lock = threading.Lock()
+
+
+def _job_file(job_id: str) -> Path:
+    """Fichier d'état d'un job."""
+    return JOBS_DIR / f"{job_id}.json"
+
+
+def save_job(job: dict):
+    """Écrit l'état d'un job (fichier temporaire puis remplacement atomique)."""
+    JOBS_DIR.mkdir(parents=True, exist_ok=True)
+    path = _job_file(job["job_id"])
+    tmp_file = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp_file.write_bytes(to_json(job))
+    os.replace(tmp_file, path)
+
+
+def load_job(job_id: str):
+    """État d'un job, None s'il est inconnu."""
+    try:
+        return orjson.loads(_job_file(job_id).read_bytes())
+    except (OSError, ValueError):
+        return None
+
+
+def evict_jobs():
+    """
+    Oublie les jobs terminés les plus anciens au-delà de MAX_JOBS; un job en
+    attente ou en cours n'est jamais supprimé.
+    """
+    files = []
+    for path in JOBS_DIR.glob("*.json"):
+        try:
+            files.append((path.stat().st_mtime, path))
+        except OSError:
+            pass  # Supprimé entre-temps par un autre worker
+
+    excess = len(files) - MAX_JOBS
+    for _, path in sorted(files):
+        if excess <= 0:
+            break
+        job = load_job(path.stem)
+        if job is not None and job.get("status") in ("finished", "failed"):
+            path.unlink(missing_ok=True)
+            excess -= 1
+
+
+def submit_job(func, *args):
+    """Soumet func(*args) -> (payload, status) au pool et retourne une réponse 202."""
+    job_id = uuid.uuid4().hex[:12]
+    job = {"job_id": job_id, "status": "queued"}
+
+    with jobs_lock:
+        save_job(job)
+        evict_jobs()
+
+    def run():
+        job["status"] = "running"
+        save_job(job)
+        try:
+            payload, status = func(*args)
+            job.update({"status": "finished", "http_status": status, "result": payload})
+        except Exception as e:
+            job.update({"status": "failed", "error": str(e)})
+        try:
+            save_job(job)
+        except Exception as e:
+            # Résultat non sérialisable: le job ne doit pas rester "running"
+            save_job({"job_id": job_id, "status": "failed", "error": f"Résultat non enregistré: {e}"})
+
+    job_executor.submit(run)
+
+    return json_response({
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/api/jobs/{job_id}"
+    }, 202)
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Statut (et résultat une fois terminé) d'un job en arrière-plan."""
+    job = load_job(job_id) if job_id.isalnum() else None
+    if job is None:
+        return jsonify({"error": f"Unknown job: {job_id}"}), 404
+    return json_response(job)
 
 
 # ============================================
@@ -82,33 +411,33 @@ def analyze():
     if not query:
         return jsonify({"error": "No query provided"}), 400
 
-    ticker_result = ticker_agent.find_ticker(query)
+    ticker_result = get_ticker_agent().find_ticker(query)
 
     if not ticker_result.get("validated"):
         return jsonify({"error": f"Unable to find ticker for '{query}'"}), 404
 
     ticker = ticker_result["ticker"]
-    financial_data = financial_agent.get_company_data(ticker)
+    financial_data = get_financial_agent().get_company_data(ticker)
 
     if "error" in financial_data:
         return jsonify({"error": financial_data["error"]}), 500
 
-    financial_data = clean_nan(financial_data)
+    financial_data = finite_or_none(financial_data)
 
     try:
-        graph_agent.create_company_node(financial_data)
+        get_graph_agent().create_company_node(financial_data)
+        qa_cache.clear()
         print(f"✓ {ticker} ajouté au graph")
     except Exception as e:
         print(f"⚠ Erreur lors de l'ajout au graph: {e}")
 
     price_history = {
-        "1mo": financial_agent.get_price_history(ticker, "1mo"),
-        "6mo": financial_agent.get_price_history(ticker, "6mo"),
-        "1y": financial_agent.get_price_history(ticker, "1y")
+        "1mo": get_financial_agent().get_price_history(ticker, "1mo"),
+        "6mo": get_financial_agent().get_price_history(ticker, "6mo"),
+        "1y": get_financial_agent().get_price_history(ticker, "1y")
     }
-    price_history = clean_nan(price_history)
 
-    return jsonify({
+    return json_response({
         "ticker": ticker,
         "data": financial_data,
         "price_history": price_history
@@ -125,27 +454,28 @@ def analyze_10k():
     if not ticker:
         return jsonify({"error": "No ticker provided"}), 400
 
-    sections_data = sec_parser.get_10k_sections(ticker, section)
+    sections_data = get_sec_parser().get_10k_sections(ticker, section)
 
     if "error" in sections_data:
         return jsonify({"error": sections_data["error"]}), 404
 
-    result = llm_synthesis.synthesize(sections_data)
+    result = get_llm_synthesis().synthesize(sections_data)
 
     try:
-        graph_agent.add_10k_syntheses(ticker, result.get('syntheses', {}))
+        get_graph_agent().add_10k_syntheses(ticker, result.get('syntheses', {}))
+        qa_cache.clear()
         print(f"✓ Synthèses 10-K ajoutées au graph pour {ticker}")
     except Exception as e:
         print(f"⚠ Erreur ajout synthèses au graph: {e}")
 
     try:
-        vector_agent.add_10k_sections(ticker, sections_data)
+        get_vector_agent().add_10k_sections(ticker, sections_data)
+        qa_cache.clear()
         print(f"✓ 10-K de {ticker} ajouté au vector store")
     except Exception as e:
         print(f"⚠ Erreur ajout vector store: {e}")
 
-    result = clean_nan(result)
-    return jsonify(result)
+    return json_response(result)
 
 
 @app.route('/api/10k/raw', methods=['POST'])
@@ -158,9 +488,8 @@ def get_raw_10k():
     if not ticker:
         return jsonify({"error": "No ticker provided"}), 400
 
-    sections_data = sec_parser.get_10k_sections(ticker, section)
-    sections_data = clean_nan(sections_data)
-    return jsonify(sections_data)
+    sections_data = get_sec_parser().get_10k_sections(ticker, section)
+    return json_response(sections_data)
 
 
 @app.route('/api/search', methods=['POST'])
@@ -175,13 +504,12 @@ def semantic_search():
         return jsonify({"error": "No query provided"}), 400
 
     try:
-        results = vector_agent.search(
+        results = get_vector_agent().search(
             query=query,
             n_results=n_results,
             ticker_filter=ticker_filter
         )
-        results = clean_nan(results)
-        return jsonify({"query": query, "results": results})
+        return json_response({"query": query, "results": results})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -190,7 +518,7 @@ def semantic_search():
 def get_vector_store_stats():
     """Statistiques du vector store."""
     try:
-        stats = vector_agent.get_stats()
+        stats = get_vector_agent().get_stats()
         return jsonify(stats)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -200,9 +528,8 @@ def get_vector_store_stats():
 def get_companies():
     """Liste toutes les entreprises du graph."""
     try:
-        companies = graph_agent.get_all_companies()
-        companies = clean_nan(companies)
-        return jsonify({"companies": companies})
+        companies = get_graph_agent().get_all_companies()
+        return json_response({"companies": companies})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -211,9 +538,8 @@ def get_companies():
 def get_sector_companies(sector_name):
     """Récupère les entreprises d'un secteur."""
     try:
-        companies = graph_agent.get_companies_by_sector(sector_name)
-        companies = clean_nan(companies)
-        return jsonify({"sector": sector_name, "companies": companies})
+        companies = get_graph_agent().get_companies_by_sector(sector_name)
+        return json_response({"sector": sector_name, "companies": companies})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -252,16 +578,79 @@ def graphrag_qa():
         return jsonify({"error": "No question provided"}), 400
 
     try:
-        result = graphrag_agent.answer(
+        params = {"n_results": n_results, "include_graph": include_graph}
+        question_vector = get_vector_agent().embed(question)
+
+        cached = qa_cache.get(question_vector, params)
+        if cached is not None:
+            return json_response({**cached, "cached": True})
+
+        result = get_graphrag_agent().answer(
             question=question,
             n_vector_results=n_results,
             include_graph=include_graph
         )
-        result = clean_nan(result)
-        return jsonify(result)
+
+        # Ne pas figer une erreur LLM transitoire dans le cache
+        if not result.get("answer", "").startswith("Error generating answer"):
+            qa_cache.add(question_vector, params, result)
+
+        return json_response(result)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/qa/stream', methods=['POST'])
+def graphrag_qa_stream():
+    """
+    GraphRAG Question-Answering en streaming (NDJSON, un événement par ligne):
+    les sources d'abord, puis les tokens de la réponse au fil de la génération.
+
+    Body: identique à /api/qa
+
+    Returns (lignes):
+        {"type": "sources", "question": "...", "citations": [...], "graph_paths": [...], ...}
+        {"type": "token", "text": "..."}
+        {"type": "done", "answer": "..."}
+    """
+    data = request.json
+    question = data.get('question', '')
+    n_results = data.get('n_results', 5)
+    include_graph = data.get('include_graph', True)
+
+    if not question:
+        return jsonify({"error": "No question provided"}), 400
+
+    try:
+        agent = get_graphrag_agent()
+        params = {"n_results": n_results, "include_graph": include_graph}
+        question_vector = get_vector_agent().embed(question)
+        cached = qa_cache.get(question_vector, params)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+    def generate():
+        if cached is not None:
+            sources = {key: value for key, value in cached.items() if key != "answer"}
+            yield to_json({"type": "sources", **sources, "cached": True}) + b"\n"
+            yield to_json({"type": "token", "text": cached["answer"]}) + b"\n"
+            yield to_json({"type": "done", "answer": cached["answer"]}) + b"\n"
+            return
+
+        result = {}
+        for event in agent.answer_stream(
+            question=question,
+            n_vector_results=n_results,
+            include_graph=include_graph
+        ):
+            if event["type"] == "sources":
+                result = {key: value for key, value in event.items() if key != "type"}
+            elif event["type"] == "done":
+                qa_cache.add(question_vector, params, {**result, "answer": event["answer"]})
+            yield to_json(event) + b"\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 
 @app.route('/api/ingest', methods=['POST'])
 def ingest_sources():
@@ -271,7 +660,8 @@ def ingest_sources():
     Body:
         {
             "path": "/path/to/documents",
-            "extract_entities": true
+            "extract_entities": true,
+            "async": false
         }
 
     Returns:
@@ -281,6 +671,7 @@ def ingest_sources():
             "documents_added": 10,
             "entities_extracted": 50
         }
+        Avec "async": true, retourne 202 + job_id (voir /api/jobs/<job_id>)
     """
     data = request.json
     path = data.get('path', '')
@@ -289,56 +680,52 @@ def ingest_sources():
     if not path:
         return jsonify({"error": "No path provided"}), 400
 
-    if not os.path.exists(path):
+    if not path_exists(path):
         return jsonify({"error": f"Path not found: {path}"}), 404
 
-    try:
-        # Découvrir et ingérer les sources
-        sources = source_agent.discover_sources(path)
-
-        if isinstance(sources, dict) and "error" in sources:
-            return jsonify(sources), 404
-
-        ingested = []
-        for source in sources:
-            content = source_agent.ingest_source(source)
-            if "error" not in content:
-                content["source_info"] = source
-                ingested.append(content)
-
-                # Ajouter au vector store
-                text = content.get("text_content", "")
-                if text and len(text) > 50:
-                    vector_agent.add_document(
-                        ticker=source.get("name", "doc"),
-                        text=text[:10000],  # Limiter la taille
-                        metadata={
-                            "section": source.get("type", "document"),
-                            "source": "ingested",
-                            "path": source.get("path", "")
-                        }
-                    )
-
-        # Extraction d'entités optionnelle
-        entities_count = 0
-        if extract_entities and ingested:
-            extractions = entity_agent.batch_extract(ingested)
-            graphrag_agent.add_entities_to_graph(extractions)
-            entities_count = sum(
-                len(e.get("entities", [])) for e in extractions
-            )
-
-        return jsonify({
-            "sources_found": len(sources),
-            "sources_ingested": len(ingested),
-            "entities_extracted": entities_count,
-            "sources": [s.get("name") for s in sources]
-        })
+    if data.get('async', False):
+        return submit_job(run_ingest, path, extract_entities)
 
+    try:
+        return json_response(*run_ingest(path, extract_entities))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+def run_ingest(path: str, extract_entities: bool) -> tuple:
+    """Corps de /api/ingest. Retourne (payload, status HTTP)."""
+    source_agent = get_source_agent()
+    vector_agent = get_vector_agent()
+
+    # Découvrir et ingérer les sources
+    sources = source_agent.discover_sources(path)
+
+    if isinstance(sources, dict) and "error" in sources:
+        return sources, 404
+
+    ingested = ingest_all_sources(sources)
+
+    # Ajouter au vector store
+    vector_agent.add_documents(vector_documents(ingested, "ingested"))
+
+    # Extraction d'entités optionnelle
+    entities_count = 0
+    if extract_entities and ingested:
+        extractions = get_entity_agent().batch_extract(ingested)
+        get_graphrag_agent().add_entities_to_graph(dedupe_extractions(extractions))
+        for extraction in extractions:
+            entities_count += len(extraction["entities"])
+
+    qa_cache.clear()
+
+    return {
+        "sources_found": len(sources),
+        "sources_ingested": len(ingested),
+        "entities_extracted": entities_count,
+        "sources": [s.get("name") for s in sources]
+    }, 200
+
+
 @app.route('/api/extract-entities', methods=['POST'])
 def extract_entities():
     """
@@ -364,10 +751,11 @@ def extract_entities():
         return jsonify({"error": "No text provided"}), 400
 
     try:
-        result = entity_agent.extract_all(text, "api_request")
+        result = get_entity_agent().extract_all(text, "api_request")
 
         if add_to_graph:
-            graphrag_agent.add_entities_to_graph([result])
+            get_graphrag_agent().add_entities_to_graph([result])
+            qa_cache.clear()
 
         return jsonify(result)
     except Exception as e:
@@ -382,11 +770,13 @@ def full_pipeline():
     Body:
         {
             "path": "/path/to/documents",
-            "use_case": "Analyze company financials"
+            "use_case": "Analyze company financials",
+            "async": false
         }
 
     Returns:
         Stats complètes du pipeline
+        Avec "async": true, retourne 202 + job_id (voir /api/jobs/<job_id>)
     """
     data = request.json
     path = data.get('path', '')
@@ -395,114 +785,154 @@ def full_pipeline():
     if not path:
         return jsonify({"error": "No path provided"}), 400
 
-    if not os.path.exists(path):
+    if not path_exists(path):
         return jsonify({"error": f"Path not found: {path}"}), 404
 
-    try:
-        print(f"\n{'='*50}")
-        print(f"🚀 Pipeline GraphRAG: {use_case}")
-        print(f"📁 Source: {path}")
-        print(f"{'='*50}")
-
-        # Étape 1: Découvrir les sources
-        print("\n📋 Étape 1: Découverte des sources...")
-        sources = source_agent.discover_sources(path)
-
-        if isinstance(sources, dict) and "error" in sources:
-            return jsonify(sources), 404
-
-        print(f"   ✓ {len(sources)} sources trouvées")
-
-        # Étape 2: Ingérer et normaliser
-        print("\n📥 Étape 2: Ingestion et normalisation...")
-        ingested = []
-        for source in sources:
-            content = source_agent.ingest_source(source)
-            if "error" not in content:
-                content["source_info"] = source
-                ingested.append(content)
-
-        print(f"   ✓ {len(ingested)} sources ingérées")
-
-        # Étape 3: Extraire entités et relations
-        print("\n🔍 Étape 3: Extraction d'entités...")
-        extractions = entity_agent.batch_extract(ingested)
-        total_entities = sum(len(e.get("entities", [])) for e in extractions)
-        total_relations = sum(len(e.get("relations", [])) for e in extractions)
-        print(f"   ✓ {total_entities} entités, {total_relations} relations")
-
-        # Étape 4: Construire le Knowledge Graph
-        print("\n🔗 Étape 4: Construction du Knowledge Graph...")
-        graph_stats = graphrag_agent.add_entities_to_graph(extractions)
-
-        # Étape 5: Créer le Vector Store
-        print("\n📊 Étape 5: Indexation vectorielle...")
-        docs_added = 0
-        for content in ingested:
-            text = content.get("text_content", "")
-            source_info = content.get("source_info", {})
-
-            if text and len(text) > 50:
-                vector_agent.add_document(
-                    ticker=source_info.get("name", "doc"),
-                    text=text[:10000],
-                    metadata={
-                        "section": source_info.get("type", "document"),
-                        "source": "pipeline",
-                        "path": source_info.get("path", "")
-                    }
-                )
-                docs_added += 1
-
-        print(f"   ✓ {docs_added} documents indexés")
-
-        print(f"\n{'='*50}")
-        print("✅ Pipeline terminé! Prêt pour GraphRAG QA")
-        print(f"{'='*50}\n")
-
-        return jsonify({
-            "status": "success",
-            "use_case": use_case,
-            "pipeline_stats": {
-                "sources_discovered": len(sources),
-                "sources_ingested": len(ingested),
-                "entities_extracted": total_entities,
-                "relations_extracted": total_relations,
-                "graph_entities_added": graph_stats.get("entities_added", 0),
-                "graph_relations_added": graph_stats.get("relations_added", 0),
-                "documents_indexed": docs_added
-            },
-            "ready_for_qa": True
-        })
+    if data.get('async', False):
+        return submit_job(run_pipeline, path, use_case)
 
+    try:
+        return json_response(*run_pipeline(path, use_case))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+def run_pipeline(path: str, use_case: str, source_label: str = "pipeline") -> tuple:
+    """
+    Corps du pipeline GraphRAG (partagé par /api/pipeline et /api/upload).
+
+    Returns:
+        (payload, status HTTP)
+    """
+    source_agent = get_source_agent()
+    vector_agent = get_vector_agent()
+
+    print(f"\n{'='*50}")
+    print(f"🚀 Pipeline GraphRAG: {use_case}")
+    print(f"📁 Source: {path}")
+    print(f"{'='*50}")
+
+    # Étape 1: Découvrir les sources
+    print("\n📋 Étape 1: Découverte des sources...")
+    sources = source_agent.discover_sources(path)
+
+    if isinstance(sources, dict) and "error" in sources:
+        return sources, 404
+
+    print(f"   ✓ {len(sources)} sources trouvées")
+
+    # Étape 2: Ingérer et normaliser
+    print("\n📥 Étape 2: Ingestion et normalisation...")
+    ingested = ingest_all_sources(sources)
+
+    print(f"   ✓ {len(ingested)} sources ingérées")
+
+    # Étape 3: Extraire entités et relations
+    print("\n🔍 Étape 3: Extraction d'entités...")
+    extractions = get_entity_agent().batch_extract(ingested)
+    total_entities = total_relations = 0
+    for extraction in extractions:
+        total_entities += len(extraction["entities"])
+        total_relations += len(extraction["relations"])
+    print(f"   ✓ {total_entities} entités, {total_relations} relations")
+
+    # Étape 4: Construire le Knowledge Graph
+    print("\n🔗 Étape 4: Construction du Knowledge Graph...")
+    graph_stats = get_graphrag_agent().add_entities_to_graph(dedupe_extractions(extractions))
+
+    # Étape 5: Créer le Vector Store
+    print("\n📊 Étape 5: Indexation vectorielle...")
+    documents = vector_documents(ingested, source_label)
+    vector_agent.add_documents(documents)
+    docs_added = len(documents)
+    qa_cache.clear()
+
+    print(f"   ✓ {docs_added} documents indexés")
+
+    print(f"\n{'='*50}")
+    print("✅ Pipeline terminé! Prêt pour GraphRAG QA")
+    print(f"{'='*50}\n")
+
+    return {
+        "status": "success",
+        "use_case": use_case,
+        "pipeline_stats": {
+            "sources_discovered": len(sources),
+            "sources_ingested": len(ingested),
+            "entities_extracted": total_entities,
+            "relations_extracted": total_relations,
+            "graph_entities_added": graph_stats.get("entities_added", 0),
+            "graph_relations_added": graph_stats.get("relations_added", 0),
+            "documents_indexed": docs_added
+        },
+        "ready_for_qa": True
+    }, 200
+
+
+# Les stats du graphe sont servies depuis un cache (TTL 60s par défaut)
+GRAPH_STATS_TTL = float(os.getenv("GRAPH_STATS_TTL", "60"))
+_graph_stats_cache = {"value": None, "expires": 0.0}
+_graph_stats_lock = threading.Lock()
+
+
+def compute_graph_stats() -> dict:
+    """
+    Compte noeuds, relations et noeuds par label.
+    apoc.meta.stats() lit les compteurs internes de Neo4j (O(1)); sans APOC,
+    on retombe sur les requêtes de comptage classiques.
+    """
+    with get_graph_agent().driver.session() as session:
+        try:
+            record = session.run("""
+                CALL apoc.meta.stats() YIELD nodeCount, relCount, labels
+                RETURN nodeCount, relCount, labels
+            """).single()
+            types = sorted(
+                ({"type": label, "count": count} for label, count in record["labels"].items()),
+                key=lambda t: t["count"],
+                reverse=True
+            )
+            return {
+                "total_nodes": record["nodeCount"],
+                "total_relations": record["relCount"],
+                "node_types": types
+            }
+        except Exception:
+            pass  # APOC absent: comptage Cypher
+
+        # Compter les noeuds
+        nodes = session.run("MATCH (n) RETURN count(n) as count").single()["count"]
+
+        # Compter les relations
+        rels = session.run("MATCH ()-[r]->() RETURN count(r) as count").single()["count"]
+
+        # Types de noeuds
+        node_types = session.run("""
+            MATCH (n) RETURN labels(n)[0] as type, count(*) as count
+            ORDER BY count DESC
+        """)
+
+        types = [{"type": r["type"], "count": r["count"]} for r in node_types]
+
+    return {
+        "total_nodes": nodes,
+        "total_relations": rels,
+        "node_types": types
+    }
+
+
 @app.route('/api/graph/stats', methods=['GET'])
 def get_graph_stats():
     """Statistiques du Knowledge Graph."""
     try:
-        with graph_agent.driver.session() as session:
-            # Compter les noeuds
-            nodes = session.run("MATCH (n) RETURN count(n) as count").single()["count"]
-
-            # Compter les relations
-            rels = session.run("MATCH ()-[r]->() RETURN count(r) as count").single()["count"]
-
-            # Types de noeuds
-            node_types = session.run("""
-                MATCH (n) RETURN labels(n)[0] as type, count(*) as count
-                ORDER BY count DESC
-            """)
-
-            types = [{"type": r["type"], "count": r["count"]} for r in node_types]
-
-        return jsonify({
-            "total_nodes": nodes,
-            "total_relations": rels,
-            "node_types": types
-        })
+        with _graph_stats_lock:
+            now = time.monotonic()
+            if _graph_stats_cache["value"] is None or now >= _graph_stats_cache["expires"]:
+                _graph_stats_cache["value"] = compute_graph_stats()
+                _graph_stats_cache["expires"] = now + GRAPH_STATS_TTL
+            stats = _graph_stats_cache["value"]
+
+        return jsonify(stats)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -519,7 +949,7 @@ def health_check():
 
     # Check Vector Store
     try:
-        stats = vector_agent.get_stats()
+        stats = get_vector_agent().get_stats()
         status["vector_store"] = True
         status["vector_store_docs"] = stats.get("total_documents", 0)
     except Exception:
@@ -527,7 +957,7 @@ def health_check():
 
     # Check Graph DB
     try:
-        with graph_agent.driver.session() as session:
+        with get_graph_agent().driver.session() as session:
             session.run("RETURN 1")
         status["graph_db"] = True
     except Exception:
@@ -535,12 +965,19 @@ def health_check():
 
     # Check LLM
     try:
-        import ollama
-        ollama.generate(model="llama3.2", prompt="test", options={"num_predict": 1})
+        # show() vérifie que le modèle existe sans le charger en mémoire
+        get_entity_agent().client.show("llama3.2")
         status["llm"] = True
     except Exception:
         pass
 
+    # Caches LLM (extractions) et QA sémantique
+    try:
+        status["llm_cache"] = dict(get_entity_agent().cache_stats)
+    except Exception:
+        pass  # Agent d'extraction indisponible (ex: Ollama arrêté)
+    status["qa_cache"] = dict(qa_cache.stats)
+
     all_ok = all([status["api"], status["vector_store"], status["graph_db"], status["llm"]])
 
     return jsonify({
@@ -555,9 +992,10 @@ def health_check():
 
 UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), '..', 'uploads')
 ALLOWED_EXTENSIONS = {'pdf', 'csv', 'md', 'markdown', 'html', 'htm', 'txt', 'json'}
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 
-# Créer le dossier uploads s'il n'existe pas
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# Taille max d'une requête d'upload (413 au-delà), 200 Mo par défaut
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv("MAX_UPLOAD_MB", "200")) * 1024 * 1024
 
 
 def allowed_file(filename):
@@ -580,17 +1018,18 @@ def upload_files():
         return jsonify({"error": "No files selected"}), 400
 
     # Créer un sous-dossier unique pour cet upload
-    import uuid
     upload_id = str(uuid.uuid4())[:8]
     upload_path = os.path.join(UPLOAD_FOLDER, upload_id)
-    os.makedirs(upload_path, exist_ok=True)
+    os.makedirs(upload_path, exist_ok=True)  # Crée aussi UPLOAD_FOLDER au besoin
 
     saved_files = []
     for file in files:
         if file and file.filename and allowed_file(file.filename):
             filename = secure_filename(file.filename)
             filepath = os.path.join(upload_path, filename)
-            file.save(filepath)
+            # Copie par blocs de 1 Mo: mémoire bornée même pour de gros PDF
+            with open(filepath, 'wb') as dst:
+                shutil.copyfileobj(file.stream, dst, UPLOAD_CHUNK_SIZE)
             saved_files.append(filename)
 
     if not saved_files:
@@ -598,72 +1037,30 @@ def upload_files():
         return jsonify({"error": "No valid files uploaded"}), 400
 
     # Lancer le pipeline sur les fichiers uploadés
-    try:
-        print(f"\n{'='*50}")
-        print(f"📤 Upload Pipeline: {use_case}")
-        print(f"📁 {len(saved_files)} fichiers uploadés")
-        print(f"{'='*50}")
-
-        # Découvrir les sources
-        sources = source_agent.discover_sources(upload_path)
-        if isinstance(sources, dict) and "error" in sources:
-            return jsonify(sources), 404
-
-        # Ingérer
-        ingested = []
-        for source in sources:
-            content = source_agent.ingest_source(source)
-            if "error" not in content:
-                content["source_info"] = source
-                ingested.append(content)
-
-        # Extraire entités
-        extractions = entity_agent.batch_extract(ingested)
-        total_entities = sum(len(e.get("entities", [])) for e in extractions)
-        total_relations = sum(len(e.get("relations", [])) for e in extractions)
-
-        # Ajouter au graphe
-        graph_stats = graphrag_agent.add_entities_to_graph(extractions)
-
-        # Indexer
-        docs_added = 0
-        for content in ingested:
-            text = content.get("text_content", "")
-            source_info = content.get("source_info", {})
-            if text and len(text) > 50:
-                vector_agent.add_document(
-                    ticker=source_info.get("name", "doc"),
-                    text=text[:10000],
-                    metadata={
-                        "section": source_info.get("type", "document"),
-                        "source": "upload",
-                        "path": source_info.get("path", "")
-                    }
-                )
-                docs_added += 1
-
-        print(f"✅ Pipeline terminé!")
-
-        return jsonify({
-            "status": "success",
-            "upload_id": upload_id,
-            "files_uploaded": saved_files,
-            "pipeline_stats": {
-                "sources_discovered": len(sources),
-                "sources_ingested": len(ingested),
-                "entities_extracted": total_entities,
-                "relations_extracted": total_relations,
-                "graph_entities_added": graph_stats.get("entities_added", 0),
-                "graph_relations_added": graph_stats.get("relations_added", 0),
-                "documents_indexed": docs_added
-            },
-            "ready_for_qa": True
-        })
+    if request.form.get('async', 'false').lower() == 'true':
+        return submit_job(run_upload_pipeline, upload_path, upload_id, saved_files, use_case)
 
+    try:
+        return json_response(*run_upload_pipeline(upload_path, upload_id, saved_files, use_case))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+def run_upload_pipeline(upload_path: str, upload_id: str, saved_files: list, use_case: str) -> tuple:
+    """Pipeline GraphRAG sur un dossier d'upload. Retourne (payload, status HTTP)."""
+    print(f"\n{'='*50}")
+    print(f"📤 Upload Pipeline: {use_case}")
+    print(f"📁 {len(saved_files)} fichiers uploadés")
+    print(f"{'='*50}")
+
+    payload, status = run_pipeline(upload_path, use_case, source_label="upload")
+    if status == 200:
+        payload["upload_id"] = upload_id
+        payload["files_uploaded"] = saved_files
+
+    return payload, status
+
+
 # ============================================
 # VISUALISATION DU GRAPHE
 # ============================================
@@ -673,21 +1070,30 @@ def visualize_graph():
     """
     Retourne les données du graphe pour visualisation.
     Format compatible avec les librairies de visualisation (vis.js, d3, etc.)
+    La réponse est streamée record par record depuis Neo4j (mémoire O(1)).
     """
     limit = request.args.get('limit', 100, type=int)
 
     try:
-        with graph_agent.driver.session() as session:
-            # Récupérer les noeuds
-            nodes_result = session.run("""
-                MATCH (n)
-                RETURN id(n) as id, labels(n)[0] as label,
-                       coalesce(n.name, n.ticker, 'Unknown') as name,
-                       properties(n) as properties
-                LIMIT $limit
-            """, limit=limit)
+        session = get_graph_agent().driver.session()
+        # Exécutée avant le début du stream: une erreur Neo4j donne encore un 500
+        nodes_result = session.run("""
+            MATCH (n)
+            RETURN id(n) as id, labels(n)[0] as label,
+                   coalesce(n.name, n.ticker, 'Unknown') as name,
+                   properties(n) as properties
+            LIMIT $limit
+        """, limit=limit)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-            nodes = []
+    def generate():
+        node_count = 0
+        edge_count = 0
+
+        try:
+            # Noeuds
+            yield b'{"nodes":['
             for record in nodes_result:
                 node = {
                     "id": record["id"],
@@ -695,16 +1101,17 @@ def visualize_graph():
                     "group": record["label"],
                     "properties": dict(record["properties"]) if record["properties"] else {}
                 }
-                nodes.append(node)
+                yield (b',' if node_count else b'') + to_json(node)
+                node_count += 1
 
-            # Récupérer les relations
+            # Relations
             edges_result = session.run("""
                 MATCH (a)-[r]->(b)
                 RETURN id(a) as source, id(b) as target, type(r) as label
                 LIMIT $limit
             """, limit=limit * 2)
 
-            edges = []
+            yield b'],"edges":['
             for record in edges_result:
                 edge = {
                     "from": record["source"],
@@ -712,19 +1119,17 @@ def visualize_graph():
                     "label": record["label"],
                     "arrows": "to"
                 }
-                edges.append(edge)
-
-        return jsonify({
-            "nodes": nodes,
-            "edges": edges,
-            "stats": {
-                "node_count": len(nodes),
-                "edge_count": len(edges)
-            }
-        })
+                yield (b',' if edge_count else b'') + to_json(edge)
+                edge_count += 1
 
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+            yield b'],"stats":' + to_json({
+                "node_count": node_count,
+                "edge_count": edge_count
+            }) + b'}'
+        finally:
+            session.close()
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
 
 
 if __name__ == '__main__':
@@ -740,6 +1145,10 @@ if __name__ == '__main__':
     print("   POST /api/search      - Recherche sémantique")
     print("   GET  /api/health      - Health check")
     print("   GET  /api/graph/stats - Stats du graphe")
+    print("   GET  /api/jobs/<id>   - Statut d'un job async")
     print("\n")
 
-    app.run(debug=True, port=5000)
+    # Serveur de développement (mono-processus). En production, utiliser
+    # gunicorn avec des workers gevent via app/wsgi.py (voir README).
+    debug = os.getenv("FLASK_DEBUG", "0") == "1"
+    app.run(debug=debug, port=int(os.getenv("PORT", "5000")))
@@ -5,16 +5,99 @@ Utilise Ollama LLM pour extraire entités et relations depuis le texte.
 """
 
 import ollama
+import hashlib
 import json
-import re
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from typing import Dict, List, Optional
 
 
+# ============================================
+# Templates de prompts (constantes, assemblées par concaténation)
+# ============================================
+
+_ENTITY_CATEGORIES = """- PERSON: Names of people
+- ORGANIZATION: Companies, institutions, agencies
+- LOCATION: Cities, countries, addresses
+- DATE: Dates and time periods
+- MONEY: Monetary values
+- PRODUCT: Products, services, technologies
+- CONCEPT: Key concepts, topics, themes"""
+
+_RELATION_TYPES = """- WORKS_FOR: Person works for Organization
+- LOCATED_IN: Entity is located in Location
+- OWNS: Entity owns another entity
+- INVESTS_IN: Entity invests in another
+- COMPETES_WITH: Organizations compete
+- PARTNERS_WITH: Entities partner together
+- PRODUCES: Organization produces Product
+- RELATED_TO: General relationship"""
+
+_ENTITIES_SCHEMA = """    "entities": [
+        {"name": "entity name", "type": "TYPE", "mentions": 1},
+        ...
+    ]"""
+
+_RELATIONS_SCHEMA = """    "relations": [
+        {"source": "Entity1", "relation": "RELATION_TYPE", "target": "Entity2"},
+        ...
+    ]"""
+
+_ENTITIES_PROMPT_PREFIX = (
+    "You are an entity extraction system. Extract all named entities from the following text.\n\n"
+    "Categories to extract:\n" + _ENTITY_CATEGORIES + "\n\nText:\n"
+)
+_ENTITIES_PROMPT_SUFFIX = (
+    "\n\nReturn a JSON object with this exact format (no other text):\n{\n"
+    + _ENTITIES_SCHEMA + "\n}\n\nOnly return valid JSON, no explanations."
+)
+
+_RELATIONS_PROMPT_PREFIX = (
+    "You are a relation extraction system. Extract relationships between entities in the text.\n"
+)
+_RELATIONS_PROMPT_SUFFIX = (
+    "\n\nCommon relation types:\n" + _RELATION_TYPES
+    + "\n\nReturn a JSON object with this exact format (no other text):\n{\n"
+    + _RELATIONS_SCHEMA + "\n}\n\nOnly return valid JSON, no explanations."
+)
+
+_ENTITIES_RELATIONS_PROMPT_PREFIX = (
+    "You are an information extraction system. Extract all named entities and the "
+    "relationships between them from the following text.\n\n"
+    "Entity categories:\n" + _ENTITY_CATEGORIES + "\n\n"
+    "Common relation types:\n" + _RELATION_TYPES + "\n\nText:\n"
+)
+_ENTITIES_RELATIONS_PROMPT_SUFFIX = (
+    "\n\nReturn a JSON object with this exact format (no other text):\n{\n"
+    + _ENTITIES_SCHEMA + ",\n" + _RELATIONS_SCHEMA
+    + "\n}\n\nOnly return valid JSON, no explanations."
+)
+
+
+
 class EntityExtractionAgent:
     """Agent pour extraire entités et relations avec LLM."""
 
-    def __init__(self, model: str = "llama3.2"):
+    def __init__(self, model: str = "llama3.2", cache_dir: str = "./.llm_cache"):
         self.model = model
+
+        # Client HTTP persistant (connexions keep-alive réutilisées)
+        self.client = ollama.Client()
+
+        # Cache disque des extractions (clé = SHA-256 du modèle + prompt)
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.cache_stats = {"hits": 0, "misses": 0}
+        self._stats_lock = threading.Lock()
+
+        # Nombre d'appels Ollama simultanés (aligné sur OLLAMA_NUM_PARALLEL)
+        self.max_workers = int(os.getenv("OLLAMA_NUM_PARALLEL", "4"))
+
+        # Fenêtres analysées au plus par texte (début du texte au-delà: ~120k caractères)
+        self.max_windows = int(os.getenv("EXTRACTION_MAX_WINDOWS", "20"))
+
         print(f"✓ Entity Extraction Agent initialisé (modèle: {model})")
 
     def extract_entities(self, text: str, context: str = "") -> Dict:
@@ -28,42 +111,11 @@ class EntityExtractionAgent:
         Returns:
             Dict avec les entités extraites par type
         """
-        # Limiter la taille du texte
-        if len(text) > 8000:
-            text = text[:8000] + "..."
-
-        prompt = f"""You are an entity extraction system. Extract all named entities from the following text.
-
-Categories to extract:
-- PERSON: Names of people
-- ORGANIZATION: Companies, institutions, agencies
-- LOCATION: Cities, countries, addresses
-- DATE: Dates and time periods
-- MONEY: Monetary values
-- PRODUCT: Products, services, technologies
-- CONCEPT: Key concepts, topics, themes
-
-Text:
-{text}
-
-Return a JSON object with this exact format (no other text):
-{{
-    "entities": [
-        {{"name": "entity name", "type": "TYPE", "mentions": 1}},
-        ...
-    ]
-}}
-
-Only return valid JSON, no explanations."""
-
         try:
-            response = ollama.generate(model=self.model, prompt=prompt)
-            result_text = response['response'].strip()
-
-            # Extraire le JSON de la réponse
-            entities = self._parse_json_response(result_text)
+            result = self._generate_chunked(self._entities_prompt, text)
+            entities = {"entities": result["entities"]}
 
-            print(f"  ✓ {len(entities.get('entities', []))} entités extraites")
+            print(f"  ✓ {len(entities['entities'])} entités extraites")
             return entities
 
         except Exception as e:
@@ -81,47 +133,18 @@ Only return valid JSON, no explanations."""
         Returns:
             Dict avec les relations extraites
         """
-        if len(text) > 8000:
-            text = text[:8000] + "..."
-
         entity_hint = ""
         if entities:
             entity_names = [e.get("name", "") for e in entities[:20]]  # Max 20
             entity_hint = f"\nKnown entities: {', '.join(entity_names)}"
 
-        prompt = f"""You are a relation extraction system. Extract relationships between entities in the text.
-{entity_hint}
-
-Text:
-{text}
-
-Common relation types:
-- WORKS_FOR: Person works for Organization
-- LOCATED_IN: Entity is located in Location
-- OWNS: Entity owns another entity
-- INVESTS_IN: Entity invests in another
-- COMPETES_WITH: Organizations compete
-- PARTNERS_WITH: Entities partner together
-- PRODUCES: Organization produces Product
-- RELATED_TO: General relationship
-
-Return a JSON object with this exact format (no other text):
-{{
-    "relations": [
-        {{"source": "Entity1", "relation": "RELATION_TYPE", "target": "Entity2"}},
-        ...
-    ]
-}}
-
-Only return valid JSON, no explanations."""
-
         try:
-            response = ollama.generate(model=self.model, prompt=prompt)
-            result_text = response['response'].strip()
-
-            relations = self._parse_json_response(result_text)
+            result = self._generate_chunked(
+                lambda chunk: self._relations_prompt(chunk, entity_hint), text
+            )
+            relations = {"relations": result["relations"]}
 
-            print(f"  ✓ {len(relations.get('relations', []))} relations extraites")
+            print(f"  ✓ {len(relations['relations'])} relations extraites")
             return relations
 
         except Exception as e:
@@ -141,13 +164,10 @@ Only return valid JSON, no explanations."""
         """
         print(f"\n🔍 Extraction depuis: {source_name}")
 
-        # Extraire les entités
-        entities_result = self.extract_entities(text)
-        entities = entities_result.get("entities", [])
-
-        # Extraire les relations
-        relations_result = self.extract_relations(text, entities)
-        relations = relations_result.get("relations", [])
+        # Entités et relations en un seul appel LLM
+        result = self.extract_entities_and_relations(text)
+        entities = result.get("entities", [])
+        relations = result.get("relations", [])
 
         return {
             "source": source_name,
@@ -159,28 +179,182 @@ Only return valid JSON, no explanations."""
             }
         }
 
-    def _parse_json_response(self, text: str) -> Dict:
-        """Parse une réponse JSON potentiellement mal formée."""
-        # Essayer de parser directement
+    def extract_entities_and_relations(self, text: str) -> Dict:
+        """
+        Extrait entités et relations en une seule génération.
+        Remplace la paire extract_entities + extract_relations dans extract_all:
+        un seul prefill du texte au lieu de deux.
+
+        Args:
+            text: Le texte à analyser
+
+        Returns:
+            Dict avec 'entities' et 'relations'
+        """
         try:
-            return json.loads(text)
-        except json.JSONDecodeError:
-            pass
+            result = self._generate_chunked(self._entities_relations_prompt, text)
 
-        # Chercher un bloc JSON dans la réponse
-        json_match = re.search(r'\{[\s\S]*\}', text)
-        if json_match:
-            try:
-                return json.loads(json_match.group())
-            except json.JSONDecodeError:
-                pass
+            print(f"  ✓ {len(result['entities'])} entités, {len(result['relations'])} relations extraites")
+            return result
+
+        except Exception as e:
+            print(f"  ✗ Erreur extraction: {e}")
+            return {"entities": [], "relations": [], "error": str(e)}
+
+    # ============================================
+    # Prompts
+    # ============================================
+
+    def _entities_prompt(self, text: str) -> str:
+        """Prompt d'extraction d'entités."""
+        return _ENTITIES_PROMPT_PREFIX + text + _ENTITIES_PROMPT_SUFFIX
+
+    def _relations_prompt(self, text: str, entity_hint: str = "") -> str:
+        """Prompt d'extraction de relations."""
+        return _RELATIONS_PROMPT_PREFIX + entity_hint + "\n\nText:\n" + text + _RELATIONS_PROMPT_SUFFIX
+
+    def _entities_relations_prompt(self, text: str) -> str:
+        """Prompt combiné entités + relations."""
+        return _ENTITIES_RELATIONS_PROMPT_PREFIX + text + _ENTITIES_RELATIONS_PROMPT_SUFFIX
+
+    # ============================================
+    # Découpage des textes longs
+    # ============================================
+
+    def _chunk(self, text: str, size: int = 6000, overlap: int = 400):
+        """
+        Découpe un texte en fenêtres glissantes (max_windows au plus).
+        Un texte court est renvoyé tel quel, sans copie.
+        """
+        if len(text) <= size:
+            yield text
+            return
+
+        step = size - overlap
+        for k, start in enumerate(range(0, len(text), step)):
+            if k == self.max_windows:
+                print(f"⚠️ Texte tronqué à {self.max_windows} fenêtres ({start}/{len(text)} caractères analysés)")
+                break
+            yield text[start:start + size]
+            if start + size >= len(text):
+                break
+
+    def _generate_chunked(self, build_prompt, text: str) -> Dict:
+        """
+        Un appel LLM par fenêtre du texte, en parallèle (max_workers appels
+        Ollama simultanés), puis fusion des résultats.
+        """
+        prompts = [build_prompt(chunk) for chunk in self._chunk(text)]
+        if len(prompts) == 1:
+            return self._merge_results([self._generate_json(prompts[0])])
 
-        # Fallback: structure vide
-        return {"entities": [], "relations": []}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(prompts))) as executor:
+            return self._merge_results(list(executor.map(self._generate_json, prompts)))
+
+    def _merge_results(self, results: List[Dict]) -> Dict:
+        """
+        Fusionne les extractions de plusieurs fenêtres.
+        Entités dédoublonnées par (nom, type) avec cumul des mentions,
+        relations dédoublonnées par (source, relation, cible).
+        Éléments mal formés de la réponse du LLM (null, chaînes...) ignorés.
+        """
+        entities = {}
+        relations = {}
+
+        for result in results:
+            if not isinstance(result, dict):
+                continue
+
+            for entity in result.get("entities") or []:
+                if not isinstance(entity, dict):
+                    continue
+                key = (str(entity.get("name", "")).strip().lower(), entity.get("type"))
+                mentions = entity.get("mentions", 1)
+                if not isinstance(mentions, int):
+                    mentions = 1
+
+                if key in entities:
+                    entities[key]["mentions"] += mentions
+                else:
+                    entities[key] = {**entity, "mentions": mentions}
+
+            for rel in result.get("relations") or []:
+                if not isinstance(rel, dict):
+                    continue
+                key = (
+                    str(rel.get("source", "")).strip().lower(),
+                    rel.get("relation"),
+                    str(rel.get("target", "")).strip().lower()
+                )
+                relations.setdefault(key, rel)
+
+        return {
+            "entities": list(entities.values()),
+            "relations": list(relations.values())
+        }
+
+    # ============================================
+    # Appels LLM
+    # ============================================
+
+    def _generate_json(self, prompt: str) -> Dict:
+        """
+        Appelle le LLM et parse sa réponse JSON, avec cache disque.
+        Un prompt identique (même modèle, même texte) ne repasse pas par Ollama.
+        """
+        key = hashlib.sha256(f"{self.model}\0{prompt}".encode("utf-8")).hexdigest()
+        cache_file = self.cache_dir / f"{key}.json"
+
+        if cache_file.exists():
+            try:
+                with open(cache_file, 'r', encoding='utf-8') as f:
+                    cached = json.load(f)
+                with self._stats_lock:
+                    self.cache_stats["hits"] += 1
+                return cached
+            except (OSError, json.JSONDecodeError):
+                pass  # Entrée corrompue: on régénère
+
+        with self._stats_lock:
+            self.cache_stats["misses"] += 1
+        # format="json" contraint la sortie à du JSON valide,
+        # temperature=0 rend la réponse déterministe (donc cachable)
+        response = self.client.generate(
+            model=self.model,
+            prompt=prompt,
+            format="json",
+            options={"temperature": 0}
+        )
+        result = self._parse_json_response(response['response'].strip())
+
+        # Réponse illisible: structure vide, non mise en cache (un nouvel
+        # essai, ex: après correction du modèle ou du prompt, repasse par Ollama)
+        if result is None:
+            return {"entities": [], "relations": []}
+
+        # Écriture atomique pour ne jamais laisser un fichier partiel
+        tmp_file = cache_file.with_suffix(f".{threading.get_ident()}.tmp")
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        os.replace(tmp_file, cache_file)
+
+        return result
+
+    def _parse_json_response(self, text: str) -> Optional[Dict]:
+        """
+        Parse la réponse JSON (garantie valide par format="json").
+        None si elle est illisible ou n'est pas un objet (ex: génération interrompue).
+        """
+        try:
+            result = json.loads(text)
+        except json.JSONDecodeError:
+            return None
+        return result if isinstance(result, dict) else None
 
     def batch_extract(self, documents: List[Dict]) -> List[Dict]:
         """
         Extraction en batch sur plusieurs documents.
+        Les documents sont traités en parallèle (appels Ollama I/O-bound).
 
         Args:
             documents: Liste de dicts avec 'text_content' et 'name'
@@ -188,18 +362,24 @@ Only return valid JSON, no explanations."""
         Returns:
             Liste des résultats d'extraction
         """
-        results = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # map() conserve l'ordre des documents
+            results = [
+                r for r in executor.map(self._extract_one, documents)
+                if r is not None
+            ]
 
-        for doc in documents:
-            text = doc.get("text_content", "")
-            name = doc.get("source_info", {}).get("name", "document")
+        print(f"\n✓ Extraction terminée pour {len(results)} documents")
+        return results
 
-            if not text or len(text) < 50:
-                continue
+    def _extract_one(self, doc: Dict) -> Optional[Dict]:
+        """Extraction pour un document de batch_extract (None si trop court)."""
+        text = doc.get("text_content", "")
+        name = doc.get("source_info", {}).get("name", "document")
 
-            result = self.extract_all(text, name)
-            result["document"] = doc.get("source_info", {})
-            results.append(result)
+        if not text or len(text) < 50:
+            return None
 
-        print(f"\n✓ Extraction terminée pour {len(results)} documents")
-        return results
+        result = self.extract_all(text, name)
+        result["document"] = doc.get("source_info", {})
+        return result
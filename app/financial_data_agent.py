@@ -1,124 +1,179 @@
+import logging
+import numpy as np
 import yfinance as yf
-from datetime import datetime
-from typing import Dict
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import Dict, List
+
+
+logger = logging.getLogger(__name__)
+
+# Correspondance clé de sortie -> clé de yfinance Ticker.info
+_FIELD_MAP = (
+    ("name", "longName"),
+    ("sector", "sector"),
+    ("industry", "industry"),
+    ("country", "country"),
+    ("website", "website"),
+    ("description", "longBusinessSummary"),
+    ("employees", "fullTimeEmployees"),
+
+    # Prix et valorisation
+    ("current_price", "currentPrice"),
+    ("market_cap", "marketCap"),
+    ("enterprise_value", "enterpriseValue"),
+    ("52week_high", "fiftyTwoWeekHigh"),
+    ("52week_low", "fiftyTwoWeekLow"),
+    ("52week_change", "52WeekChange"),
+
+    # Revenus et profits
+    ("revenue", "totalRevenue"),
+    ("revenue_growth", "revenueGrowth"),
+    ("revenue_per_share", "revenuePerShare"),
+    ("gross_profit", "grossProfits"),
+    ("ebitda", "ebitda"),
+    ("net_income", "netIncomeToCommon"),
+    ("earnings_growth", "earningsGrowth"),
+
+    # Marges
+    ("profit_margin", "profitMargins"),
+    ("operating_margin", "operatingMargins"),
+    ("gross_margin", "grossMargins"),
+    ("ebitda_margin", "ebitdaMargins"),
+
+    # Ratios de valorisation
+    ("pe_ratio", "trailingPE"),
+    ("forward_pe", "forwardPE"),
+    ("peg_ratio", "pegRatio"),
+    ("price_to_book", "priceToBook"),
+    ("price_to_sales", "priceToSalesTrailing12Months"),
+    ("ev_to_revenue", "enterpriseToRevenue"),
+    ("ev_to_ebitda", "enterpriseToEbitda"),
+
+    # Dette et liquidité
+    ("total_debt", "totalDebt"),
+    ("total_cash", "totalCash"),
+    ("debt_to_equity", "debtToEquity"),
+    ("current_ratio", "currentRatio"),
+    ("quick_ratio", "quickRatio"),
+
+    # Rentabilité
+    ("roe", "returnOnEquity"),
+    ("roa", "returnOnAssets"),
+    ("roic", "returnOnCapital"),
+
+    # Dividendes
+    ("dividend_rate", "dividendRate"),
+    ("dividend_yield", "dividendYield"),
+    ("payout_ratio", "payoutRatio"),
+
+    # Cash flow
+    ("free_cash_flow", "freeCashflow"),
+    ("operating_cash_flow", "operatingCashflow"),
+
+    # Volume et beta
+    ("volume", "volume"),
+    ("avg_volume", "averageVolume"),
+    ("beta", "beta"),
+
+    # Recommandations analystes
+    ("target_price", "targetMeanPrice"),
+    ("recommendation", "recommendationKey"),
+    ("number_of_analysts", "numberOfAnalystOpinions"),
+)
 
 
 class FinancialDataAgent:
-    def __init__(self):
-        """Agent pour récupérer les données financières via yfinance."""
-        pass
+    def __init__(self, cache_ttl: float = 3600, cache_size: int = 1024):
+        """
+        Agent pour récupérer les données financières via yfinance.
+        
+        Args:
+            cache_ttl: Durée de validité (s) des réponses Yahoo en cache
+            cache_size: Nombre max d'entrées en cache (LRU)
+        """
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # clé -> (expiration, données)
+        self._cache_lock = threading.Lock()
+    
+    def _cache_get(self, key):
+        """Entrée du cache si encore valide, sinon None."""
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return dict(entry[1])
+    
+    def _cache_set(self, key, value: Dict):
+        """Ajoute une réponse au cache (éviction LRU)."""
+        with self._cache_lock:
+            self._cache[key] = (time.monotonic() + self.cache_ttl, dict(value))
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
     
-    def get_company_data(self, ticker: str) -> Dict:
+    def get_company_data(self, ticker: str, quiet: bool = False) -> Dict:
         """
         Récupère les données financières complètes d'une entreprise.
         
         Args:
             ticker: Le ticker de l'entreprise (ex: META, AAPL)
+            quiet: Pas d'affichage (appels en batch)
         
         Returns:
             Dict avec les données structurées
         """
-        print(f"\n📊 Récupération des données pour {ticker}...")
+        if not quiet:
+            logger.debug("📊 Récupération des données pour %s...", ticker)
+        
+        cached = self._cache_get(("info", ticker))
+        if cached is not None:
+            return cached
         
         try:
             stock = yf.Ticker(ticker)
             info = stock.info
             
-            data = {
-                "ticker": ticker,
-                "name": info.get("longName"),
-                "sector": info.get("sector"),
-                "industry": info.get("industry"),
-                "country": info.get("country"),
-                "website": info.get("website"),
-                "description": info.get("longBusinessSummary"),
-                "employees": info.get("fullTimeEmployees"),
-                
-                # Prix et valorisation
-                "current_price": info.get("currentPrice"),
-                "market_cap": info.get("marketCap"),
-                "enterprise_value": info.get("enterpriseValue"),
-                "52week_high": info.get("fiftyTwoWeekHigh"),
-                "52week_low": info.get("fiftyTwoWeekLow"),
-                "52week_change": info.get("52WeekChange"),
-                
-                # Revenus et profits
-                "revenue": info.get("totalRevenue"),
-                "revenue_growth": info.get("revenueGrowth"),
-                "revenue_per_share": info.get("revenuePerShare"),
-                "gross_profit": info.get("grossProfits"),
-                "ebitda": info.get("ebitda"),
-                "net_income": info.get("netIncomeToCommon"),
-                "earnings_growth": info.get("earningsGrowth"),
-                
-                # Marges
-                "profit_margin": info.get("profitMargins"),
-                "operating_margin": info.get("operatingMargins"),
-                "gross_margin": info.get("grossMargins"),
-                "ebitda_margin": info.get("ebitdaMargins"),
-                
-                # Ratios de valorisation
-                "pe_ratio": info.get("trailingPE"),
-                "forward_pe": info.get("forwardPE"),
-                "peg_ratio": info.get("pegRatio"),
-                "price_to_book": info.get("priceToBook"),
-                "price_to_sales": info.get("priceToSalesTrailing12Months"),
-                "ev_to_revenue": info.get("enterpriseToRevenue"),
-                "ev_to_ebitda": info.get("enterpriseToEbitda"),
-                
-                # Dette et liquidité
-                "total_debt": info.get("totalDebt"),
-                "total_cash": info.get("totalCash"),
-                "debt_to_equity": info.get("debtToEquity"),
-                "current_ratio": info.get("currentRatio"),
-                "quick_ratio": info.get("quickRatio"),
-                
-                # Rentabilité
-                "roe": info.get("returnOnEquity"),
-                "roa": info.get("returnOnAssets"),
-                "roic": info.get("returnOnCapital"),
-                
-                # Dividendes
-                "dividend_rate": info.get("dividendRate"),
-                "dividend_yield": info.get("dividendYield"),
-                "payout_ratio": info.get("payoutRatio"),
-                
-                # Cash flow
-                "free_cash_flow": info.get("freeCashflow"),
-                "operating_cash_flow": info.get("operatingCashflow"),
-                
-                # Volume et beta
-                "volume": info.get("volume"),
-                "avg_volume": info.get("averageVolume"),
-                "beta": info.get("beta"),
-                
-                # Recommandations analystes
-                "target_price": info.get("targetMeanPrice"),
-                "recommendation": info.get("recommendationKey"),
-                "number_of_analysts": info.get("numberOfAnalystOpinions"),
-                
-                "retrieved_at": datetime.now().isoformat()
-            }
+            data = {"ticker": ticker}
+            data.update({out: info.get(src) for out, src in _FIELD_MAP})
+            data["retrieved_at"] = datetime.now(timezone.utc)
+            self._cache_set(("info", ticker), data)
             
-            print(f"✓ Données récupérées pour {data['name']}")
+            if not quiet:
+                logger.debug("✓ Données récupérées pour %s", data['name'])
             return data
             
         except Exception as e:
-            print(f"✗ Erreur: {e}")
+            if not quiet:
+                logger.error("✗ Erreur: %s", e)
             return {"ticker": ticker, "error": str(e)}
     
-    def get_price_history(self, ticker: str, period: str = "1y") -> Dict:
+    def get_price_history(self, ticker: str, period: str = "1y", quiet: bool = False) -> Dict:
         """
         Récupère l'historique des prix.
         
         Args:
             ticker: Le ticker
             period: Période (1d, 5d, 1mo, 3mo, 6mo, 1y, 2y, 5y, max)
+            quiet: Pas d'affichage (appels en batch)
         
         Returns:
             Dict avec l'historique
         """
-        print(f"\n📈 Historique des prix {ticker} ({period})...")
+        if not quiet:
+            logger.debug("📈 Historique des prix %s (%s)...", ticker, period)
+        
+        cached = self._cache_get(("history", ticker, period))
+        if cached is not None:
+            return cached
         
         try:
             stock = yf.Ticker(ticker)
@@ -127,32 +182,158 @@ class FinancialDataAgent:
             if hist.empty:
                 return {"ticker": ticker, "error": "No data"}
             
-            # Statistiques sur la période
-            stats = {
-                "ticker": ticker,
-                "period": period,
-                "num_days": len(hist),
-                "start_date": hist.index[0].isoformat(),
-                "end_date": hist.index[-1].isoformat(),
-                "start_price": float(hist['Close'].iloc[0]),
-                "end_price": float(hist['Close'].iloc[-1]),
-                "min_price": float(hist['Close'].min()),
-                "max_price": float(hist['Close'].max()),
-                "avg_price": float(hist['Close'].mean()),
-                "total_return": ((hist['Close'].iloc[-1] / hist['Close'].iloc[0]) - 1) * 100,
-                "volatility": float(hist['Close'].pct_change().std() * 100),
-                "avg_volume": float(hist['Volume'].mean()),
-            }
+            stats = self._history_stats(ticker, period, hist)
+            self._cache_set(("history", ticker, period), stats)
             
-            print(f"✓ {stats['num_days']} jours de données")
-            print(f"  Return: {stats['total_return']:.2f}%")
-            print(f"  Volatilité: {stats['volatility']:.2f}%")
+            if not quiet:
+                logger.debug("✓ %s jours de données", stats['num_days'])
+                logger.debug("  Return: %.2f%%", stats['total_return'])
+                logger.debug("  Volatilité: %.2f%%", stats['volatility'])
             
             return stats
             
         except Exception as e:
-            print(f"✗ Erreur: {e}")
+            if not quiet:
+                logger.error("✗ Erreur: %s", e)
             return {"ticker": ticker, "error": str(e)}
+    
+    def _history_stats(self, ticker: str, period: str, hist) -> Dict:
+        """
+        Statistiques sur la période d'un historique (DataFrame OHLCV).
+        Calculées sur les tableaux NumPy des colonnes (sans dispatch pandas).
+        """
+        closes = hist['Close'].to_numpy(dtype=np.float64)
+        volumes = hist['Volume'].to_numpy(dtype=np.float64)
+        
+        # Rendements journaliers (NaN ignorés, comme pct_change().std())
+        returns = np.diff(closes) / closes[:-1]
+        returns = returns[~np.isnan(returns)]
+        volatility = returns.std(ddof=1) * 100 if returns.size > 1 else float("nan")
+        
+        return {
+            "ticker": ticker,
+            "period": period,
+            "num_days": len(hist),
+            "start_date": hist.index[0].isoformat(),
+            "end_date": hist.index[-1].isoformat(),
+            "start_price": float(closes[0]),
+            "end_price": float(closes[-1]),
+            "min_price": float(np.nanmin(closes)),
+            "max_price": float(np.nanmax(closes)),
+            "avg_price": float(np.nanmean(closes)),
+            "total_return": float((closes[-1] / closes[0] - 1) * 100),
+            "volatility": float(volatility),
+            "avg_volume": float(np.nanmean(volumes)),
+        }
+    
+    def get_price_history_bulk(
+        self,
+        tickers: List[str],
+        period: str = "1y",
+        chunk_size: int = 20
+    ) -> Dict[str, Dict]:
+        """
+        Historique des prix de plusieurs tickers via yf.download:
+        une requête Yahoo par groupe de chunk_size tickers au lieu d'une par ticker.
+        
+        Args:
+            tickers: Liste de tickers
+            period: Période (1d, 5d, 1mo, 3mo, 6mo, 1y, 2y, 5y, max)
+            chunk_size: Tickers par requête (limite de longueur d'URL Yahoo)
+        
+        Returns:
+            Dict ticker -> stats (format get_price_history)
+        """
+        logger.info("📈 Historique des prix de %s tickers (%s)...", len(tickers), period)
+        
+        results = {}
+        for start in range(0, len(tickers), chunk_size):
+            chunk = tickers[start:start + chunk_size]
+            
+            try:
+                df = yf.download(
+                    " ".join(chunk),
+                    period=period,
+                    group_by='ticker',
+                    threads=True,
+                    progress=False
+                )
+            except Exception as e:
+                for ticker in chunk:
+                    results[ticker] = {"ticker": ticker, "error": str(e)}
+                continue
+            
+            for ticker in chunk:
+                try:
+                    # Lignes vides = ticker inconnu ou jours sans cotation
+                    hist = df[ticker].dropna(how='all')
+                except KeyError:
+                    hist = None
+                
+                if hist is None or hist.empty:
+                    results[ticker] = {"ticker": ticker, "error": "No data"}
+                else:
+                    results[ticker] = self._history_stats(ticker, period, hist)
+                    self._cache_set(("history", ticker, period), results[ticker])
+        
+        errors = sum(1 for stats in results.values() if "error" in stats)
+        logger.info("✓ %s/%s historiques récupérés", len(results) - errors, len(results))
+        return results
+    
+    def get_company_data_batch(self, tickers: List[str], max_workers: int = 8) -> Dict[str, Dict]:
+        """
+        Récupère les données de plusieurs entreprises en parallèle
+        (requêtes HTTP Yahoo Finance, I/O-bound).
+        
+        Args:
+            tickers: Liste de tickers
+            max_workers: Nombre de requêtes simultanées
+        
+        Returns:
+            Dict ticker -> données (format get_company_data)
+        """
+        logger.info("📊 Récupération des données pour %s tickers...", len(tickers))
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(self.get_company_data, ticker, quiet=True): ticker
+                for ticker in tickers
+            }
+            results = {futures[f]: f.result() for f in as_completed(futures)}
+        
+        errors = sum(1 for data in results.values() if "error" in data)
+        logger.info("✓ %s/%s entreprises récupérées", len(results) - errors, len(results))
+        return results
+    
+    def get_price_history_batch(
+        self,
+        tickers: List[str],
+        period: str = "1y",
+        max_workers: int = 8
+    ) -> Dict[str, Dict]:
+        """
+        Récupère l'historique des prix de plusieurs tickers en parallèle.
+        
+        Args:
+            tickers: Liste de tickers
+            period: Période (1d, 5d, 1mo, 3mo, 6mo, 1y, 2y, 5y, max)
+            max_workers: Nombre de requêtes simultanées
+        
+        Returns:
+            Dict ticker -> stats (format get_price_history)
+        """
+        logger.info("📈 Historique des prix de %s tickers (%s)...", len(tickers), period)
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(self.get_price_history, ticker, period, quiet=True): ticker
+                for ticker in tickers
+            }
+            results = {futures[f]: f.result() for f in as_completed(futures)}
+        
+        errors = sum(1 for stats in results.values() if "error" in stats)
+        logger.info("✓ %s/%s historiques récupérés", len(results) - errors, len(results))
+        return results
 
 
 if __name__ == "__main__":
@@ -1,9 +1,47 @@
-from neo4j import GraphDatabase
+import csv
+import logging
+import math
+from pathlib import Path
+from neo4j_driver import get_driver
 from typing import Dict, List, Optional
 
 
+logger = logging.getLogger(__name__)
+
+# Propriétés du nœud Company (clés du dict de financial_data_agent)
+COMPANY_PROPERTIES = (
+    "name", "sector", "industry", "country", "employees", "website",
+    "description", "current_price", "market_cap", "revenue", "revenue_growth",
+    "profit_margin", "operating_margin", "pe_ratio", "debt_to_equity", "roe"
+)
+
+# Types neo4j-admin des propriétés numériques (les autres sont des chaînes)
+COMPANY_CSV_TYPES = {
+    "employees": "long",
+    "current_price": "double", "market_cap": "double", "revenue": "double",
+    "revenue_growth": "double", "profit_margin": "double", "operating_margin": "double",
+    "pe_ratio": "double", "debt_to_equity": "double", "roe": "double"
+}
+
+# Fichiers produits par export_csv_bulk
+CSV_FILES = ("companies", "sectors", "industries", "op_in", "belongs_to")
+
+# Index sur les clés de MERGE (lookup indexé au lieu d'un scan du label)
+INDEX_STATEMENTS = (
+    "CREATE INDEX company_ticker IF NOT EXISTS FOR (c:Company) ON (c.ticker)",
+    "CREATE INDEX sector_name IF NOT EXISTS FOR (s:Sector) ON (s.name)",
+    "CREATE INDEX industry_name IF NOT EXISTS FOR (i:Industry) ON (i.name)"
+)
+
+
 class GraphAgent:
-    def __init__(self, uri: str = "bolt://localhost:7687", user: str = "neo4j", password: str = "Caluboss18"):
+    def __init__(
+        self,
+        uri: str = "bolt://localhost:7687",
+        user: str = "neo4j",
+        password: str = "Caluboss18",
+        driver=None
+    ):
         """
         Agent pour gérer le Knowledge Graph Neo4j.
         
@@ -11,19 +49,34 @@ class GraphAgent:
             uri: URI de connexion Neo4j
             user: Username
             password: Password
+            driver: Driver Neo4j à utiliser (défaut: driver partagé de neo4j_driver)
         """
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
-        print(f"✓ Connecté à Neo4j")
+        self.driver = driver or get_driver(uri, user, password)
+        logger.info("✓ Connecté à Neo4j")
+        
+        self._ensure_indexes()
+    
+    def _ensure_indexes(self):
+        """Crée les index des clés de MERGE s'ils n'existent pas."""
+        try:
+            with self.driver.session() as session:
+                for statement in INDEX_STATEMENTS:
+                    session.run(statement)
+        except Exception as e:
+            logger.warning("⚠ Création des index impossible: %s", e)
     
     def close(self):
-        """Ferme la connexion."""
-        self.driver.close()
+        """
+        Sans effet: le driver est partagé entre les agents
+        (fermeture via neo4j_driver.close_drivers).
+        """
+        pass
     
     def clear_database(self):
         """Efface toute la base de données (ATTENTION)."""
         with self.driver.session() as session:
-            session.run("MATCH (n) DETACH DELETE n")
-            print("✓ Base de données effacée")
+            session.execute_write(lambda tx: tx.run("MATCH (n) DETACH DELETE n").consume())
+            logger.info("✓ Base de données effacée")
     
     def create_company_node(self, company_data: Dict) -> bool:
         """
@@ -35,59 +88,69 @@ class GraphAgent:
         Returns:
             True si succès
         """
-        print(f"\n📊 Création du nœud pour {company_data['name']}...")
+        logger.debug("📊 Création du nœud pour %s...", company_data['name'])
+        
+        self.bulk_create_company_nodes([company_data])
+        
+        logger.debug("✓ Nœud créé pour %s", company_data['name'])
+        if company_data.get('sector'):
+            logger.debug("  ✓ Relation OPERATES_IN -> %s", company_data['sector'])
+        if company_data.get('industry'):
+            logger.debug("  ✓ Relation BELONGS_TO -> %s", company_data['industry'])
+        
+        return True
+    
+    def bulk_create_company_nodes(self, companies: List[Dict], batch_size: int = 1000) -> int:
+        """
+        Crée (MERGE) plusieurs nœuds Company et leurs relations Sector/Industry.
+        Une transaction par lot de batch_size entreprises (requêtes UNWIND).
+        
+        Args:
+            companies: Liste de dicts (format financial_data_agent)
+            batch_size: Nombre d'entreprises par transaction
+        
+        Returns:
+            Nombre d'entreprises écrites
+        """
+        rows = [
+            {
+                "ticker": company['ticker'],
+                "props": {key: company.get(key) for key in COMPANY_PROPERTIES},
+                "sector": company.get('sector'),
+                "industry": company.get('industry'),
+                # datetime Python -> DateTime Neo4j natif (pas de chaîne ISO à reparser)
+                "retrieved_at": company.get('retrieved_at')
+            }
+            for company in companies
+        ]
         
         with self.driver.session() as session:
-            # Créer le nœud Company
-            query = """
-            MERGE (c:Company {ticker: $ticker})
-            SET c.name = $name,
-                c.sector = $sector,
-                c.industry = $industry,
-                c.country = $country,
-                c.employees = $employees,
-                c.website = $website,
-                c.description = $description,
-                c.current_price = $current_price,
-                c.market_cap = $market_cap,
-                c.revenue = $revenue,
-                c.revenue_growth = $revenue_growth,
-                c.profit_margin = $profit_margin,
-                c.operating_margin = $operating_margin,
-                c.pe_ratio = $pe_ratio,
-                c.debt_to_equity = $debt_to_equity,
-                c.roe = $roe,
+            for start in range(0, len(rows), batch_size):
+                session.execute_write(self._write_companies, rows[start:start + batch_size])
+        
+        return len(rows)
+    
+    @staticmethod
+    def _write_companies(tx, rows: List[Dict]):
+        """
+        Nœuds Company et relations OPERATES_IN / BELONGS_TO d'un lot,
+        en une seule requête (un aller-retour, un commit).
+        """
+        tx.run("""
+            UNWIND $rows AS row
+            MERGE (c:Company {ticker: row.ticker})
+            SET c += row.props,
+                c.retrieved_at = row.retrieved_at,
                 c.updated_at = datetime()
-            RETURN c
-            """
-            
-            result = session.run(query, 
-                ticker=company_data['ticker'],
-                name=company_data['name'],
-                sector=company_data['sector'],
-                industry=company_data['industry'],
-                country=company_data['country'],
-                employees=company_data['employees'],
-                website=company_data['website'],
-                description=company_data['description'],
-                current_price=company_data['current_price'],
-                market_cap=company_data['market_cap'],
-                revenue=company_data['revenue'],
-                revenue_growth=company_data['revenue_growth'],
-                profit_margin=company_data['profit_margin'],
-                operating_margin=company_data['operating_margin'],
-                pe_ratio=company_data['pe_ratio'],
-                debt_to_equity=company_data['debt_to_equity'],
-                roe=company_data['roe']
+            FOREACH (_ IN CASE WHEN coalesce(row.sector, '') <> '' THEN [1] ELSE [] END |
+                MERGE (s:Sector {name: row.sector})
+                MERGE (c)-[:OPERATES_IN]->(s)
             )
-            
-            print(f"✓ Nœud créé pour {company_data['name']}")
-            
-            # Créer les relations avec Sector et Industry
-            self._create_sector_relation(company_data['ticker'], company_data['sector'])
-            self._create_industry_relation(company_data['ticker'], company_data['industry'])
-            
-            return True
+            FOREACH (_ IN CASE WHEN coalesce(row.industry, '') <> '' THEN [1] ELSE [] END |
+                MERGE (i:Industry {name: row.industry})
+                MERGE (c)-[:BELONGS_TO]->(i)
+            )
+        """, rows=rows).consume()
     
     def add_10k_syntheses(self, ticker: str, syntheses: Dict):
         """
@@ -107,40 +170,162 @@ class GraphAgent:
             RETURN c
             """
             
-            session.run(query,
+            session.execute_write(lambda tx: tx.run(query,
                 ticker=ticker,
                 business=syntheses.get("business_summary"),
                 risk=syntheses.get("risk_summary"),
                 mda=syntheses.get("mda_summary")
-            )
+            ).consume())
     
-    def _create_sector_relation(self, ticker: str, sector: str):
-        """Crée la relation Company -> Sector."""
-        if not sector:
-            return
+    def export_csv_bulk(self, companies: List[Dict], out_dir: str) -> Dict[str, str]:
+        """
+        Écrit les entreprises en CSV au format d'en-tête neo4j-admin, pour un
+        chargement initial en masse (load_via_csv ou neo4j-admin import).
         
-        with self.driver.session() as session:
-            query = """
-            MATCH (c:Company {ticker: $ticker})
-            MERGE (s:Sector {name: $sector})
-            MERGE (c)-[:OPERATES_IN]->(s)
-            """
-            session.run(query, ticker=ticker, sector=sector)
-            print(f"  ✓ Relation OPERATES_IN -> {sector}")
+        Fichiers: companies.csv, sectors.csv, industries.csv,
+        op_in.csv (OPERATES_IN), belongs_to.csv (BELONGS_TO).
+        
+        Args:
+            companies: Liste de dicts (format financial_data_agent)
+            out_dir: Répertoire de sortie (ex: répertoire import/ de Neo4j)
+        
+        Returns:
+            Dict nom -> chemin des fichiers écrits
+        """
+        out = Path(out_dir)
+        out.mkdir(parents=True, exist_ok=True)
+        paths = {name: str(out / f"{name}.csv") for name in CSV_FILES}
+        
+        company_header = ["ticker:ID(Company)"] + [
+            f"{key}:{COMPANY_CSV_TYPES[key]}" if key in COMPANY_CSV_TYPES else key
+            for key in COMPANY_PROPERTIES
+        ] + [":LABEL"]
+        
+        sectors = set()
+        industries = set()
+        
+        with open(paths["companies"], "w", newline="", encoding="utf-8") as f_companies, \
+                open(paths["op_in"], "w", newline="", encoding="utf-8") as f_op_in, \
+                open(paths["belongs_to"], "w", newline="", encoding="utf-8") as f_belongs_to:
+            companies_writer = csv.writer(f_companies)
+            op_in_writer = csv.writer(f_op_in)
+            belongs_to_writer = csv.writer(f_belongs_to)
+            
+            companies_writer.writerow(company_header)
+            op_in_writer.writerow([":START_ID(Company)", ":END_ID(Sector)", ":TYPE"])
+            belongs_to_writer.writerow([":START_ID(Company)", ":END_ID(Industry)", ":TYPE"])
+            
+            for company in companies:
+                ticker = company['ticker']
+                companies_writer.writerow(
+                    [ticker]
+                    + [self._csv_value(company.get(key)) for key in COMPANY_PROPERTIES]
+                    + ["Company"]
+                )
+                
+                if company.get('sector'):
+                    sectors.add(company['sector'])
+                    op_in_writer.writerow([ticker, company['sector'], "OPERATES_IN"])
+                if company.get('industry'):
+                    industries.add(company['industry'])
+                    belongs_to_writer.writerow([ticker, company['industry'], "BELONGS_TO"])
+        
+        for name, label, values in (
+            ("sectors", "Sector", sectors),
+            ("industries", "Industry", industries)
+        ):
+            with open(paths[name], "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow([f"name:ID({label})", ":LABEL"])
+                writer.writerows([value, label] for value in sorted(values))
+        
+        logger.info("✓ %s entreprises exportées en CSV dans %s", len(companies), out)
+        return paths
     
-    def _create_industry_relation(self, ticker: str, industry: str):
-        """Crée la relation Company -> Industry."""
-        if not industry:
-            return
+    def load_via_csv(
+        self,
+        out_dir: str,
+        url_prefix: str = "file:///",
+        batch_size: int = 10000,
+        use_neo4j_admin: bool = False
+    ) -> Optional[str]:
+        """
+        Charge les CSV de export_csv_bulk avec LOAD CSV, par transactions de
+        batch_size lignes (CALL { } IN TRANSACTIONS, session auto-commit).
+        
+        Args:
+            out_dir: Répertoire des CSV (pour la commande neo4j-admin)
+            url_prefix: Préfixe d'URL des CSV vu par le serveur
+                        (file:/// = répertoire import/ de Neo4j)
+            batch_size: Lignes par transaction
+            use_neo4j_admin: Ne rien charger, renvoyer la commande
+                             neo4j-admin d'import hors ligne (base vide, arrêtée)
+        
+        Returns:
+            La commande neo4j-admin si use_neo4j_admin, sinon None
+        """
+        if use_neo4j_admin:
+            out = Path(out_dir)
+            command = (
+                "neo4j-admin database import full"
+                f" --nodes={out / 'companies.csv'}"
+                f" --nodes={out / 'sectors.csv'}"
+                f" --nodes={out / 'industries.csv'}"
+                f" --relationships={out / 'op_in.csv'}"
+                f" --relationships={out / 'belongs_to.csv'}"
+                " neo4j"
+            )
+            logger.info("Import hors ligne: %s", command)
+            return command
+        
+        company_sets = ",\n                    ".join(
+            f"c.{key} = {self._csv_cast(key)}" for key in COMPANY_PROPERTIES
+        )
         
         with self.driver.session() as session:
-            query = """
-            MATCH (c:Company {ticker: $ticker})
-            MERGE (i:Industry {name: $industry})
-            MERGE (c)-[:BELONGS_TO]->(i)
-            """
-            session.run(query, ticker=ticker, industry=industry)
-            print(f"  ✓ Relation BELONGS_TO -> {industry}")
+            session.run(f"""
+                LOAD CSV WITH HEADERS FROM $url AS row
+                CALL {{
+                    WITH row
+                    MERGE (c:Company {{ticker: row.`ticker:ID(Company)`}})
+                    SET {company_sets},
+                        c.updated_at = datetime()
+                }} IN TRANSACTIONS OF {int(batch_size)} ROWS
+            """, url=f"{url_prefix}companies.csv").consume()
+            
+            for file_name, label, rel_type in (
+                ("op_in", "Sector", "OPERATES_IN"),
+                ("belongs_to", "Industry", "BELONGS_TO")
+            ):
+                session.run(f"""
+                    LOAD CSV WITH HEADERS FROM $url AS row
+                    CALL {{
+                        WITH row
+                        MATCH (c:Company {{ticker: row.`:START_ID(Company)`}})
+                        MERGE (t:{label} {{name: row.`:END_ID({label})`}})
+                        MERGE (c)-[:{rel_type}]->(t)
+                    }} IN TRANSACTIONS OF {int(batch_size)} ROWS
+                """, url=f"{url_prefix}{file_name}.csv").consume()
+        
+        logger.info("✓ CSV chargés dans Neo4j")
+        return None
+    
+    @staticmethod
+    def _csv_value(value):
+        """Valeur de cellule CSV (None / NaN / Inf -> champ vide)."""
+        if value is None or (isinstance(value, float) and not math.isfinite(value)):
+            return ""
+        return value
+    
+    @staticmethod
+    def _csv_cast(key: str) -> str:
+        """Expression Cypher lisant la colonne CSV d'une propriété Company."""
+        csv_type = COMPANY_CSV_TYPES.get(key)
+        if csv_type == "long":
+            return f"toInteger(row.`{key}:long`)"
+        if csv_type == "double":
+            return f"toFloat(row.`{key}:double`)"
+        return f"row.{key}"
     
     def get_company(self, ticker: str) -> Optional[Dict]:
         """Récupère les données d'une entreprise depuis le graph."""
@@ -149,8 +334,7 @@ class GraphAgent:
             MATCH (c:Company {ticker: $ticker})
             RETURN c
             """
-            result = session.run(query, ticker=ticker)
-            record = result.single()
+            record = session.execute_read(lambda tx: tx.run(query, ticker=ticker).single())
             
             if record:
                 return dict(record['c'])
@@ -164,8 +348,9 @@ class GraphAgent:
             RETURN c.ticker as ticker, c.name as name, c.sector as sector
             ORDER BY c.name
             """
-            result = session.run(query)
-            return [dict(record) for record in result]
+            return session.execute_read(
+                lambda tx: [dict(record) for record in tx.run(query)]
+            )
     
     def get_companies_by_sector(self, sector: str) -> List[Dict]:
         """Récupère toutes les entreprises d'un secteur."""
@@ -175,5 +360,6 @@ class GraphAgent:
             RETURN c.ticker as ticker, c.name as name, c.pe_ratio as pe_ratio, c.roe as roe
             ORDER BY c.name
             """
-            result = session.run(query, sector=sector)
-            return [dict(record) for record in result]
\ No newline at end of file
+            return session.execute_read(
+                lambda tx: [dict(record) for record in tx.run(query, sector=sector)]
+            )
\ No newline at end of file
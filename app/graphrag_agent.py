@@ -4,9 +4,65 @@ Agent GraphRAG - Fusion Graph Traversal + Vector Retrieval + LLM.
 C'est le coeur du système de Question-Answering avec citations.
 """
 
+import logging
 import ollama
-from typing import Dict, List, Optional
-from neo4j import GraphDatabase
+import os
+import re
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
+from neo4j_driver import get_driver
+
+
+logger = logging.getLogger(__name__)
+
+# Labels / types de relation interpolés dans le Cypher: identifiants simples uniquement
+_IDENTIFIER_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+# Question réduite à un ticker (ex: "META", "aapl?")
+_TICKER_RE = re.compile(r"[A-Z]{1,5}")
+TICKERS_REFRESH_SECONDS = 60
+
+# Threads d'écriture de add_entities_to_graph (un bucket label / relation par tâche)
+GRAPH_WRITE_WORKERS = 4
+
+# Options de génération des réponses QA (réponses factuelles, peu de variance)
+_ANSWER_OPTIONS = {"temperature": 0.2}
+
+_NO_CONTEXT_ANSWER = (
+    "I don't have enough information to answer this question. "
+    "Please ingest some documents first."
+)
+
+# Suite commune des requêtes de recherche d'entreprises: regroupe les
+# entreprises trouvées et les 10 premières relations sortantes de la première
+_COMPANY_PATHS_TAIL = """
+    WITH collect(c) AS companies
+    WITH companies, head(companies) AS first
+    OPTIONAL MATCH (first)-[r]->(target)
+    WITH companies, first, r, target LIMIT 10
+    RETURN companies, first.ticker AS ticker,
+           collect(CASE WHEN r IS NULL THEN null ELSE {
+               relation: type(r),
+               target_type: labels(target)[0],
+               target_name: target.name
+           } END) AS paths
+"""
+
+# Mots-clés de requête: mots de 3 caractères ou plus (la ponctuation sépare)
+_WORD_RE = re.compile(r"\w{3,}")
+
+# Mots à ignorer
+_STOPWORDS = frozenset({
+    'what', 'who', 'where', 'when', 'why', 'how', 'is', 'are', 'was',
+    'were', 'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at',
+    'to', 'for', 'of', 'with', 'by', 'about', 'tell', 'me', 'show',
+    'give', 'explain', 'describe', 'company', 'companies', 'stock',
+    'quel', 'quelle', 'quels', 'quelles', 'est', 'sont', 'le', 'la',
+    'les', 'un', 'une', 'des', 'du', 'de', 'et', 'ou', 'mais', 'dans',
+    'sur', 'pour', 'avec', 'par', 'entreprise', 'entreprises'
+})
 
 
 class GraphRAGAgent:
@@ -23,7 +79,8 @@ class GraphRAGAgent:
         graph_uri: str = "bolt://localhost:7687",
         graph_user: str = "neo4j",
         graph_password: str = "Caluboss18",
-        llm_model: str = "llama3.2"
+        llm_model: str = "llama3.2",
+        driver=None
     ):
         """
         Initialise l'agent GraphRAG.
@@ -34,21 +91,45 @@ class GraphRAGAgent:
             graph_user: User Neo4j
             graph_password: Password Neo4j
             llm_model: Modèle Ollama à utiliser
+            driver: Driver Neo4j à utiliser (défaut: driver partagé de neo4j_driver)
         """
         self.vector_store = vector_store
         self.llm_model = llm_model
 
+        # Client HTTP Ollama persistant (connexions keep-alive réutilisées)
+        self.llm = ollama.Client(host=os.getenv("OLLAMA_HOST", "http://localhost:11434"))
+
         # Connexion Neo4j
         try:
-            self.driver = GraphDatabase.driver(
-                graph_uri, auth=(graph_user, graph_password)
-            )
-            print("✓ GraphRAG Agent connecté à Neo4j")
+            self.driver = driver or get_driver(graph_uri, graph_user, graph_password)
+            logger.info("✓ GraphRAG Agent connecté à Neo4j")
         except Exception as e:
-            print(f"⚠ Connexion Neo4j échouée: {e}")
+            logger.warning("⚠ Connexion Neo4j échouée: %s", e)
             self.driver = None
 
-        print(f"✓ GraphRAG Agent initialisé (LLM: {llm_model})")
+        # Labels d'entités dont l'index sur name a déjà été créé
+        self._indexed_labels = set()
+
+        # Recherches vectorielle et graphe lancées en parallèle (I/O indépendantes)
+        self._retrieval_executor = ThreadPoolExecutor(max_workers=4)
+
+        # Index fulltext pour la recherche d'entreprises par mots-clés
+        if self.driver:
+            try:
+                with self.driver.session() as session:
+                    session.run("""
+                        CREATE FULLTEXT INDEX company_text IF NOT EXISTS
+                        FOR (c:Company) ON EACH [c.name, c.ticker, c.sector, c.industry]
+                    """)
+            except Exception as e:
+                logger.warning("⚠ Création de l'index fulltext impossible: %s", e)
+
+        # Tickers connus du graphe (chemin rapide des questions "META")
+        self._tickers = frozenset()
+        self._tickers_loaded_at = 0.0
+        self._load_tickers()
+
+        logger.info("✓ GraphRAG Agent initialisé (LLM: %s)", llm_model)
 
     def answer(
         self,
@@ -67,16 +148,12 @@ class GraphRAGAgent:
         Returns:
             Dict avec réponse, citations, et chemins du graphe
         """
-        print(f"\n🤖 GraphRAG Query: '{question}'")
+        logger.debug("🤖 GraphRAG Query: '%s'", question)
 
-        # 1. Recherche vectorielle
-        vector_context = self._vector_search(question, n_vector_results)
-
-        # 2. Recherche dans le graphe
-        graph_context = []
-        graph_paths = []
-        if include_graph and self.driver:
-            graph_context, graph_paths = self._graph_search(question)
+        # 1-2. Recherches vectorielle et graphe (en parallèle)
+        vector_context, graph_context, graph_paths = self._retrieve(
+            question, n_vector_results, include_graph
+        )
 
         # 3. Construire le contexte complet
         full_context = self._build_context(vector_context, graph_context)
@@ -95,36 +172,160 @@ class GraphRAGAgent:
             }
         }
 
+    def answer_stream(
+        self,
+        question: str,
+        n_vector_results: int = 5,
+        include_graph: bool = True
+    ) -> Iterator[Dict]:
+        """
+        Variante streaming de answer(): les sources sont envoyées dès la fin
+        de la recherche, puis la réponse token par token pendant la génération.
+
+        Yields:
+            {"type": "sources", ...} puis {"type": "token", "text": ...}
+            puis {"type": "done", "answer": ...} (ou {"type": "error", ...})
+        """
+        logger.debug("🤖 GraphRAG Query (stream): '%s'", question)
+
+        vector_context, graph_context, graph_paths = self._retrieve(
+            question, n_vector_results, include_graph
+        )
+        full_context = self._build_context(vector_context, graph_context)
+
+        yield {
+            "type": "sources",
+            "question": question,
+            "citations": self._citations(vector_context),
+            "graph_paths": graph_paths,
+            "sources": {
+                "vector_results": len(vector_context),
+                "graph_entities": len(graph_context)
+            }
+        }
+
+        if not full_context.strip():
+            yield {"type": "token", "text": _NO_CONTEXT_ANSWER}
+            yield {"type": "done", "answer": _NO_CONTEXT_ANSWER}
+            return
+
+        parts = []
+        try:
+            for chunk in self.llm.generate(
+                model=self.llm_model,
+                prompt=self._answer_prompt(question, full_context),
+                options=_ANSWER_OPTIONS,
+                stream=True
+            ):
+                parts.append(chunk['response'])
+                yield {"type": "token", "text": chunk['response']}
+        except Exception as e:
+            logger.error("    ✗ Erreur LLM: %s", e)
+            yield {"type": "error", "error": f"Error generating answer: {e}"}
+            return
+
+        yield {"type": "done", "answer": "".join(parts).strip()}
+
+    def _retrieve(self, question: str, n_vector_results: int, include_graph: bool) -> tuple:
+        """
+        Lance la recherche vectorielle et la recherche dans le graphe en
+        parallèle: durée = max des deux au lieu de leur somme.
+
+        Returns:
+            (contexte vectoriel, entités du graphe, chemins du graphe)
+        """
+        vector_future = self._retrieval_executor.submit(
+            self._vector_search, question, n_vector_results
+        )
+
+        # Chemin rapide du graphe: la question est juste un ticker connu (nœud
+        # Company lu directement, sans extraction d'entités)
+        ticker = self._ticker_question(question) if include_graph else None
+        if ticker:
+            company = self._get_company(ticker)
+            if company:
+                logger.debug("  ⚡ Question ticker seul: %s", ticker)
+                entity = {"type": "Company", "data": company, "source_type": "graph"}
+                return vector_future.result(), [entity], []
+
+        graph_context = []
+        graph_paths = []
+        if include_graph and self.driver:
+            graph_context, graph_paths = self._graph_search(question)
+
+        return vector_future.result(), graph_context, graph_paths
+
+    def _ticker_question(self, question: str) -> Optional[str]:
+        """Ticker si la question n'est qu'un ticker présent dans le graphe, sinon None."""
+        candidate = question.strip().strip("?!. ").upper()
+        if not _TICKER_RE.fullmatch(candidate):
+            return None
+
+        if time.monotonic() - self._tickers_loaded_at > TICKERS_REFRESH_SECONDS:
+            self._load_tickers()
+        return candidate if candidate in self._tickers else None
+
+    def _load_tickers(self):
+        """Charge (ou rafraîchit) l'ensemble des tickers du graphe."""
+        if not self.driver:
+            return
+
+        try:
+            with self.driver.session() as session:
+                self._tickers = frozenset(session.execute_read(
+                    lambda tx: [r["ticker"] for r in tx.run(
+                        "MATCH (c:Company) WHERE c.ticker IS NOT NULL RETURN c.ticker AS ticker"
+                    )]
+                ))
+        except Exception as e:
+            logger.warning("⚠ Chargement des tickers impossible: %s", e)
+        self._tickers_loaded_at = time.monotonic()
+
+    def _get_company(self, ticker: str) -> Optional[Dict]:
+        """Nœud Company d'un ticker."""
+        try:
+            with self.driver.session() as session:
+                record = session.execute_read(
+                    self._single, "MATCH (c:Company {ticker: $ticker}) RETURN c", ticker=ticker
+                )
+            return dict(record["c"]) if record else None
+        except Exception as e:
+            logger.error("    ✗ Erreur graph search: %s", e)
+            return None
+
     def _vector_search(self, query: str, n_results: int) -> List[Dict]:
         """Recherche vectorielle dans ChromaDB."""
-        print("  📊 Recherche vectorielle...")
+        logger.debug("  📊 Recherche vectorielle...")
 
         try:
             results = self.vector_store.search(query=query, n_results=n_results)
 
-            contexts = []
-            for i, (doc, meta, dist) in enumerate(zip(
-                results.get("documents", []),
-                results.get("metadatas", []),
-                results.get("distances", [])
-            )):
-                contexts.append({
-                    "content": doc[:2000] if doc else "",  # Limiter la taille
+            # search() renvoie déjà les listes de la requête (pas de niveau par requête)
+            contexts = [
+                {
+                    "content": (doc or "")[:2000],  # Limiter la taille
                     "metadata": meta,
-                    "relevance": 1 - dist if dist else 0,  # Convertir distance en score
+                    # Convertir distance en score (distance 0 = pertinence maximale)
+                    "relevance": 1 - dist if dist is not None else 0,
                     "source_type": "vector"
-                })
-
-            print(f"    ✓ {len(contexts)} documents trouvés")
+                }
+                for doc, meta, dist in zip(
+                    results.get("documents", []),
+                    results.get("metadatas", []),
+                    results.get("distances", [])
+                )
+            ]
+
+            logger.debug("    ✓ %s documents trouvés", len(contexts))
             return contexts
 
         except Exception as e:
-            print(f"    ✗ Erreur vector search: {e}")
+            logger.error("    ✗ Erreur vector search: %s", e)
             return []
 
     def _graph_search(self, query: str) -> tuple:
         """Recherche dans le Knowledge Graph Neo4j."""
-        print("  🔗 Recherche dans le graphe...")
+        logger.debug("  🔗 Recherche dans le graphe...")
 
         entities = []
         paths = []
@@ -134,108 +335,125 @@ class GraphRAGAgent:
 
         try:
             with self.driver.session() as session:
-                # Recherche par mots-clés dans les entreprises
-                keywords = self._extract_keywords(query)
-
-                for keyword in keywords[:5]:  # Max 5 keywords
-                    # Chercher les entreprises correspondantes
-                    result = session.run("""
-                        MATCH (c:Company)
-                        WHERE toLower(c.name) CONTAINS toLower($keyword)
-                           OR toLower(c.ticker) CONTAINS toLower($keyword)
-                           OR toLower(c.sector) CONTAINS toLower($keyword)
-                           OR toLower(c.industry) CONTAINS toLower($keyword)
-                        RETURN c
-                        LIMIT 3
-                    """, keyword=keyword)
-
-                    for record in result:
-                        company = dict(record['c'])
-                        entities.append({
-                            "type": "Company",
-                            "data": company,
-                            "source_type": "graph"
+                # Entreprises par mots-clés + relations de la première, en une requête
+                keywords = self._extract_keywords(query)[:5]  # Max 5 keywords
+                companies, ticker, relations = self._search_companies(session, keywords)
+
+                for company in companies:
+                    entities.append({
+                        "type": "Company",
+                        "data": company,
+                        "source_type": "graph"
+                    })
+
+                if ticker:
+                    for rel in relations:
+                        paths.append({
+                            "source": ticker,
+                            "relation": rel["relation"],
+                            "target_type": rel["target_type"],
+                            "target": rel["target_name"]
                         })
 
-                # Chercher les relations (paths)
-                if entities:
-                    ticker = entities[0].get("data", {}).get("ticker")
-                    if ticker:
-                        path_result = session.run("""
-                            MATCH path = (c:Company {ticker: $ticker})-[r]->(target)
-                            RETURN type(r) as relation, labels(target)[0] as target_type,
-                                   target.name as target_name
-                            LIMIT 10
-                        """, ticker=ticker)
-
-                        for record in path_result:
-                            paths.append({
-                                "source": ticker,
-                                "relation": record["relation"],
-                                "target_type": record["target_type"],
-                                "target": record["target_name"]
-                            })
-
-            print(f"    ✓ {len(entities)} entités, {len(paths)} relations")
+            logger.debug("    ✓ %s entités, %s relations", len(entities), len(paths))
             return entities, paths
 
         except Exception as e:
-            print(f"    ✗ Erreur graph search: {e}")
+            logger.error("    ✗ Erreur graph search: %s", e)
             return [], []
 
-    def _extract_keywords(self, query: str) -> List[str]:
-        """Extrait les mots-clés importants d'une requête."""
-        # Mots à ignorer
-        stopwords = {
-            'what', 'who', 'where', 'when', 'why', 'how', 'is', 'are', 'was',
-            'were', 'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at',
-            'to', 'for', 'of', 'with', 'by', 'about', 'tell', 'me', 'show',
-            'give', 'explain', 'describe', 'company', 'companies', 'stock',
-            'quel', 'quelle', 'quels', 'quelles', 'est', 'sont', 'le', 'la',
-            'les', 'un', 'une', 'des', 'du', 'de', 'et', 'ou', 'mais', 'dans',
-            'sur', 'pour', 'avec', 'par', 'entreprise', 'entreprises'
-        }
+    def _search_companies(self, session, keywords: List[str], limit: int = 15) -> tuple:
+        """
+        Entreprises correspondant aux mots-clés et relations sortantes de la
+        première, en une seule requête (un aller-retour Neo4j).
+        Utilise l'index fulltext company_text (recherche par préfixe);
+        sans index, retombe sur un CONTAINS sur nom / ticker / secteur / industrie.
 
-        words = query.lower().replace('?', '').replace(',', '').split()
-        keywords = [w for w in words if w not in stopwords and len(w) > 2]
+        Returns:
+            (entreprises, ticker de la première, relations de la première)
+        """
+        if not keywords:
+            return [], None, []
 
-        return keywords
+        try:
+            record = session.execute_read(self._single, """
+                CALL db.index.fulltext.queryNodes('company_text', $query_string)
+                YIELD node
+                WITH node AS c LIMIT $limit
+            """ + _COMPANY_PATHS_TAIL,
+                query_string=" OR ".join(f"{kw}*" for kw in keywords), limit=limit
+            )
+        except Exception:
+            # Index fulltext absent. Mots-clés déjà en minuscules (_extract_keywords)
+            record = session.execute_read(self._single, """
+                UNWIND $keywords AS kw
+                MATCH (c:Company)
+                WHERE toLower(c.name) CONTAINS kw
+                   OR toLower(c.ticker) CONTAINS kw
+                   OR toLower(c.sector) CONTAINS kw
+                   OR toLower(c.industry) CONTAINS kw
+                WITH DISTINCT c LIMIT $limit
+            """ + _COMPANY_PATHS_TAIL, keywords=keywords, limit=limit)
+
+        if not record:
+            return [], None, []
+
+        return [dict(c) for c in record["companies"]], record["ticker"], record["paths"]
+
+    def _extract_keywords(self, query: str) -> List[str]:
+        """Extrait les mots-clés importants d'une requête."""
+        return [w for w in _WORD_RE.findall(query.lower()) if w not in _STOPWORDS]
 
     def _build_context(
         self,
         vector_context: List[Dict],
-        graph_context: List[Dict]
+        graph_context: List[Dict],
+        budget: int = 6000
     ) -> str:
-        """Construit le contexte pour le LLM."""
+        """
+        Construit le contexte pour le LLM, borné à budget caractères:
+        l'assemblage s'arrête dès que le budget est atteint.
+        """
         parts = []
+        used = 0
 
+        for part in self._context_parts(vector_context, graph_context):
+            remaining = budget - used - (1 if parts else 0)  # + séparateur "\n"
+            if remaining <= 0:
+                break
+            part = part[:remaining]
+            used += len(part) + (1 if parts else 0)
+            parts.append(part)
+
+        return "\n".join(parts)
+
+    def _context_parts(self, vector_context: List[Dict], graph_context: List[Dict]):
+        """Lignes du contexte, générées à la demande."""
         # Contexte vectoriel
         if vector_context:
-            parts.append("=== DOCUMENT CONTEXT ===")
+            yield "=== DOCUMENT CONTEXT ==="
             for i, ctx in enumerate(vector_context, 1):
                 meta = ctx.get("metadata", {})
                 source = meta.get("ticker", meta.get("section", "unknown"))
-                parts.append(f"\n[Source {i}: {source}]")
-                parts.append(ctx.get("content", "")[:1500])
+                yield f"\n[Source {i}: {source}]"
+                yield ctx.get("content", "")[:1500]
 
         # Contexte du graphe
         if graph_context:
-            parts.append("\n\n=== KNOWLEDGE GRAPH CONTEXT ===")
+            yield "\n\n=== KNOWLEDGE GRAPH CONTEXT ==="
             for entity in graph_context[:5]:  # Max 5 entités
                 data = entity.get("data", {})
                 if entity.get("type") == "Company":
-                    parts.append(f"\nCompany: {data.get('name', 'N/A')}")
-                    parts.append(f"  Ticker: {data.get('ticker', 'N/A')}")
-                    parts.append(f"  Sector: {data.get('sector', 'N/A')}")
-                    parts.append(f"  Industry: {data.get('industry', 'N/A')}")
+                    yield f"\nCompany: {data.get('name', 'N/A')}"
+                    yield f"  Ticker: {data.get('ticker', 'N/A')}"
+                    yield f"  Sector: {data.get('sector', 'N/A')}"
+                    yield f"  Industry: {data.get('industry', 'N/A')}"
                     if data.get('description'):
-                        parts.append(f"  Description: {data.get('description', '')[:500]}")
+                        yield f"  Description: {data.get('description', '')[:500]}"
                     if data.get('market_cap'):
-                        parts.append(f"  Market Cap: ${data.get('market_cap', 0):,.0f}")
+                        yield f"  Market Cap: ${data.get('market_cap', 0):,.0f}"
                     if data.get('revenue'):
-                        parts.append(f"  Revenue: ${data.get('revenue', 0):,.0f}")
-
-        return "\n".join(parts)
+                        yield f"  Revenue: ${data.get('revenue', 0):,.0f}"
 
     def _generate_answer(
         self,
@@ -244,17 +462,37 @@ class GraphRAGAgent:
         vector_results: List[Dict]
     ) -> tuple:
         """Génère la réponse avec le LLM."""
-        print("  🧠 Génération de la réponse...")
+        logger.debug("  🧠 Génération de la réponse...")
 
         if not context.strip():
-            return "I don't have enough information to answer this question. Please ingest some documents first.", []
+            return _NO_CONTEXT_ANSWER, []
 
-        prompt = f"""You are a helpful assistant answering questions based on the provided context.
+        try:
+            response = self.llm.generate(
+                model=self.llm_model,
+                prompt=self._answer_prompt(question, context),
+                options=_ANSWER_OPTIONS
+            )
+            answer = response['response'].strip()
+
+            # Extraire les citations depuis les résultats vectoriels
+            citations = self._citations(vector_results)
+
+            logger.debug("    ✓ Réponse générée (%s chars)", len(answer))
+            return answer, citations
+
+        except Exception as e:
+            logger.error("    ✗ Erreur LLM: %s", e)
+            return f"Error generating answer: {e}", []
+
+    def _answer_prompt(self, question: str, context: str) -> str:
+        """Prompt de génération de la réponse."""
+        return f"""You are a helpful assistant answering questions based on the provided context.
 Use ONLY the information from the context below to answer. If the context doesn't contain
 enough information, say so clearly.
 
 CONTEXT:
-{context[:6000]}
+{context}
 
 QUESTION: {question}
 
@@ -267,36 +505,34 @@ Instructions:
 
 ANSWER:"""
 
-        try:
-            response = ollama.generate(model=self.llm_model, prompt=prompt)
-            answer = response['response'].strip()
-
-            # Extraire les citations depuis les résultats vectoriels
-            citations = []
-            for ctx in vector_results:
-                meta = ctx.get("metadata", {})
-                if meta:
-                    citation = {
-                        "source": meta.get("ticker", "Unknown"),
-                        "section": meta.get("section", "document"),
-                        "url": meta.get("url", ""),
-                        "relevance": round(ctx.get("relevance", 0), 3)
-                    }
-                    citations.append(citation)
-
-            print(f"    ✓ Réponse générée ({len(answer)} chars)")
-            return answer, citations
-
-        except Exception as e:
-            print(f"    ✗ Erreur LLM: {e}")
-            return f"Error generating answer: {e}", []
-
-    def add_entities_to_graph(self, extraction_results: List[Dict]) -> Dict:
+    def _citations(self, vector_results: List[Dict]) -> List[Dict]:
+        """Citations depuis les résultats vectoriels."""
+        citations = []
+        for ctx in vector_results:
+            meta = ctx.get("metadata", {})
+            if meta:
+                citation = {
+                    "source": meta.get("ticker", "Unknown"),
+                    "section": meta.get("section", "document"),
+                    "url": meta.get("url", ""),
+                    "relevance": round(ctx.get("relevance", 0), 3)
+                }
+                citations.append(citation)
+        return citations
+
+    def add_entities_to_graph(
+        self,
+        extraction_results: List[Dict],
+        batch_size: int = 1000
+    ) -> Dict:
         """
         Ajoute les entités et relations extraites au Knowledge Graph.
+        Les écritures sont groupées par label / type de relation et envoyées
+        par lots UNWIND (un aller-retour Neo4j par lot au lieu d'un par ligne).
 
         Args:
             extraction_results: Résultats de EntityExtractionAgent.batch_extract()
+            batch_size: Nombre de lignes par requête UNWIND
 
         Returns:
             Stats d'ajout
@@ -304,61 +540,133 @@ ANSWER:"""
         if not self.driver:
             return {"error": "Neo4j non connecté"}
 
-        added_entities = 0
-        added_relations = 0
-
-        with self.driver.session() as session:
-            for result in extraction_results:
-                source = result.get("source", "unknown")
-
-                # Ajouter les entités
-                for entity in result.get("entities", []):
-                    entity_type = entity.get("type", "Entity")
-                    entity_name = entity.get("name", "")
-
-                    if not entity_name:
-                        continue
-
-                    try:
-                        session.run(f"""
-                            MERGE (e:{entity_type} {{name: $name}})
-                            SET e.source = $source,
-                                e.updated_at = datetime()
-                        """, name=entity_name, source=source)
-                        added_entities += 1
-                    except Exception:
-                        pass  # Ignorer les erreurs de type de noeud
-
-                # Ajouter les relations
-                for rel in result.get("relations", []):
-                    source_name = rel.get("source", "")
-                    target_name = rel.get("target", "")
-                    relation_type = rel.get("relation", "RELATED_TO")
-
-                    if not source_name or not target_name:
-                        continue
-
-                    # Sanitize relation type
-                    relation_type = relation_type.upper().replace(" ", "_")
-
-                    try:
-                        session.run(f"""
-                            MATCH (s {{name: $source}})
-                            MATCH (t {{name: $target}})
-                            MERGE (s)-[r:{relation_type}]->(t)
-                            SET r.updated_at = datetime()
-                        """, source=source_name, target=target_name)
-                        added_relations += 1
-                    except Exception:
-                        pass
-
-        print(f"✓ Graph enrichi: {added_entities} entités, {added_relations} relations")
+        # Regrouper les lignes: le label / type de relation ne peut pas être
+        # un paramètre Cypher, il faut une requête par label
+        entity_rows = defaultdict(list)
+        relation_rows = defaultdict(list)
+
+        for result in extraction_results:
+            source = result.get("source", "unknown")
+
+            for entity in result.get("entities", []):
+                entity_type = entity.get("type", "Entity")
+                entity_name = entity.get("name", "")
+
+                if not entity_name or not _IDENTIFIER_RE.match(str(entity_type)):
+                    continue
+
+                entity_rows[entity_type].append({"name": entity_name, "source": source})
+
+            for rel in result.get("relations", []):
+                source_name = rel.get("source", "")
+                target_name = rel.get("target", "")
+                relation_type = rel.get("relation", "RELATED_TO")
+
+                if not source_name or not target_name:
+                    continue
+
+                # Sanitize relation type
+                relation_type = relation_type.upper().replace(" ", "_")
+                if not _IDENTIFIER_RE.match(relation_type):
+                    continue
+                relation_rows[relation_type].append({"source": source_name, "target": target_name})
+
+        # Un bucket par label / type de relation, écrits en parallèle (une
+        # session par thread). Les entités sont toutes écrites avant les
+        # relations, qui les MATCH.
+        with ThreadPoolExecutor(max_workers=GRAPH_WRITE_WORKERS) as executor:
+            added_entities = sum(executor.map(
+                lambda item: self._write_entity_bucket(*item, batch_size),
+                entity_rows.items()
+            ))
+            added_relations = sum(executor.map(
+                lambda item: self._write_relation_bucket(*item, batch_size),
+                relation_rows.items()
+            ))
+
+        logger.info("✓ Graph enrichi: %s entités, %s relations", added_entities, added_relations)
         return {
             "entities_added": added_entities,
             "relations_added": added_relations
         }
 
+    def _write_entity_bucket(self, entity_type: str, rows: List[Dict], batch_size: int) -> int:
+        """Écrit les entités d'un label par lots UNWIND; renvoie le nombre écrit."""
+        with self.driver.session() as session:
+            self._ensure_name_index(session, entity_type)
+            return self._write_batches(session, f"""
+                UNWIND $rows AS row
+                MERGE (e:{entity_type} {{name: row.name}})
+                SET e.source = row.source,
+                    e.updated_at = datetime()
+            """, rows, batch_size, f"entités {entity_type}")
+
+    def _write_relation_bucket(self, relation_type: str, rows: List[Dict], batch_size: int) -> int:
+        """Écrit les relations d'un type par lots UNWIND; renvoie le nombre écrit."""
+        with self.driver.session() as session:
+            # execute_write rejoue la transaction en cas de deadlock
+            # entre threads sur des noeuds communs
+            return self._write_batches(session, f"""
+                UNWIND $rows AS row
+                MATCH (s {{name: row.source}})
+                MATCH (t {{name: row.target}})
+                MERGE (s)-[r:{relation_type}]->(t)
+                SET r.updated_at = datetime()
+            """, rows, batch_size, f"relations {relation_type}")
+
+    def _write_batches(self, session, query: str, rows: List[Dict], batch_size: int, label: str) -> int:
+        """
+        Exécute une requête UNWIND par lots. Un lot en échec est rejoué ligne
+        par ligne: seules les lignes fautives sont abandonnées (et loguées).
+        Renvoie le nombre de lignes écrites.
+        """
+        added = 0
+        for batch in self._batches(rows, batch_size):
+            try:
+                session.execute_write(self._write_rows, query, batch)
+                added += len(batch)
+                continue
+            except Exception as e:
+                logger.warning("⚠ Lot de %s %s en échec (%s), écriture ligne par ligne", len(batch), label, e)
+
+            for row in batch:
+                try:
+                    session.execute_write(self._write_rows, query, [row])
+                    added += 1
+                except Exception as e:
+                    logger.warning("✗ %s ignorée %s: %s", label, row, e)
+        return added
+
+    def _ensure_name_index(self, session, label: str):
+        """Index sur name pour un label d'entité, créé une seule fois par label."""
+        if label in self._indexed_labels:
+            return
+
+        try:
+            session.run(f"CREATE INDEX IF NOT EXISTS FOR (e:{label}) ON (e.name)")
+            self._indexed_labels.add(label)
+        except Exception:
+            pass  # Label invalide: le MERGE échouera de toute façon
+
+    @staticmethod
+    def _write_rows(tx, query: str, rows: List[Dict]):
+        """Fonction de transaction d'écriture pour une requête UNWIND."""
+        tx.run(query, rows=rows).consume()
+
+    @staticmethod
+    def _single(tx, query: str, **params):
+        """Fonction de transaction de lecture renvoyant un seul record."""
+        return tx.run(query, **params).single()
+
+    @staticmethod
+    def _batches(rows: List[Dict], size: int):
+        """Découpe une liste en lots de taille fixe."""
+        for i in range(0, len(rows), size):
+            yield rows[i:i + size]
+
     def close(self):
-        """Ferme la connexion Neo4j."""
-        if self.driver:
-            self.driver.close()
+        """
+        Arrête le pool de recherche. Le driver Neo4j est partagé entre les
+        agents et n'est pas fermé ici (voir neo4j_driver.close_drivers).
+        """
+        self._retrieval_executor.shutdown(wait=False)
@@ -1,32 +1,118 @@
 import ollama
-from typing import Dict
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+
+# Prompts par section: (libellé, consigne, format de sortie)
+_SECTION_PROMPTS = {
+    "business": (
+        "Business",
+        """You are a financial analyst. Summarize the business description of {ticker} from their 10-K filing.
+
+Extract and structure:
+1. Main business activities and revenue streams
+2. Key products/services
+3. Target markets
+4. Competitive position
+5. Recent developments""",
+        "Provide a clear, structured summary (200 words max):"
+    ),
+    "risk": (
+        "Risk",
+        """You are a financial analyst. Summarize the TOP 5 most material risk factors for {ticker} from their 10-K.
+
+Identify:
+1. Market/industry risks
+2. Operational risks
+3. Financial risks
+4. Regulatory risks
+5. Strategic risks""",
+        "Provide a numbered list of the 5 most critical risks (200 words max):"
+    ),
+    "mda": (
+        "MD&A",
+        """You are a financial analyst. Summarize the Management Discussion & Analysis for {ticker}.
+
+Extract key insights on:
+1. Financial performance trends
+2. Revenue drivers
+3. Profitability analysis
+4. Liquidity and capital
+5. Forward outlook""",
+        "Provide a structured summary (200 words max):"
+    ),
+}
+
+# Découpage des sections longues (map-reduce): taille et recouvrement des morceaux
+CHUNK_CHARS = 8000
+CHUNK_OVERLAP = 500
+CHUNK_WORKERS = 4
+
+_CHUNK_PROMPT = """You are a financial analyst. Below is an excerpt of the {label} section of the 10-K filing of {ticker}.
+
+Extract the key facts of this excerpt relevant to:
+{focus}
+
+Excerpt:
+{text}
+
+Provide the key facts only, as short bullet points (120 words max):"""
+
+# Marqueurs de la réponse combinée (une synthèse par section)
+_MARKERS = {"business": "BUSINESS", "risk": "RISK", "mda": "MDA"}
+_BLOCK_RE = re.compile(r"<<(BUSINESS|RISK|MDA)>>\s*(.*?)\s*<<END>>", re.DOTALL)
 
 
 class LLMSynthesisAgent:
     """Agent pour synthétiser les sections 10-K avec Ollama."""
-    
-    def __init__(self, model: str = "llama3.2"):
+
+    def __init__(self, model: str = "llama3.2", keep_alive: str = "1h", warm_up: bool = True):
         self.model = model
+
+        # Durée pendant laquelle Ollama garde le modèle chargé entre deux appels
+        self.keep_alive = keep_alive
+
+        # Client HTTP persistant, partagé par les threads de synthèse
+        self.client = ollama.Client()
+
+        if warm_up:
+            self._warm_up()
+
         print(f"✓ LLM Synthesis Agent initialisé (modèle: {model})")
-    
+
+    def _warm_up(self):
+        """Charge le modèle dans Ollama (1 token) avant la première synthèse."""
+        try:
+            self.client.generate(
+                model=self.model,
+                prompt=" ",
+                options={"num_predict": 1},
+                keep_alive=self.keep_alive
+            )
+        except Exception as e:
+            print(f"⚠ Préchargement du modèle impossible: {e}")
+
     def synthesize(self, sections_data: Dict) -> Dict:
         """
-        Synthétise les sections parsées.
-        
+        Synthétise les sections parsées, en un seul appel LLM (_synthesize_all).
+        Les sections que la réponse combinée ne couvre pas sont synthétisées
+        séparément, en parallèle (OLLAMA_NUM_PARALLEL>=3 côté serveur).
+
         Args:
             sections_data: Output de SECFilingAgent
-        
+
         Returns:
             Dict avec les synthèses
         """
         if "error" in sections_data:
             return sections_data
-        
+
         ticker = sections_data["ticker"]
         sections = sections_data["sections"]
-        
+
         print(f"\n🤖 Synthèse LLM pour {ticker}...")
-        
+
         result = {
             "ticker": ticker,
             "cik": sections_data.get("cik"),
@@ -34,114 +120,178 @@ class LLMSynthesisAgent:
             "syntheses": {},
             "raw_sections": sections  # Garder le texte brut
         }
-        
-        # Synthétiser chaque section
-        if "business" in sections and sections["business"] != "Erreur extraction":
-            result["syntheses"]["business_summary"] = self._synthesize_business(
-                sections["business"], ticker
-            )
-        
-        if "risk" in sections and sections["risk"] != "Erreur extraction":
-            result["syntheses"]["risk_summary"] = self._synthesize_risk(
-                sections["risk"], ticker
-            )
-        
-        if "mda" in sections and sections["mda"] != "Erreur extraction":
-            result["syntheses"]["mda_summary"] = self._synthesize_mda(
-                sections["mda"], ticker
-            )
-        
+
+        # Sections exploitables, dans l'ordre business / risk / mda
+        kinds = [
+            kind for kind in _SECTION_PROMPTS
+            if kind in sections and sections[kind] != "Erreur extraction"
+        ]
+
+        if not kinds:
+            return result
+
+        # Sections longues résumées par morceaux (map), au lieu d'être tronquées
+        texts = self._condense({kind: sections[kind] for kind in kinds}, ticker)
+
+        # Un seul appel LLM pour toutes les sections (reduce)
+        summaries = self._synthesize_all(texts, ticker)
+
+        # Section absente de la réponse combinée: synthèse dédiée (en parallèle)
+        missing = [kind for kind in kinds if kind not in summaries]
+        if missing:
+            with ThreadPoolExecutor(max_workers=len(missing)) as executor:
+                for kind, summary in zip(missing, executor.map(
+                    lambda kind: self._synthesize(kind, texts[kind], ticker), missing
+                )):
+                    summaries[kind] = summary
+
+        for kind in kinds:
+            result["syntheses"][f"{kind}_summary"] = summaries[kind]
+
         return result
-    
-    def _synthesize_business(self, text: str, ticker: str) -> str:
-        """Synthétise la section Business."""
-        print(f"  🔄 Synthèse Business...")
-        
-        # Limiter la taille (Ollama context limit)
-        if len(text) > 15000:
-            text = text[:15000] + "..."
-        
-        prompt = f"""You are a financial analyst. Summarize the business description of {ticker} from their 10-K filing.
 
-Extract and structure:
-1. Main business activities and revenue streams
-2. Key products/services
-3. Target markets
-4. Competitive position
-5. Recent developments
+    def _condense(self, sections: Dict[str, str], ticker: str, max_chars: int = 5000) -> Dict[str, str]:
+        """
+        Réduit les sections plus longues que max_chars: chaque morceau est
+        résumé (appels en parallèle), puis les résumés partiels remplacent le
+        texte; répété tant que le résultat dépasse max_chars.
 
-Text:
-{text}
+        Args:
+            sections: Textes par section (business, risk, mda)
+            ticker: Le ticker
+            max_chars: Taille visée par section (celle du prompt combiné)
+
+        Returns:
+            Textes par section, résumés partiels pour les sections longues
+        """
+        texts = dict(sections)
+        long_kinds = [kind for kind, text in texts.items() if len(text) > max_chars]
+
+        with ThreadPoolExecutor(max_workers=CHUNK_WORKERS) as executor:
+            while long_kinds:
+                print(f"  🔄 Résumé par morceaux ({', '.join(long_kinds)})...")
+
+                chunks = {kind: self._chunk(texts[kind]) for kind in long_kinds}
+                futures = {
+                    kind: [executor.submit(self._summarize_chunk, kind, chunk, ticker) for chunk in kind_chunks]
+                    for kind, kind_chunks in chunks.items()
+                }
+
+                next_kinds = []
+                for kind in long_kinds:
+                    partials = [f.result() for f in futures[kind]]
+                    condensed = "\n".join(partial for partial in partials if partial)
+
+                    # Échec des appels ou pas de réduction: garder le texte (tronqué ensuite)
+                    if not condensed or len(condensed) >= len(texts[kind]):
+                        continue
+
+                    print(f"  ✓ {kind}: {len(texts[kind])} → {len(condensed)} chars ({len(partials)} morceaux)")
+                    texts[kind] = condensed
+                    if len(condensed) > max_chars:
+                        next_kinds.append(kind)
+
+                long_kinds = next_kinds
+
+        return texts
+
+    def _chunk(self, text: str, size: int = CHUNK_CHARS, overlap: int = CHUNK_OVERLAP) -> List[str]:
+        """Découpe un texte en morceaux de size caractères qui se recouvrent."""
+        step = size - overlap
+        return [text[start:start + size] for start in range(0, max(len(text) - overlap, 1), step)]
+
+    def _summarize_chunk(self, kind: str, text: str, ticker: str) -> str:
+        """Résumé des faits clés d'un morceau de section ("" en cas d'erreur)."""
+        label, instructions, _ = _SECTION_PROMPTS[kind]
+        focus = instructions.format(ticker=ticker).split("\n\n", 1)[1]
+
+        prompt = _CHUNK_PROMPT.format(label=label, ticker=ticker, focus=focus, text=text)
 
-Provide a clear, structured summary (200 words max):"""
-        
         try:
-            response = ollama.generate(model=self.model, prompt=prompt)
-            summary = response['response'].strip()
-            print(f"  ✓ Business synthétisé ({len(summary)} chars)")
-            return summary
+            response = self.client.generate(model=self.model, prompt=prompt, keep_alive=self.keep_alive)
+            return response['response'].strip()
         except Exception as e:
             print(f"  ✗ Erreur: {e}")
-            return f"Erreur synthèse: {e}"
-    
-    def _synthesize_risk(self, text: str, ticker: str) -> str:
-        """Synthétise les Risk Factors."""
-        print(f"  🔄 Synthèse Risk Factors...")
-        
-        if len(text) > 15000:
-            text = text[:15000] + "..."
-        
-        prompt = f"""You are a financial analyst. Summarize the TOP 5 most material risk factors for {ticker} from their 10-K.
+            return ""
 
-Identify:
-1. Market/industry risks
-2. Operational risks
-3. Financial risks
-4. Regulatory risks
-5. Strategic risks
+    def _synthesize_all(self, sections: Dict[str, str], ticker: str, max_chars: int = 5000) -> Dict[str, str]:
+        """
+        Synthétise toutes les sections en une seule génération: un aller-retour
+        et un seul prefill des consignes au lieu d'un appel par section.
 
-Text:
-{text}
+        Args:
+            sections: Textes par section (business, risk, mda)
+            ticker: Le ticker
+            max_chars: Taille max de chaque section dans le prompt
+
+        Returns:
+            Synthèses par section (sections manquantes dans la réponse omises)
+        """
+        print(f"  🔄 Synthèse combinée ({', '.join(sections)})...")
+
+        prompt = self._combined_prompt(sections, ticker, max_chars)
 
-Provide a numbered list of the 5 most critical risks (200 words max):"""
-        
         try:
-            response = ollama.generate(model=self.model, prompt=prompt)
-            summary = response['response'].strip()
-            print(f"  ✓ Risk synthétisé ({len(summary)} chars)")
-            return summary
+            response = self.client.generate(model=self.model, prompt=prompt, keep_alive=self.keep_alive)
         except Exception as e:
             print(f"  ✗ Erreur: {e}")
-            return f"Erreur synthèse: {e}"
-    
-    def _synthesize_mda(self, text: str, ticker: str) -> str:
-        """Synthétise la section MD&A."""
-        print(f"  🔄 Synthèse MD&A...")
-        
+            return {}
+
+        by_marker = {
+            marker: summary for marker, summary in _BLOCK_RE.findall(response['response'])
+            if summary
+        }
+        summaries = {
+            kind: by_marker[_MARKERS[kind]]
+            for kind in sections if _MARKERS[kind] in by_marker
+        }
+
+        print(f"  ✓ {len(summaries)}/{len(sections)} sections synthétisées")
+        return summaries
+
+    def _combined_prompt(self, sections: Dict[str, str], ticker: str, max_chars: int) -> str:
+        """Prompt combiné: textes délimités par section, puis consignes par section."""
+        parts = [f"You are a financial analyst. Below are sections of the 10-K filing of {ticker}."]
+
+        for kind, text in sections.items():
+            if len(text) > max_chars:
+                text = text[:max_chars] + "..."
+            parts.append(f"### {_MARKERS[kind]}\n{text}")
+
+        parts.append("Write one summary per section, each between its markers, exactly like:")
+        parts.append("\n".join(
+            f"<<{_MARKERS[kind]}>>\n...\n<<END>>" for kind in sections
+        ))
+
+        for kind in sections:
+            _, instructions, output_format = _SECTION_PROMPTS[kind]
+            # Consigne de la section sans la phrase d'introduction
+            focus = instructions.format(ticker=ticker).split("\n\n", 1)[1]
+            parts.append(f"{_MARKERS[kind]} summary:\n{focus}\n{output_format}")
+
+        return "\n\n".join(parts)
+
+    def _synthesize(self, kind: str, text: str, ticker: str) -> str:
+        """Synthétise une section (business, risk ou mda)."""
+        label, instructions, output_format = _SECTION_PROMPTS[kind]
+        print(f"  🔄 Synthèse {label}...")
+
+        # Limiter la taille (Ollama context limit)
         if len(text) > 15000:
             text = text[:15000] + "..."
-        
-        prompt = f"""You are a financial analyst. Summarize the Management Discussion & Analysis for {ticker}.
 
-Extract key insights on:
-1. Financial performance trends
-2. Revenue drivers
-3. Profitability analysis
-4. Liquidity and capital
-5. Forward outlook
+        prompt = f"""{instructions.format(ticker=ticker)}
 
 Text:
 {text}
 
-Provide a structured summary (200 words max):"""
-        
+{output_format}"""
+
         try:
-            response = ollama.generate(model=self.model, prompt=prompt)
+            response = self.client.generate(model=self.model, prompt=prompt, keep_alive=self.keep_alive)
             summary = response['response'].strip()
-            print(f"  ✓ MD&A synthétisé ({len(summary)} chars)")
+            print(f"  ✓ {label} synthétisé ({len(summary)} chars)")
             return summary
         except Exception as e:
             print(f"  ✗ Erreur: {e}")
             return f"Erreur synthèse: {e}"
-
-
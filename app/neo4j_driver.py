@@ -0,0 +1,59 @@
+# app/neo4j_driver.py
+"""
+Driver Neo4j partagé.
+Un seul pool de connexions Bolt par identifiants pour tout le process,
+réutilisé par GraphAgent et GraphRAGAgent.
+"""
+
+import hashlib
+import os
+import threading
+from typing import Dict, Tuple
+
+from neo4j import GraphDatabase, Driver
+
+
+MAX_CONNECTION_POOL_SIZE = int(os.getenv("NEO4J_POOL_SIZE", "50"))
+CONNECTION_ACQUISITION_TIMEOUT = 30  # secondes
+
+# (uri, user, empreinte SHA-256 du mot de passe) -> driver: un mot de passe
+# différent ne réutilise pas un pool authentifié avec un autre
+_drivers: Dict[Tuple[str, str, str], Driver] = {}
+_drivers_lock = threading.Lock()
+
+
+def get_driver(
+    uri: str = "bolt://localhost:7687",
+    user: str = "neo4j",
+    password: str = "Caluboss18"
+) -> Driver:
+    """
+    Retourne le driver partagé pour (uri, user, password), créé au premier appel.
+
+    Args:
+        uri: URI de connexion Neo4j
+        user: Username
+        password: Password
+    """
+    key = (uri, user, hashlib.sha256(password.encode("utf-8")).hexdigest())
+
+    with _drivers_lock:
+        driver = _drivers.get(key)
+        if driver is None:
+            driver = GraphDatabase.driver(
+                uri,
+                auth=(user, password),
+                max_connection_pool_size=MAX_CONNECTION_POOL_SIZE,
+                connection_acquisition_timeout=CONNECTION_ACQUISITION_TIMEOUT,
+                keep_alive=True
+            )
+            _drivers[key] = driver
+        return driver
+
+
+def close_drivers():
+    """Ferme tous les drivers partagés (arrêt du process)."""
+    with _drivers_lock:
+        for driver in _drivers.values():
+            driver.close()
+        _drivers.clear()
@@ -0,0 +1,203 @@
+# app/qa_cache.py
+"""
+Cache sémantique des réponses GraphRAG QA.
+Une question dont l'embedding est assez proche (cosinus) d'une question déjà
+traitée, avec les mêmes paramètres, renvoie directement la réponse stockée.
+
+Avec un répertoire de persistance, le cache est partagé entre processus
+(workers gunicorn) par une génération écrite sur disque: clear() la change,
+et chaque processus vide son cache mémoire dès qu'il voit une génération
+différente de la sienne.
+
+Le cache persisté n'est rechargé que pour le même modèle d'embeddings et
+la même dimension: les questions d'un autre espace ne sont pas comparables.
+"""
+
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+import numpy as np
+import orjson
+
+
+class SemanticQACache:
+    """Index plat en produit scalaire (embeddings normalisés) des questions passées."""
+
+    def __init__(
+        self,
+        threshold: float = 0.95,
+        max_entries: int = 1000,
+        cache_dir: Optional[str] = None,
+        dumps: Callable[[object], bytes] = orjson.dumps,
+        embedding_model: str = ""
+    ):
+        """
+        Args:
+            threshold: Similarité cosinus minimale pour un hit
+            max_entries: Nombre max de questions gardées (FIFO)
+            cache_dir: Répertoire de persistance (None = mémoire seulement)
+            dumps: Sérialisation JSON des réponses persistées (ex: to_json de l'API)
+            embedding_model: Modèle des embeddings de questions (cache
+                persisté d'un autre modèle ignoré)
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self._dumps = dumps
+        self.embedding_model = embedding_model
+
+        self._vectors = None   # np.ndarray [N, dim], lignes normalisées
+        self._entries = []     # [{"params": {...}, "result": {...}}]
+        self._lock = threading.Lock()
+        self._generation = self._disk_generation()
+        self.stats = {"hits": 0, "misses": 0}
+
+        if self.cache_dir:
+            self.load()
+
+    def get(self, query_vector: np.ndarray, params: Dict) -> Optional[Dict]:
+        """Retourne la réponse d'une question similaire, ou None."""
+        generation = self._disk_generation()
+
+        with self._lock:
+            self._sync_generation(generation)
+            self._sync_dim(len(query_vector))
+
+            if self._entries:
+                scores = self._vectors @ query_vector
+                for idx in np.argsort(scores)[::-1]:
+                    if scores[idx] < self.threshold:
+                        break
+                    if self._entries[idx]["params"] == params:
+                        self.stats["hits"] += 1
+                        return self._entries[idx]["result"]
+
+            self.stats["misses"] += 1
+            return None
+
+    def add(self, query_vector: np.ndarray, params: Dict, result: Dict):
+        """Enregistre la réponse d'une question."""
+        row = np.asarray(query_vector, dtype=np.float32)[None, :]
+        generation = self._disk_generation()
+
+        with self._lock:
+            self._sync_generation(generation)
+            self._sync_dim(row.shape[1])
+
+            if self._vectors is None:
+                self._vectors = row
+            else:
+                if len(self._entries) >= self.max_entries:
+                    self._vectors = self._vectors[1:]
+                    self._entries = self._entries[1:]
+                self._vectors = np.vstack([self._vectors, row])
+
+            self._entries.append({"params": params, "result": result})
+
+    def clear(self):
+        """
+        Vide le cache (à appeler quand le graphe ou le vector store change),
+        dans ce processus et, via la génération sur disque, dans les autres.
+        """
+        with self._lock:
+            self._vectors = None
+            self._entries = []
+
+            if self.cache_dir:
+                self._generation = str(time.time_ns())
+                self._write_atomic(self.cache_dir / "generation", self._generation.encode())
+
+    def save(self):
+        """
+        Persiste le cache sur disque (un seul fichier, remplacé atomiquement).
+        Rien n'est écrit si un autre processus a vidé le cache entre-temps;
+        les réponses non sérialisables sont ignorées.
+        """
+        if not self.cache_dir:
+            return
+
+        generation = self._disk_generation()
+
+        with self._lock:
+            if generation != self._generation or not self._entries:
+                return
+
+            rows, blobs = [], []
+            for row, entry in enumerate(self._entries):
+                try:
+                    blobs.append(self._dumps(entry))
+                    rows.append(row)
+                except TypeError:
+                    continue
+
+            entries = np.frombuffer(b"[" + b",".join(blobs) + b"]", dtype=np.uint8)
+            tmp_file = self.cache_dir / f"cache.{os.getpid()}.tmp.npz"
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            np.savez(
+                tmp_file,
+                vectors=self._vectors[rows],
+                entries=entries,
+                generation=np.array(self._generation or ""),
+                embedding_model=np.array(self.embedding_model),
+                dim=np.array(self._vectors.shape[1])
+            )
+            os.replace(tmp_file, self.cache_dir / "cache.npz")
+
+    def load(self):
+        """
+        Recharge le cache persisté (silencieux si absent, illisible, périmé
+        ou écrit avec un autre modèle / une autre dimension).
+        """
+        try:
+            with np.load(self.cache_dir / "cache.npz") as data:
+                generation = str(data["generation"])
+                entries = orjson.loads(data["entries"].tobytes())
+                vectors = data["vectors"]
+                embedding_model = str(data["embedding_model"])
+                dim = int(data["dim"])
+        except (OSError, ValueError, KeyError):
+            return
+
+        # Autre espace d'embeddings: questions non comparables
+        if embedding_model != self.embedding_model or vectors.ndim != 2 or vectors.shape[1] != dim:
+            return
+
+        # Cache écrit avant le dernier clear() d'un processus: ignoré
+        if generation != (self._generation or ""):
+            return
+
+        if entries and len(entries) == len(vectors):
+            self._entries = entries
+            self._vectors = vectors
+
+    def _disk_generation(self) -> Optional[str]:
+        """Génération courante sur disque (None si jamais vidé ou sans persistance)."""
+        if not self.cache_dir:
+            return None
+        try:
+            return (self.cache_dir / "generation").read_text()
+        except OSError:
+            return None
+
+    def _sync_generation(self, generation: Optional[str]):
+        """Vide le cache mémoire si un autre processus l'a vidé (appelant: _lock tenu)."""
+        if generation != self._generation:
+            self._vectors = None
+            self._entries = []
+            self._generation = generation
+
+    def _sync_dim(self, dim: int):
+        """Vide le cache mémoire si ses vecteurs n'ont pas la dimension des questions (appelant: _lock tenu)."""
+        if self._vectors is not None and self._vectors.shape[1] != dim:
+            self._vectors = None
+            self._entries = []
+
+    def _write_atomic(self, path: Path, data: bytes):
+        """Écrit un fichier via un fichier temporaire puis os.replace."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp_file.write_bytes(data)
+        os.replace(tmp_file, path)
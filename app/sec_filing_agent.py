@@ -1,10 +1,51 @@
+import bisect
 import re
 import unicodedata
-from bs4 import BeautifulSoup as bs
+from selectolax.parser import HTMLParser
 import requests
-from typing import Dict, Optional
+from requests.adapters import HTTPAdapter
+from typing import Dict, List, Optional
 from datetime import datetime
-import json
+from pathlib import Path
+import orjson
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+# Mapping ticker -> CIK de la SEC, persisté localement
+TICKERS_URL = "https://www.sec.gov/files/company_tickers.json"
+TICKERS_CACHE_FILE = Path.home() / ".cache" / "sec_tickers.json"
+TICKERS_CACHE_TTL = 7 * 24 * 3600  # secondes
+
+# Limite de débit de la SEC (requêtes par seconde, toutes requêtes confondues)
+SEC_MAX_REQUESTS_PER_SECOND = 10
+
+# Normalisation des blancs du texte des 10-K
+_WS_TABLE = str.maketrans({"\n": " ", "\r": " ", "\t": " "})
+
+# Candidats "Item N": un seul balayage du texte du 10-K
+_ITEM_RE = re.compile(r"item\s*[1278]", re.IGNORECASE)
+
+# Bornes de sections, testées uniquement aux positions candidates
+# (une même position peut borner plusieurs sections, ex: "Item 1A. Risk")
+_BOUNDARY_PATTERNS = {
+    "item1_start": re.compile(r"item\s*[1][\.\;\:\-\_]*\s*\b", re.IGNORECASE),
+    "item1_end": re.compile(r"item\s*1a[\.\;\:\-\_]\s*Risk|item\s*2[\.\,\;\:\-\_]\s*Prop", re.IGNORECASE),
+    "item1a_start": re.compile(r"(?<!,\s)item\s*1a[\.\;\:\-\_]\s*Risk", re.IGNORECASE),
+    "item1a_end": re.compile(r"item\s*2[\.\;\:\-\_]\s*Prop", re.IGNORECASE),
+    "item7_start": re.compile(r"item\s*[7][\.\;\:\-\_]*\s*\bM", re.IGNORECASE),
+    "item7_end": re.compile(r"item\s*7a[\.\;\:\-\_]\sQuanti|item\s*8[\.\,\;\:\-\_]\s*", re.IGNORECASE),
+}
+
+# Sections extraites: numéro -> (clé, libellé, borne de début, borne de fin)
+_SECTIONS = {
+    1: ("business", "Business", "item1_start", "item1_end"),  # Item 1
+    2: ("risk", "Risk", "item1a_start", "item1a_end"),  # Item 1A
+    3: ("mda", "MD&A", "item7_start", "item7_end"),  # Item 7
+}
 
 
 class SECParserAgent:
@@ -19,6 +60,22 @@ class SECParserAgent:
             'Accept-Encoding': 'gzip, deflate',
         }
         self.base_url = "https://data.sec.gov"
+        
+        # Session persistante: connexions TCP/TLS réutilisées entre les appels SEC
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.mount('https://', HTTPAdapter(pool_connections=8, pool_maxsize=8))
+        
+        # Ticker (majuscules) -> CIK, chargé au premier besoin
+        self._ticker_map: Optional[Dict[str, str]] = None
+        self._ticker_map_lock = threading.Lock()
+        
+        # CIK déjà résolus (succès uniquement)
+        self._cik_cache: Dict[str, str] = {}
+        
+        # Espacement des requêtes (partagé entre threads)
+        self._rate_lock = threading.Lock()
+        self._next_request_at = 0.0
     
     def get_10k_sections(self, ticker: str, section: int = 0) -> Dict:
         """
@@ -54,29 +111,69 @@ class SECParserAgent:
             "retrieved_at": datetime.now().isoformat()
         }
     
+    def get_10k_sections_batch(
+        self,
+        tickers: List[str],
+        section: int = 0,
+        max_workers: int = 8
+    ) -> Dict[str, Dict]:
+        """
+        Télécharge et parse les 10-K de plusieurs tickers en parallèle
+        (I/O réseau), dans la limite de débit de la SEC.
+        
+        Args:
+            tickers: Liste de tickers
+            section: 0=All, 1=Business, 2=Risk, 3=MD&A
+            max_workers: Nombre de tickers traités simultanément
+        
+        Returns:
+            Dict ticker -> résultat (format get_10k_sections)
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(self.get_10k_sections, ticker, section): ticker
+                for ticker in tickers
+            }
+            results = {futures[f]: f.result() for f in as_completed(futures)}
+        
+        errors = sum(1 for data in results.values() if "error" in data)
+        print(f"✓ {len(results) - errors}/{len(results)} 10-K récupérés")
+        return results
+    
+    def _get(self, url: str) -> requests.Response:
+        """GET via la session, espacé pour respecter la limite de débit SEC."""
+        with self._rate_lock:
+            now = time.monotonic()
+            wait = self._next_request_at - now
+            self._next_request_at = max(now, self._next_request_at) + 1 / SEC_MAX_REQUESTS_PER_SECOND
+        if wait > 0:
+            time.sleep(wait)
+        return self.session.get(url)
+    
     def _get_cik(self, ticker: str) -> Optional[str]:
-        """Récupère le CIK via l'API SEC."""
+        """Récupère le CIK (cache mémoire, puis mapping SEC, puis API SEC)."""
+        ticker = ticker.upper()
+        
+        cik = self._cik_cache.get(ticker)
+        if cik:
+            return cik
+        
         try:
-            # API des tickers SEC
-            url = f"{self.base_url}/submissions/CIK{ticker.upper()}.json"
-            response = requests.get(url, headers=self.headers)
+            # Mapping ticker->CIK (lookup O(1))
+            ticker_map = self._get_ticker_map()
+            if ticker_map:
+                cik = ticker_map.get(ticker)
+            else:
+                # Mapping indisponible: API des tickers SEC
+                url = f"{self.base_url}/submissions/CIK{ticker}.json"
+                response = self._get(url)
+                if response.status_code != 404:
+                    cik = str(orjson.loads(response.content)['cik']).zfill(10)
             
-            if response.status_code == 404:
-                # Essayer via le mapping ticker->CIK
-                tickers_url = "https://www.sec.gov/files/company_tickers.json"
-                tickers_response = requests.get(tickers_url, headers=self.headers)
-                tickers_data = tickers_response.json()
-                
-                for entry in tickers_data.values():
-                    if entry['ticker'].upper() == ticker.upper():
-                        cik = str(entry['cik_str']).zfill(10)
-                        print(f"✓ CIK trouvé: {cik}")
-                        return cik
-                
+            if not cik:
                 return None
             
-            data = response.json()
-            cik = str(data['cik']).zfill(10)
+            self._cik_cache[ticker] = cik
             print(f"✓ CIK trouvé: {cik}")
             return cik
             
@@ -84,13 +181,55 @@ class SECParserAgent:
             print(f"✗ Erreur CIK: {e}")
             return None
     
+    def _get_ticker_map(self) -> Optional[Dict[str, str]]:
+        """
+        Mapping ticker -> CIK (10 chiffres) depuis company_tickers.json.
+        Lu depuis le cache disque s'il a moins de 7 jours, sinon téléchargé
+        une fois puis persisté.
+        """
+        with self._ticker_map_lock:
+            if self._ticker_map is not None:
+                return self._ticker_map
+            
+            tickers_data = None
+            try:
+                if time.time() - TICKERS_CACHE_FILE.stat().st_mtime < TICKERS_CACHE_TTL:
+                    with open(TICKERS_CACHE_FILE, 'rb') as f:
+                        tickers_data = orjson.loads(f.read())
+            except (OSError, ValueError):
+                pass  # Cache absent, expiré ou illisible
+            
+            if tickers_data is None:
+                try:
+                    response = self._get(TICKERS_URL)
+                    response.raise_for_status()
+                    tickers_data = orjson.loads(response.content)
+                except Exception as e:
+                    print(f"⚠ Mapping des tickers SEC indisponible: {e}")
+                    return None
+                
+                try:
+                    TICKERS_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+                    tmp_file = TICKERS_CACHE_FILE.with_suffix(".tmp")
+                    with open(tmp_file, 'wb') as f:
+                        f.write(orjson.dumps(tickers_data))
+                    os.replace(tmp_file, TICKERS_CACHE_FILE)
+                except OSError:
+                    pass  # Cache disque facultatif
+            
+            self._ticker_map = {
+                entry['ticker'].upper(): str(entry['cik_str']).zfill(10)
+                for entry in tickers_data.values()
+            }
+            return self._ticker_map
+    
     def _get_latest_10k(self, cik: str) -> Optional[str]:
         """Récupère le dernier 10-K."""
         try:
             # API submissions
             url = f"{self.base_url}/submissions/CIK{cik}.json"
-            response = requests.get(url, headers=self.headers)
-            data = response.json()
+            response = self._get(url)
+            data = orjson.loads(response.content)
             
             # Chercher le dernier 10-K
             recent = data['filings']['recent']
@@ -113,42 +252,22 @@ class SECParserAgent:
     
     def _parse_10k_filing(self, link: str, section: int) -> Dict:
         """Parse le 10-K (ton code original)."""
-        if section not in [0, 1, 2, 3]:
+        if section != 0 and section not in _SECTIONS:
             return {"error": "Section invalide"}
         
         try:
             text = self._get_text(link)
+            positions = self._boundary_positions(text)
             sections = {}
             
-            # Item 1: Business
-            if section == 1 or section == 0:
-                try:
-                    item1_start = re.compile(r"item\s*[1][\.\;\:\-\_]*\s*\b", re.IGNORECASE)
-                    item1_end = re.compile(r"item\s*1a[\.\;\:\-\_]\s*Risk|item\s*2[\.\,\;\:\-\_]\s*Prop", re.IGNORECASE)
-                    sections["business"] = self._extract_text(text, item1_start, item1_end)
-                    print(f"  ✓ Business: {len(sections['business'])} chars")
-                except:
-                    sections["business"] = "Erreur extraction"
-            
-            # Item 1A: Risk
-            if section == 2 or section == 0:
-                try:
-                    item1a_start = re.compile(r"(?<!,\s)item\s*1a[\.\;\:\-\_]\s*Risk", re.IGNORECASE)
-                    item1a_end = re.compile(r"item\s*2[\.\;\:\-\_]\s*Prop", re.IGNORECASE)
-                    sections["risk"] = self._extract_text(text, item1a_start, item1a_end)
-                    print(f"  ✓ Risk: {len(sections['risk'])} chars")
-                except:
-                    sections["risk"] = "Erreur extraction"
-            
-            # Item 7: MD&A
-            if section == 3 or section == 0:
-                try:
-                    item7_start = re.compile(r"item\s*[7][\.\;\:\-\_]*\s*\bM", re.IGNORECASE)
-                    item7_end = re.compile(r"item\s*7a[\.\;\:\-\_]\sQuanti|item\s*8[\.\,\;\:\-\_]\s*", re.IGNORECASE)
-                    sections["mda"] = self._extract_text(text, item7_start, item7_end)
-                    print(f"  ✓ MD&A: {len(sections['mda'])} chars")
-                except:
-                    sections["mda"] = "Erreur extraction"
+            for number, (name, label, start, end) in _SECTIONS.items():
+                if section == number or section == 0:
+                    # Une section introuvable n'empêche pas les autres
+                    try:
+                        sections[name] = self._extract_text(text, positions[start], positions[end])
+                        print(f"  ✓ {label}: {len(sections[name])} chars")
+                    except Exception:
+                        sections[name] = "Erreur extraction"
             
             return sections
             
@@ -157,25 +276,38 @@ class SECParserAgent:
     
     def _get_text(self, link: str) -> str:
         """Récupère le texte du 10-K."""
-        page = requests.get(link, headers=self.headers)
-        html = bs(page.content, "lxml")
-        text = html.get_text()
-        text = unicodedata.normalize("NFKD", text).encode('ascii', 'ignore').decode('utf8')
-        text = text.split("\n")
-        text = " ".join(text)
-        return text
-    
-    def _extract_text(self, text: str, item_start, item_end) -> str:
-        """Extrait une section."""
-        starts = [i.start() for i in item_start.finditer(text)]
-        ends = [i.start() for i in item_end.finditer(text)]
+        page = self._get(link)
         
+        # Parseur C (lexbor): texte extrait sans arbre d'objets Python
+        tree = HTMLParser(page.content)
+        for tag in tree.css('script, style'):
+            tag.decompose()
+        root = tree.body or tree.root
+        text = root.text() if root is not None else ""
+        # Sauts de ligne / tabulations -> espaces en une passe (sans split/join)
+        return unicodedata.normalize("NFKD", text).encode('ascii', 'ignore').decode('ascii').translate(_WS_TABLE)
+    
+    def _boundary_positions(self, text: str) -> Dict[str, List[int]]:
+        """
+        Positions (triées) de chaque borne de section, en un seul passage
+        sur le texte: les motifs ne sont testés qu'aux occurrences de "Item N".
+        """
+        positions = defaultdict(list)
+        for candidate in _ITEM_RE.finditer(text):
+            pos = candidate.start()
+            for name, pattern in _BOUNDARY_PATTERNS.items():
+                if pattern.match(text, pos):
+                    positions[name].append(pos)
+        return positions
+    
+    def _extract_text(self, text: str, starts: List[int], ends: List[int]) -> str:
+        """Extrait une section (la plus longue entre un début et la fin qui le suit)."""
+        # Première fin strictement après chaque début (recherche dichotomique)
         positions = []
         for s in starts:
-            for e in ends:
-                if s < e:
-                    positions.append([s, e])
-                    break
+            idx = bisect.bisect_right(ends, s)
+            if idx < len(ends):
+                positions.append((s, ends[idx]))
         
         if not positions:
             return "Section non trouvée"
@@ -184,7 +316,6 @@ class SECParserAgent:
         best = max(positions, key=lambda p: p[1] - p[0])
         return text[best[0]:best[1]]
 
-
 if __name__ == "__main__":
     agent = SECParserAgent()
     result = agent.get_10k_sections("AAPL", section=1)
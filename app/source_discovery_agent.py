@@ -6,10 +6,13 @@ Supporte: PDF, CSV, Markdown, HTML, TXT, JSON
 
 import os
 import json
+import orjson
 import csv
+import mmap
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, List, Optional
-from bs4 import BeautifulSoup
+from selectolax.parser import HTMLParser
 
 
 class SourceDiscoveryAgent:
@@ -50,15 +53,34 @@ class SourceDiscoveryAgent:
             if source:
                 sources.append(source)
         else:
-            for file_path in path.rglob('*'):
-                if file_path.is_file():
-                    source = self._analyze_file(file_path)
-                    if source:
-                        sources.append(source)
+            self._scan_directory(str(path.absolute()), sources)
 
         print(f"✓ {len(sources)} sources découvertes")
         return sources
 
+    def _scan_directory(self, directory: str, sources: List[Dict]):
+        """
+        Parcourt un répertoire récursivement (os.scandir): extension filtrée
+        avant tout stat(), type de fichier lu depuis l'entrée de répertoire.
+        """
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    self._scan_directory(entry.path, sources)
+                    continue
+
+                ext = os.path.splitext(entry.name)[1].lower()
+                if ext not in self.SUPPORTED_EXTENSIONS or not entry.is_file():
+                    continue
+
+                sources.append({
+                    "path": entry.path,
+                    "name": entry.name,
+                    "type": self.SUPPORTED_EXTENSIONS[ext],
+                    "size": entry.stat().st_size,
+                    "extension": ext
+                })
+
     def _analyze_file(self, file_path: Path) -> Optional[Dict]:
         """Analyse un fichier et retourne ses métadonnées."""
         ext = file_path.suffix.lower()
@@ -108,7 +130,52 @@ class SourceDiscoveryAgent:
             return {"error": str(e)}
 
     def _ingest_csv(self, file_path: str) -> Dict:
-        """Ingère un fichier CSV."""
+        """
+        Ingère un fichier CSV.
+        Parsing en colonnes par pyarrow (code natif), sinon csv.DictReader.
+        """
+        try:
+            import pyarrow as pa
+            import pyarrow.csv as pacsv
+        except ImportError:
+            return self._ingest_csv_rows(file_path)
+
+        # En-tête lu à part: toutes les colonnes en texte, comme DictReader
+        with open(file_path, 'r', encoding='utf-8', errors='ignore', newline='') as f:
+            headers = next(csv.reader(f), [])
+
+        try:
+            table = pacsv.read_csv(
+                file_path,
+                convert_options=pacsv.ConvertOptions(
+                    column_types={name: pa.string() for name in headers}
+                )
+            )
+        except pa.ArrowException:
+            # UTF-8 invalide, lignes de longueur variable...: parseur Python
+            return self._ingest_csv_rows(file_path)
+
+        rows = table.to_pylist()
+        names = table.column_names
+        columns = [column.to_pylist() for column in table.columns]
+
+        # Convertir les lignes en texte pour le RAG
+        text_content = [
+            " | ".join([f"{k}: {v}" for k, v in zip(names, values) if v])
+            for values in zip(*columns)
+        ]
+
+        return {
+            "type": "csv",
+            "path": file_path,
+            "headers": headers,
+            "row_count": len(rows),
+            "data": rows,
+            "text_content": "\n".join(text_content)  # Pour embeddings
+        }
+
+    def _ingest_csv_rows(self, file_path: str) -> Dict:
+        """Ingère un fichier CSV ligne par ligne (csv.DictReader)."""
         rows = []
         text_content = []
 
@@ -132,26 +199,25 @@ class SourceDiscoveryAgent:
 
     def _ingest_markdown(self, file_path: str) -> Dict:
         """Ingère un fichier Markdown."""
-        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            content = f.read()
+        content = self._read_text(file_path)
 
         # Extraire les sections (headers)
         sections = []
-        current_section = {"title": "Introduction", "content": ""}
+        current_section = {"title": "Introduction"}
+        current_lines = []
 
         for line in content.split('\n'):
             if line.startswith('#'):
-                if current_section["content"].strip():
-                    sections.append(current_section)
+                self._close_section(current_section, current_lines, sections)
                 # Nouveau header
                 level = len(line) - len(line.lstrip('#'))
                 title = line.lstrip('#').strip()
-                current_section = {"title": title, "level": level, "content": ""}
+                current_section = {"title": title, "level": level}
+                current_lines = []
             else:
-                current_section["content"] += line + "\n"
+                current_lines.append(line)
 
-        if current_section["content"].strip():
-            sections.append(current_section)
+        self._close_section(current_section, current_lines, sections)
 
         return {
             "type": "markdown",
@@ -160,22 +226,28 @@ class SourceDiscoveryAgent:
             "text_content": content
         }
 
+    def _close_section(self, section: Dict, lines: List[str], sections: List[Dict]):
+        """Termine une section Markdown (un seul join) et la garde si non vide."""
+        section["content"] = "".join(line + "\n" for line in lines)
+        if section["content"].strip():
+            sections.append(section)
+
     def _ingest_html(self, file_path: str) -> Dict:
         """Ingère un fichier HTML."""
-        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            content = f.read()
-
-        soup = BeautifulSoup(content, 'html.parser')
+        # Octets passés tels quels au parseur (pas de str Python intermédiaire)
+        tree = HTMLParser(self._read_bytes(file_path))
 
         # Supprimer scripts et styles
-        for script in soup(['script', 'style', 'nav', 'footer', 'header']):
-            script.decompose()
+        for tag in tree.css('script, style, nav, footer, header'):
+            tag.decompose()
 
         # Extraire le texte
-        text = soup.get_text(separator='\n', strip=True)
+        root = tree.body or tree.root
+        text = root.text(separator='\n', strip=True) if root is not None else ""
 
         # Extraire le titre
-        title = soup.title.string if soup.title else "Sans titre"
+        title_node = tree.css_first('title')
+        title = title_node.text(strip=True) if title_node else "Sans titre"
 
         return {
             "type": "html",
@@ -186,8 +258,7 @@ class SourceDiscoveryAgent:
 
     def _ingest_text(self, file_path: str) -> Dict:
         """Ingère un fichier texte."""
-        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            content = f.read()
+        content = self._read_text(file_path)
 
         return {
             "type": "text",
@@ -195,10 +266,32 @@ class SourceDiscoveryAgent:
             "text_content": content
         }
 
+    def _read_bytes(self, file_path: str) -> bytes:
+        """Contenu d'un fichier via mmap (lecture depuis le page cache de l'OS)."""
+        with open(file_path, 'rb') as f:
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    return mm[:]
+            except ValueError:
+                return b""  # Fichier vide: mmap impossible
+
+    def _read_text(self, file_path: str) -> str:
+        """Texte UTF-8 d'un fichier, fins de ligne normalisées comme open('r')."""
+        data = self._read_bytes(file_path)
+        if b"\r" in data:
+            data = data.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+        return data.decode('utf-8', errors='ignore')
+
     def _ingest_json(self, file_path: str) -> Dict:
         """Ingère un fichier JSON."""
-        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            data = json.load(f)
+        with open(file_path, 'rb') as f:
+            content = f.read()
+
+        try:
+            data = orjson.loads(content)
+        except orjson.JSONDecodeError:
+            # UTF-8 invalide ou NaN/Infinity: parseur standard, plus tolérant
+            data = json.loads(content.decode('utf-8', errors='ignore'))
 
         # Convertir en texte pour les embeddings
         text_content = self._json_to_text(data)
@@ -213,32 +306,65 @@ class SourceDiscoveryAgent:
     def _json_to_text(self, data, prefix="") -> str:
         """Convertit un JSON en texte lisible."""
         lines = []
+        self._json_lines(data, prefix, lines)
+        return "\n".join(lines)
 
+    def _json_lines(self, data, prefix: str, lines: List[str]):
+        """Ajoute les lignes de texte d'un JSON à lines (un seul join final)."""
         if isinstance(data, dict):
             for key, value in data.items():
                 if isinstance(value, (dict, list)):
                     lines.append(f"{prefix}{key}:")
-                    lines.append(self._json_to_text(value, prefix + "  "))
+                    self._json_nested(value, prefix + "  ", lines)
                 else:
                     lines.append(f"{prefix}{key}: {value}")
         elif isinstance(data, list):
             for i, item in enumerate(data):
                 if isinstance(item, (dict, list)):
                     lines.append(f"{prefix}[{i}]:")
-                    lines.append(self._json_to_text(item, prefix + "  "))
+                    self._json_nested(item, prefix + "  ", lines)
                 else:
                     lines.append(f"{prefix}- {item}")
         else:
             lines.append(f"{prefix}{data}")
 
-        return "\n".join(lines)
+    def _json_nested(self, data, prefix: str, lines: List[str]):
+        """Conteneur imbriqué: une ligne vide s'il est vide (comme un bloc vide)."""
+        if data:
+            self._json_lines(data, prefix, lines)
+        else:
+            lines.append("")
 
     def _ingest_pdf(self, file_path: str) -> Dict:
         """
         Ingère un fichier PDF.
-        Note: Nécessite PyPDF2 ou pdfplumber (optionnel).
-        Fallback simple si non disponible.
+        Note: Utilise pypdfium2 (PDFium, code natif), sinon PyPDF2.
+        Fallback simple si aucun n'est disponible.
         """
+        try:
+            import pypdfium2 as pdfium
+        except ImportError:
+            pdfium = None
+
+        if pdfium is not None:
+            pdf = pdfium.PdfDocument(file_path)
+            try:
+                text_content = []
+                for page in pdf:
+                    textpage = page.get_textpage()
+                    text_content.append(textpage.get_text_range())
+                    textpage.close()
+                    page.close()
+            finally:
+                pdf.close()
+
+            return {
+                "type": "pdf",
+                "path": file_path,
+                "page_count": len(text_content),
+                "text_content": "\n\n".join(text_content)
+            }
+
         try:
             # Essayer avec PyPDF2
             import PyPDF2
@@ -256,34 +382,43 @@ class SourceDiscoveryAgent:
                 "text_content": "\n\n".join(text_content)
             }
         except ImportError:
-            # PyPDF2 non installé - retourner info basique
+            # Ni pypdfium2 ni PyPDF2 installés - retourner info basique
             return {
                 "type": "pdf",
                 "path": file_path,
-                "text_content": f"[PDF file: {file_path} - Install PyPDF2 for text extraction]",
-                "warning": "PyPDF2 non installé. Exécuter: poetry add pypdf2"
+                "text_content": f"[PDF file: {file_path} - Install pypdfium2 for text extraction]",
+                "warning": "pypdfium2 non installé. Exécuter: poetry add pypdfium2"
             }
 
-    def ingest_all(self, path: str) -> List[Dict]:
+    def ingest_all(self, path: str, max_workers: int = 8) -> List[Dict]:
         """
         Découvre et ingère toutes les sources d'un répertoire.
+        Les fichiers sont indépendants: ingestion en parallèle (threads,
+        surtout de l'I/O disque).
 
         Args:
             path: Chemin du répertoire
+            max_workers: Nombre de fichiers ingérés simultanément
 
         Returns:
-            Liste des contenus ingérés
+            Liste des contenus ingérés (ordre de découverte)
         """
         sources = self.discover_sources(path)
 
         if isinstance(sources, dict) and "error" in sources:
             return [sources]
 
-        results = []
-        for source in sources:
-            content = self.ingest_source(source)
-            content["source_info"] = source
-            results.append(content)
+        if not sources:
+            return []
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(sources))) as executor:
+            results = list(executor.map(self._ingest_with_info, sources))
 
         print(f"\n✓ {len(results)} sources ingérées")
         return results
+
+    def _ingest_with_info(self, source: Dict) -> Dict:
+        """Ingère une source et y attache ses métadonnées."""
+        content = self.ingest_source(source)
+        content["source_info"] = source
+        return content
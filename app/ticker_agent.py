@@ -1,10 +1,41 @@
 import pandas as pd
 import yfinance as yf
 import ollama
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
 from difflib import get_close_matches
 
 
+# Cache disque des réponses yfinance Ticker.info (une entrée par ticker)
+YF_INFO_CACHE_DIR = Path.home() / ".cache" / "yf_info"
+YF_INFO_CACHE_TTL = 24 * 3600  # secondes, aussi pour le cache mémoire
+YF_INFO_CACHE_MAX = 512  # Entrées du cache mémoire (LRU)
+
+# Noms d'entreprise extraits par le LLM gardés en mémoire (LRU)
+NAME_CACHE_MAX = 512
+
+# Colonnes du fichier des stocks utilisées par la recherche
+STOCKS_COLUMNS = ('Symbol', 'Company Name')
+
+# Mots écrits en majuscules dans une requête (tickers potentiels)
+_UPPER_TOKEN_RE = re.compile(r"\b[A-Z]{1,5}\b")
+
+# Sigles et mots courants qui sont aussi des symboles (IT = Gartner, ON =
+# onsemi...): jamais retenus comme ticker dans une phrase
+_SYMBOL_STOPWORDS = frozenset({
+    "A", "I", "AI", "ALL", "AM", "AN", "AND", "ARE", "AS", "AT", "BE", "BY",
+    "CAN", "CEO", "CFO", "CTO", "DO", "EPS", "ESG", "ETF", "EU", "FOR", "GDP",
+    "GO", "HAS", "HE", "IF", "IN", "IPO", "IS", "IT", "ME", "MY", "NEW", "NOW",
+    "OF", "ON", "OR", "OUT", "PE", "ROE", "ROI", "SEC", "SO", "THE", "TO",
+    "UK", "UP", "US", "USA", "USD", "WE", "YOU",
+})
+
+
 class TickerAgent:
     def __init__(self, stocks_file: str = "data/stocks_symbol.xlsx"):
         """
@@ -12,6 +43,9 @@ class TickerAgent:
         """
         self.stocks_file = Path(stocks_file)
         self.stocks_df = None
+        self._info_cache = OrderedDict()  # ticker -> (instant de l'appel yfinance, info validée)
+        self._cache_lock = threading.Lock()
+        self._name_cache = OrderedDict()  # (requête normalisée, modèle) -> nom d'entreprise
         self._load_stocks()
     
     def _load_stocks(self):
@@ -19,8 +53,43 @@ class TickerAgent:
         if not self.stocks_file.exists():
             raise FileNotFoundError(f"Fichier {self.stocks_file} introuvable")
         
-        self.stocks_df = pd.read_excel(self.stocks_file)
+        # Copie parquet du fichier Excel (lecture openpyxl lente), régénérée
+        # si le fichier Excel est plus récent
+        parquet_file = self.stocks_file.with_suffix('.parquet')
+        try:
+            if parquet_file.stat().st_mtime >= self.stocks_file.stat().st_mtime:
+                self.stocks_df = pd.read_parquet(parquet_file)
+        except (OSError, ImportError, ValueError):
+            self.stocks_df = None  # Copie absente, illisible ou pyarrow absent
+        
+        if self.stocks_df is None:
+            # Seules les colonnes utilisées par la recherche
+            self.stocks_df = pd.read_excel(
+                self.stocks_file,
+                usecols=lambda column: column in STOCKS_COLUMNS
+            )
+            try:
+                self.stocks_df.to_parquet(parquet_file, index=False)
+            except (OSError, ImportError, ValueError):
+                pass  # Copie parquet facultative
+        
         print(f"✓ Chargé {len(self.stocks_df)} stocks depuis {self.stocks_file}")
+        
+        # Index de recherche, construit une fois: nom en minuscules ->
+        # (symbole, nom), première ligne retenue en cas de doublon
+        self._name_index = {}
+        if {'Company Name', 'Symbol'} <= set(self.stocks_df.columns):
+            for name, symbol in zip(self.stocks_df['Company Name'], self.stocks_df['Symbol']):
+                if isinstance(name, str):
+                    self._name_index.setdefault(name.lower(), (symbol, name))
+        self._names_lower = list(self._name_index)
+        
+        # Symboles connus, pour reconnaître un ticker écrit tel quel
+        self._symbols = set()
+        if 'Symbol' in self.stocks_df.columns:
+            self._symbols = {
+                symbol.upper() for symbol in self.stocks_df['Symbol'] if isinstance(symbol, str)
+            }
     
     def find_ticker(self, user_query: str, model: str = "llama3.2") -> dict:
         """
@@ -35,34 +104,40 @@ class TickerAgent:
         """
         print(f"\n🔍 Requête utilisateur: {user_query}")
         
-        # ÉTAPE 1: Extraire le nom de l'entreprise avec LLM
-        company_name = self._extract_company_name(user_query, model)
+        # ÉTAPE 0: Ticker connu écrit tel quel (ex: "MSFT"), sans LLM
+        ticker_candidate = self._match_symbol(user_query)
         
-        if not company_name or company_name.upper() == "UNKNOWN":
-            return {
-                "ticker": None,
-                "name": None,
-                "validated": False,
-                "error": "Impossible d'identifier une entreprise dans la requête"
-            }
-        
-        print(f"  📌 Entreprise identifiée: {company_name}")
-        
-        # ÉTAPE 2: Chercher le ticker dans Excel (fuzzy matching)
-        ticker_candidate = self._search_in_excel(company_name)
-        
-        # ÉTAPE 3: Si pas trouvé, demander au LLM directement
-        if not ticker_candidate:
-            print(f"  ⚠ Pas trouvé dans Excel, demande au LLM...")
-            ticker_candidate = self._llm_find_ticker(company_name, model)
-        
-        if not ticker_candidate:
-            return {
-                "ticker": None,
-                "name": None,
-                "validated": False,
-                "error": f"Ticker introuvable pour '{company_name}'"
-            }
+        if ticker_candidate:
+            print(f"  📌 Ticker identifié: {ticker_candidate}")
+        else:
+            # ÉTAPE 1: Extraire le nom de l'entreprise avec LLM
+            company_name = self._extract_company_name(user_query, model)
+            
+            if not company_name or company_name.upper() == "UNKNOWN":
+                return {
+                    "ticker": None,
+                    "name": None,
+                    "validated": False,
+                    "error": "Impossible d'identifier une entreprise dans la requête"
+                }
+            
+            print(f"  📌 Entreprise identifiée: {company_name}")
+            
+            # ÉTAPE 2: Chercher le ticker dans Excel (fuzzy matching)
+            ticker_candidate = self._search_in_excel(company_name)
+            
+            # ÉTAPE 3: Si pas trouvé, demander au LLM directement
+            if not ticker_candidate:
+                print(f"  ⚠ Pas trouvé dans Excel, demande au LLM...")
+                ticker_candidate = self._llm_find_ticker(company_name, model)
+            
+            if not ticker_candidate:
+                return {
+                    "ticker": None,
+                    "name": None,
+                    "validated": False,
+                    "error": f"Ticker introuvable pour '{company_name}'"
+                }
         
         # ÉTAPE 4: Valider avec yfinance
         yf_info = self._verify_with_yfinance(ticker_candidate)
@@ -81,8 +156,36 @@ class TickerAgent:
             "validated": True
         }
     
+    def _match_symbol(self, user_query: str) -> str:
+        """
+        Ticker connu écrit en majuscules dans la requête, sinon None.
+        Une seule lettre ("I", "A") ou un mot courant ("IT", "NOW") n'est
+        retenu que si c'est toute la requête. Entre plusieurs candidats, le
+        plus long l'emporte, puis le dernier ("IT spending at AAPL" -> AAPL).
+        """
+        query = user_query.strip()
+        if query in self._symbols:
+            return query
+        
+        candidates = [
+            token for token in _UPPER_TOKEN_RE.findall(query)
+            if len(token) > 1 and token not in _SYMBOL_STOPWORDS and token in self._symbols
+        ]
+        if not candidates:
+            return None
+        
+        # max() garde le premier maximum: parcours à l'envers pour le dernier
+        return max(reversed(candidates), key=len)
+    
     def _extract_company_name(self, user_query: str, model: str) -> str:
-        """Extrait le nom de l'entreprise d'une requête libre."""
+        """Extrait le nom de l'entreprise d'une requête libre (réponses LLM en cache)."""
+        
+        cache_key = (" ".join(user_query.lower().split()), model)
+        with self._cache_lock:
+            cached = self._name_cache.get(cache_key)
+            if cached is not None:
+                self._name_cache.move_to_end(cache_key)
+                return cached
         
         prompt = f"""You are a financial assistant. Extract ONLY the company name from the user's query.
 
@@ -112,7 +215,9 @@ Company name:"""
             # Nettoyer la réponse
             company_name = company_name.replace('"', '').replace("'", '').strip()
             
-            return company_name if company_name else "UNKNOWN"
+            company_name = company_name if company_name else "UNKNOWN"
+            self._cache_put(self._name_cache, cache_key, company_name, NAME_CACHE_MAX)
+            return company_name
             
         except Exception as e:
             print(f"  ✗ Erreur LLM extraction: {e}")
@@ -126,45 +231,29 @@ Company name:"""
             print(f"  ⚠ Colonne 'Company Name' introuvable")
             return None
         
-        # Préparer les noms pour la recherche
-        company_names_lower = self.stocks_df['Company Name'].str.lower().tolist()
         search_term = company_name.lower()
         
         # 1. Chercher correspondance exacte
-        exact_matches = self.stocks_df[
-            self.stocks_df['Company Name'].str.lower() == search_term
-        ]
-        
-        if not exact_matches.empty:
-            ticker = exact_matches.iloc[0]['Symbol']
+        match = self._name_index.get(search_term)
+        if match:
+            ticker = match[0]
             print(f"  ✓ Match exact dans Excel: {company_name} → {ticker}")
             return ticker
         
-        # 2. Chercher correspondance partielle
-        partial_matches = self.stocks_df[
-            self.stocks_df['Company Name'].str.contains(search_term, case=False, na=False)
-        ]
-        
-        if not partial_matches.empty:
-            ticker = partial_matches.iloc[0]['Symbol']
-            matched_name = partial_matches.iloc[0]['Company Name']
-            print(f"  ✓ Match partiel dans Excel: {matched_name} → {ticker}")
-            return ticker
+        # 2. Chercher correspondance partielle (premier nom qui contient le terme)
+        for name_lower in self._names_lower:
+            if search_term in name_lower:
+                ticker, matched_name = self._name_index[name_lower]
+                print(f"  ✓ Match partiel dans Excel: {matched_name} → {ticker}")
+                return ticker
         
         # 3. Fuzzy matching
-        matches = get_close_matches(search_term, company_names_lower, n=1, cutoff=0.6)
+        matches = get_close_matches(search_term, self._names_lower, n=1, cutoff=0.6)
         
         if matches:
-            matched_name_lower = matches[0]
-            matched_row = self.stocks_df[
-                self.stocks_df['Company Name'].str.lower() == matched_name_lower
-            ]
-            
-            if not matched_row.empty:
-                ticker = matched_row.iloc[0]['Symbol']
-                matched_name = matched_row.iloc[0]['Company Name']
-                print(f"  ✓ Match fuzzy dans Excel: {matched_name} → {ticker}")
-                return ticker
+            ticker, matched_name = self._name_index[matches[0]]
+            print(f"  ✓ Match fuzzy dans Excel: {matched_name} → {ticker}")
+            return ticker
         
         print(f"  ✗ '{company_name}' non trouvé dans Excel")
         return None
@@ -200,8 +289,7 @@ Ticker:"""
     def _verify_with_yfinance(self, ticker: str) -> dict:
         """Vérifie que le ticker existe sur yfinance."""
         try:
-            stock = yf.Ticker(ticker)
-            info = stock.info
+            info = self._get_info(ticker)
             
             if info and ('longName' in info or 'shortName' in info):
                 company_name = info.get('longName', info.get('shortName'))
@@ -215,6 +303,57 @@ Ticker:"""
             print(f"  ✗ Erreur yfinance: {e}")
             return None
 
+    
+    def _get_info(self, ticker: str) -> dict:
+        """
+        Ticker.info yfinance, en cache mémoire (LRU) puis disque, 24h.
+        Seules les réponses valides (avec un nom) sont mises en cache.
+        """
+        ticker = ticker.upper()
+        now = time.time()
+        
+        with self._cache_lock:
+            cached = self._info_cache.get(ticker)
+            if cached is not None and now - cached[0] < YF_INFO_CACHE_TTL:
+                self._info_cache.move_to_end(ticker)
+                return cached[1]
+        
+        info = None
+        fetched_at = now
+        cache_file = YF_INFO_CACHE_DIR / f"{ticker}.json"
+        try:
+            mtime = cache_file.stat().st_mtime
+            if now - mtime < YF_INFO_CACHE_TTL:
+                with open(cache_file, 'r', encoding='utf-8') as f:
+                    info = json.load(f)
+                fetched_at = mtime
+        except (OSError, ValueError):
+            pass  # Cache absent, expiré ou illisible
+        
+        if info is None:
+            info = yf.Ticker(ticker).info
+            if not info or not ('longName' in info or 'shortName' in info):
+                return info
+            
+            try:
+                YF_INFO_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+                tmp_file = cache_file.with_suffix(".tmp")
+                with open(tmp_file, 'w', encoding='utf-8') as f:
+                    json.dump(info, f, default=str)
+                os.replace(tmp_file, cache_file)
+            except OSError:
+                pass  # Cache disque facultatif
+        
+        self._cache_put(self._info_cache, ticker, (fetched_at, info), YF_INFO_CACHE_MAX)
+        return info
+    
+    def _cache_put(self, cache: OrderedDict, key, value, max_entries: int):
+        """Ajoute une entrée à un cache mémoire (éviction LRU)."""
+        with self._cache_lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > max_entries:
+                cache.popitem(last=False)
 
 if __name__ == "__main__":
     agent = TickerAgent()
@@ -2,41 +2,338 @@
 
 from sentence_transformers import SentenceTransformer
 import chromadb
-from typing import List, Dict
+import hashlib
+import logging
+import numpy as np
+import os
+import platform
+import sqlite3
+import struct
+import threading
+import torch
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from typing import List, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: pas de verrou entre process
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+FULL_EMBEDDING_DIM = 384
+
+# Dimensions conservées par défaut (troncature Matryoshka)
+DEFAULT_EMBEDDING_DIM = 192
+
+# Paramètres HNSW des nouvelles collections (fixés à la création), réglés
+# pour un corpus < 100k documents: graphe plus dense et recherche plus large
+# que les défauts (M=16, construction_ef=100, search_ef=10)
+HNSW_METADATA = {
+    "hnsw:space": "cosine",
+    "hnsw:M": 32,
+    "hnsw:construction_ef": 200,
+    "hnsw:search_ef": 64,
+    "hnsw:num_threads": os.cpu_count() or 1,
+}
+
+# Collection des versions précédentes (384 dimensions, espace L2), migrée
+# vers la collection courante si celle-ci est vide
+LEGACY_COLLECTION = "financial_documents"
+
+# Modèle statique model2vec (EMBEDDING_BACKEND=model2vec): embedding par
+# moyenne de vecteurs de tokens, sans passe de transformer; espace différent
+# de MiniLM, stocké dans sa propre collection
+FAST_EMBEDDING_MODEL = 'minishlab/potion-base-8M'
+FAST_EMBEDDING_DIM = 256
+FAST_MAX_TOKENS = 512
+
+# Poids ONNX quantifiés int8 publiés avec le modèle, selon le CPU
+ONNX_INT8_FILES = {
+    "x86_64": "onnx/model_qint8_avx512_vnni.onnx",
+    "AMD64": "onnx/model_qint8_avx512_vnni.onnx",
+    "arm64": "onnx/model_qint8_arm64.onnx",
+    "aarch64": "onnx/model_qint8_arm64.onnx",
+}
+
+
+# Modèle d'embeddings partagé par toutes les instances du process (chargé
+# une seule fois; poids partagés entre workers forkés avec gunicorn --preload)
+_model: Optional[SentenceTransformer] = None
+_fast_embedder = None
+_model_lock = threading.Lock()
+
+
+def get_embedding_model() -> SentenceTransformer:
+    """Retourne le modèle d'embeddings partagé, chargé au premier appel."""
+    global _model
+    
+    with _model_lock:
+        if _model is None:
+            _model = _load_embedding_model()
+            logger.info("  ✓ Modèle d'embeddings chargé (384 dimensions)")
+        return _model
+
+
+def get_fast_embedder():
+    """Retourne le modèle statique model2vec partagé, chargé au premier appel."""
+    global _fast_embedder
+    
+    with _model_lock:
+        if _fast_embedder is None:
+            from model2vec import StaticModel
+            _fast_embedder = StaticModel.from_pretrained(FAST_EMBEDDING_MODEL)
+            logger.info("  ✓ Modèle statique chargé (%s)", FAST_EMBEDDING_MODEL)
+        return _fast_embedder
+
+
+def _load_embedding_model() -> SentenceTransformer:
+    """
+    Modèle d'embeddings: GPU en FP16 si CUDA est disponible, sinon backend
+    ONNX Runtime int8 (CPU), sinon PyTorch (BF16 si le CPU le supporte).
+    EMBEDDING_BACKEND=torch force PyTorch.
+    """
+    onnx_file = ONNX_INT8_FILES.get(platform.machine())
+    use_cuda = torch.cuda.is_available()
+
+    if os.getenv("EMBEDDING_BACKEND", "onnx") == "onnx" and onnx_file and not use_cuda:
+        try:
+            model = SentenceTransformer(
+                EMBEDDING_MODEL,
+                backend="onnx",
+                model_kwargs={"file_name": onnx_file}
+            )
+            logger.info("  ✓ Backend ONNX int8 (%s)", onnx_file)
+            return model
+        except Exception as e:
+            logger.warning("  ⚠ Backend ONNX indisponible (%s), PyTorch utilisé", e)
+
+    model = SentenceTransformer(EMBEDDING_MODEL, device="cuda" if use_cuda else None)
+
+    dtype = torch.float16 if use_cuda else (torch.bfloat16 if _cpu_has_bf16() else None)
+    if dtype is not None:
+        # Poids du transformer en demi-précision; pooling et normalisation
+        # L2 restent en float32 (sorties du transformer converties)
+        transformer = model[0]
+        transformer.to(dtype=dtype)
+        transformer.register_forward_hook(_upcast_token_embeddings)
+        logger.info("  ✓ Encodeur en %s", str(dtype).replace('torch.', ''))
+
+    return model
+
+
+@contextmanager
+def _file_lock(path: str, shared: bool = False):
+    """
+    Verrou flock entre process (workers gunicorn, CLI) sur un fichier:
+    partagé pour les écritures, exclusif pour recréer / renommer les collections.
+    """
+    if fcntl is None:
+        yield
+        return
+    
+    with open(path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _upcast_token_embeddings(module, inputs, features):
+    """Hook: token_embeddings du transformer convertis en float32."""
+    features["token_embeddings"] = features["token_embeddings"].float()
+    return features
+
+
+def _cpu_has_bf16() -> bool:
+    """Le CPU a-t-il des instructions BF16 natives (AVX512-BF16 / AMX)?"""
+    try:
+        with open("/proc/cpuinfo", "r") as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
 
 
 class VectorStoreAgent:
     """Agent pour gérer le stockage et la recherche vectorielle."""
     
-    def __init__(self, db_path: str = "./chroma_db"):
+    # Taille max d'un document stocké par add_documents
+    MAX_DOCUMENT_CHARS = 10000
+    
+    # Borne haute de caractères par token: au-delà de
+    # max_seq_length * CHARS_PER_TOKEN_BOUND, le texte serait tronqué par le
+    # modèle de toute façon, inutile de le tokeniser
+    CHARS_PER_TOKEN_BOUND = 8
+    
+    # Découpage des sections 10-K avant embedding: ~1000 caractères tiennent
+    # dans la fenêtre du modèle (256 tokens), au lieu d'une section tronquée
+    SECTION_CHUNK_CHARS = 1000
+    SECTION_CHUNK_OVERLAP = 150
+    
+    # Cache des recherches: nombre d'entrées (LRU) et similarité cosinus
+    # au-delà de laquelle une question proche réutilise les résultats
+    QUERY_CACHE_SIZE = 256
+    QUERY_CACHE_THRESHOLD = 0.97
+    
+    # Embeddings des textes déjà encodés (empreinte du contenu, LRU): les
+    # passages répétés d'un 10-K à l'autre ne repassent pas par le modèle
+    TEXT_CACHE_SIZE = 4096
+    
+    # Index en mémoire (recherche exacte numpy) tant que la collection reste
+    # petite; au-delà, les recherches passent par l'index HNSW de ChromaDB
+    LOCAL_INDEX_MAX_DOCUMENTS = 100000
+    
+    # flush() par tranches de documents: l'écriture ChromaDB d'une tranche
+    # (SQLite + HNSW) se fait pendant l'encodage de la suivante
+    FLUSH_CHUNK_SIZE = 64
+    
+    # defragment(): reconstruction seulement si l'index HNSW sur disque a au
+    # moins DEFRAGMENT_MIN_RATIO éléments (supprimés / remplacés compris) par
+    # document de la collection
+    DEFRAGMENT_MIN_RATIO = 1.25
+    
+    def __init__(self, db_path: str = "./chroma_db", embedding_dim: int = None, fast: bool = None):
         """
         Initialise le vector store.
         
         Args:
             db_path: Chemin où ChromaDB stockera les données
+            embedding_dim: Dimensions conservées des embeddings (troncature
+                Matryoshka + renormalisation); défaut: EMBEDDING_DIM ou 192
+            fast: Embeddings du modèle statique model2vec (documents et
+                questions, collection dédiée); défaut: EMBEDDING_BACKEND=model2vec
         """
-        print(f"\n📦 Initialisation Vector Store...")
+        logger.info("📦 Initialisation Vector Store...")
+        
+        if fast is None:
+            fast = os.getenv("EMBEDDING_BACKEND") == "model2vec"
+        self.fast = fast
         
-        # Modèle d'embeddings (petit, rapide, gratuit)
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        print(f"  ✓ Modèle d'embeddings chargé (384 dimensions)")
+        if fast:
+            # Modèle statique: ingestion en masse sans transformer
+            self.fast_embedder = get_fast_embedder()
+            self.embedding_model = None
+            full_dim = FAST_EMBEDDING_DIM
+            self._max_input_chars = FAST_MAX_TOKENS * self.CHARS_PER_TOKEN_BOUND
+        else:
+            # Threads de calcul PyTorch: EMBEDDING_THREADS, à régler sur
+            # cœurs / workers gunicorn (défauts de PyTorch si absent)
+            threads = os.getenv("EMBEDDING_THREADS")
+            if threads:
+                torch.set_num_threads(int(threads))
+                try:
+                    torch.set_num_interop_threads(2)
+                except RuntimeError:
+                    pass  # Déjà fixé (une seule fois par processus)
+            
+            # Modèle d'embeddings (petit, rapide, gratuit), partagé entre instances
+            self.fast_embedder = None
+            self.embedding_model = get_embedding_model()
+            full_dim = FULL_EMBEDDING_DIM
+            self._max_input_chars = self.embedding_model.max_seq_length * self.CHARS_PER_TOKEN_BOUND
+        
+        # Documents en attente du prochain flush() (listes parallèles)
+        self._pending_lock = threading.Lock()
+        self._pending_ids: List[str] = []
+        self._pending_texts: List[str] = []
+        self._pending_metas: List[Dict] = []
+        
+        # Recherches récentes: (query, n_results, ticker_filter) -> (embedding, résultats)
+        self._query_cache = OrderedDict()
+        self._query_cache_lock = threading.Lock()
+        
+        # Embeddings par empreinte blake2b du texte encodé
+        self._text_cache = OrderedDict()
+        self._text_cache_lock = threading.Lock()
         
         # ChromaDB client
         self.client = chromadb.PersistentClient(path=db_path)
+        self.db_path = db_path
+        self._lock_file = os.path.join(db_path, ".collections.lock")
         
-        # Collection pour les documents financiers
-        self.collection = self.client.get_or_create_collection(
-            name="financial_documents",
-            metadata={"description": "10-K sections and financial documents"}
-        )
-        print(f"  ✓ Collection 'financial_documents' prête")
-        print(f"  ✓ Documents actuels : {self.collection.count()}")
+        # Dimensions stockées: les premières composantes, renormalisées
+        # (modèle statique: toutes ses dimensions par défaut)
+        default_dim = full_dim if fast else int(os.getenv("EMBEDDING_DIM", DEFAULT_EMBEDDING_DIM))
+        self.embedding_dim = min(embedding_dim or default_dim, full_dim)
+        
+        # Collection pour les documents financiers (une par modèle et par
+        # dimension: les vecteurs d'une collection ont tous la même taille).
+        # Espace cosinus sur vecteurs normalisés: distance HNSW = produit
+        # scalaire, sans la soustraction par dimension de L2
+        if fast:
+            collection_name = f"financial_documents_potion_{self.embedding_dim}d"
+            description = "10-K sections and financial documents (model2vec)"
+        else:
+            collection_name = f"financial_documents_{self.embedding_dim}d"
+            description = "10-K sections and financial documents"
+        
+        self._collection_name = collection_name
+        with _file_lock(self._lock_file):
+            # Reconstruction (defragment) interrompue: collection restaurée
+            self._recover_rebuild(collection_name)
+            self.collection = self.client.get_or_create_collection(
+                name=collection_name,
+                metadata={"description": description, **HNSW_METADATA}
+            )
+            
+            # Collection créée avant le passage à l'espace cosinus (fixé à la création)
+            if (self.collection.metadata or {}).get("hnsw:space", "l2") != "cosine":
+                self._rebuild_as_cosine(description)
+            
+            # Documents ingérés avant le changement de nom des collections
+            if self.collection.count() == 0 and LEGACY_COLLECTION in self._collection_names():
+                self._migrate_collection(LEGACY_COLLECTION)
+        logger.info("  ✓ Collection '%s' prête (%s dimensions)", collection_name, self.embedding_dim)
+        logger.info("  ✓ Index HNSW: %s", self._hnsw_build())
+        logger.info("  ✓ Documents actuels : %s", self.collection.count())
+        
+        # Tampon des embeddings de flush(), réutilisé entre les appels, et
+        # thread d'écriture (une tranche écrite pendant l'encodage de la suivante)
+        self._embedding_buffer_lock = threading.Lock()
+        self._embedding_buf = np.empty((0, self.embedding_dim), dtype=np.float32)
+        self._write_executor = ThreadPoolExecutor(max_workers=1)
+        
+        # Vecteurs de la collection en mémoire pour les recherches (ChromaDB
+        # reste le stockage durable, écritures répercutées sur les deux);
+        # textes et métadonnées des résultats lus dans ChromaDB par id.
+        # Vecteurs dans un tableau à capacité doublée, lignes utiles: les
+        # len(_index_ids) premières
+        self._index_lock = threading.Lock()
+        self._index_ids: List[str] = []          # ligne -> id
+        self._index_rows: Dict[str, int] = {}    # id -> ligne
+        self._index_vectors = np.empty((0, self.embedding_dim), dtype=np.float32)
+        self._index_ticker_rows: Dict[str, List[int]] = {}  # ticker -> lignes de l'index
+        self._synced_count = 0      # Taille de la collection au dernier alignement
+        self._synced_stamp = None   # Fichiers SQLite au dernier alignement
+        self._index_enabled = self._load_index()
+    
+    @staticmethod
+    def _hnsw_build() -> str:
+        """
+        Build HNSW utilisé par ChromaDB (noyaux de distance SIMD selon la
+        compilation; voir README pour une recompilation native).
+        """
+        try:
+            import hnswlib
+        except ImportError:
+            # ChromaDB >= 0.6: HNSW intégré aux bindings Rust
+            return f"chromadb {chromadb.__version__} (HNSW intégré)"
+        
+        version = getattr(hnswlib, "__version__", "?")
+        return f"chromadb {chromadb.__version__}, hnswlib {version} ({hnswlib.__file__})"
     
     def add_document(
         self, 
         ticker: str, 
         text: str, 
-        metadata: Dict
+        metadata: Dict,
+        defer: bool = False
     ):
         """
         Ajoute un document au vector store.
@@ -45,28 +342,464 @@ class VectorStoreAgent:
             ticker: AAPL, META, etc.
             text: Le texte à stocker (section 10-K, news, etc.)
             metadata: Infos supplémentaires (section, date, url, etc.)
+            defer: Mis en attente jusqu'au prochain flush() (un seul encode
+                et un seul add ChromaDB pour tous les documents en attente)
         """
         # Générer un ID unique
-        doc_id = f"{ticker}_{metadata.get('section', 'doc')}_{metadata.get('year', '2024')}"
-        
-        print(f"\n  📄 Ajout document: {doc_id}")
-        
-        # Créer l'embedding
-        embedding = self.embedding_model.encode(text).tolist()
-        
-        # Ajouter à ChromaDB
-        self.collection.add(
-            ids=[doc_id],
-            embeddings=[embedding],
-            documents=[text],
-            metadatas=[{
-                "ticker": ticker,
-                **metadata
-            }]
+        doc_id = self._doc_id(ticker, metadata, text)
+        
+        logger.debug("📄 Ajout document: %s", doc_id)
+        
+        with self._pending_lock:
+            self._pending_ids.append(doc_id)
+            self._pending_texts.append(text)
+            self._pending_metas.append({"ticker": ticker, **metadata})
+        
+        if not defer:
+            self.flush()
+    
+    def add_documents(self, documents: List[Dict], max_chars: Optional[int] = MAX_DOCUMENT_CHARS) -> int:
+        """
+        Ajoute plusieurs documents en un seul batch.
+        Un seul appel encode() (batch GEMM) et un seul add ChromaDB.
+        
+        Args:
+            documents: Liste de dicts {"ticker", "text", "metadata"}
+            max_chars: Taille max du texte stocké par document (None: texte complet)
+        
+        Returns:
+            Nombre de documents envoyés à ChromaDB
+        """
+        with self._pending_lock:
+            for doc in documents:
+                metadata = doc.get("metadata", {})
+                text = doc["text"]
+                self._pending_ids.append(self._doc_id(doc["ticker"], metadata, text))
+                self._pending_texts.append(text if max_chars is None or len(text) <= max_chars else text[:max_chars])
+                self._pending_metas.append({"ticker": doc["ticker"], **metadata})
+        
+        return self.flush()
+    
+    def flush(self) -> int:
+        """
+        Envoie les documents en attente (listes ids / textes / métadonnées)
+        par tranches de FLUSH_CHUNK_SIZE: encodage batché de chaque tranche,
+        add ChromaDB en parallèle de l'encodage de la suivante.
+        
+        Returns:
+            Nombre de documents envoyés à ChromaDB
+        """
+        with self._pending_lock:
+            ids, texts, metadatas = self._pending_ids, self._pending_texts, self._pending_metas
+            self._pending_ids, self._pending_texts, self._pending_metas = [], [], []
+        
+        # ChromaDB refuse les ids dupliqués dans un même add (premier gardé)
+        first_rows = {}
+        for i, doc_id in enumerate(ids):
+            first_rows.setdefault(doc_id, i)
+        if len(first_rows) < len(ids):
+            rows = list(first_rows.values())
+            ids = [ids[i] for i in rows]
+            texts = [texts[i] for i in rows]
+            metadatas = [metadatas[i] for i in rows]
+        
+        if not ids:
+            return 0
+        
+        # Collection reconstruite ou modifiée par un autre process
+        self._sync_with_collection()
+        
+        logger.debug("📄 Ajout batch: %s documents", len(ids))
+        
+        # Embeddings écrits dans le tampon réutilisé d'un flush à l'autre, par
+        # tranches alternant entre ses deux moitiés: la tranche k est encodée
+        # pendant que le thread d'écriture stocke la tranche k-1
+        chunk = self.FLUSH_CHUNK_SIZE
+        with self._embedding_buffer_lock:
+            buffer = self._embedding_buffer(len(ids) if len(ids) <= chunk else 2 * chunk)
+            pending = None
+            try:
+                for k, start in enumerate(range(0, len(ids), chunk)):
+                    chunk_ids = ids[start:start + chunk]
+                    chunk_texts = texts[start:start + chunk]
+                    offset = (k % 2) * chunk
+                    
+                    embeddings = self._encode_batch(
+                        [self._embedding_input(t) for t in chunk_texts],
+                        batch_size=16,
+                        out=buffer[offset:offset + len(chunk_ids)]
+                    )
+                    
+                    # Une seule écriture en cours: la moitié du tampon
+                    # qu'elle lit n'est réécrite qu'après sa fin
+                    if pending is not None:
+                        pending.result()
+                    pending = self._write_executor.submit(
+                        self._store, chunk_ids, embeddings, chunk_texts, metadatas[start:start + chunk]
+                    )
+            finally:
+                if pending is not None:
+                    pending.result()
+        
+        self._clear_query_cache()
+        
+        logger.debug("  ✓ %s embeddings stockés dans ChromaDB", len(ids))
+        return len(ids)
+    
+    def defragment(self, force: bool = False) -> int:
+        """
+        Reconstruit la collection (index HNSW compact) si elle est fragmentée,
+        en recopiant tous ses documents dans {nom}_rebuild. Échange par
+        renommages: ancienne collection -> {nom}_backup, copie -> {nom}, puis
+        suppression de la backup. Une interruption à n'importe quelle étape est
+        réparée au démarrage suivant (_recover_rebuild).
+        Les écritures de tous les process attendent la fin de l'échange.
+        
+        Args:
+            force: Reconstruire même sans fragmentation mesurée
+        
+        Returns:
+            Nombre de documents recopiés (0 sans reconstruction)
+        """
+        name = self._collection_name
+        ratio = self._fragmentation()
+        if not force and (ratio is None or ratio < self.DEFRAGMENT_MIN_RATIO):
+            logger.info("✓ Collection '%s' non fragmentée (ratio: %s), pas de reconstruction", name, ratio)
+            return 0
+        
+        rebuild_name, backup_name = f"{name}_rebuild", f"{name}_backup"
+        
+        # Pas d'écriture (flush de ce process, _store des autres) pendant la copie
+        with self._embedding_buffer_lock, _file_lock(self._lock_file):
+            self._recover_rebuild(name)  # Restes d'une reconstruction interrompue
+            self.collection = self.client.get_collection(name)
+            
+            rebuilt = self.client.create_collection(
+                name=rebuild_name, metadata=dict(self.collection.metadata or {})
+            )
+            batch_size = self.client.get_max_batch_size()
+            copied = 0
+            while True:
+                data = self.collection.get(
+                    include=["embeddings", "documents", "metadatas"],
+                    limit=batch_size,
+                    offset=copied
+                )
+                if not data["ids"]:
+                    break
+                rebuilt.add(
+                    ids=data["ids"],
+                    embeddings=data["embeddings"],
+                    documents=data["documents"],
+                    metadatas=data["metadatas"]
+                )
+                copied += len(data["ids"])
+            
+            # Toujours une copie complète sous un nom connu de _recover_rebuild
+            self.collection.modify(name=backup_name)
+            rebuilt.modify(name=name)
+            self.collection = rebuilt
+            self.client.delete_collection(backup_name)
+        
+        logger.info("✓ Collection '%s' reconstruite (%s documents)", name, copied)
+        return copied
+    
+    def _recover_rebuild(self, name: str):
+        """
+        Termine ou annule une reconstruction interrompue (appelant: verrou
+        exclusif tenu). Collection absente ou vide: restaurée depuis la backup
+        (ancienne collection complète), à défaut depuis la copie; sinon, les
+        restes (_rebuild, _backup) sont supprimés.
+        """
+        names = set(self._collection_names())
+        rebuild_name, backup_name = f"{name}_rebuild", f"{name}_backup"
+        if rebuild_name not in names and backup_name not in names:
+            return
+        
+        live = name in names and self.client.get_collection(name).count() > 0
+        if not live:
+            source = backup_name if backup_name in names else rebuild_name
+            if name in names:
+                self.client.delete_collection(name)
+            self.client.get_collection(source).modify(name=name)
+            names.discard(source)
+            logger.warning("⚠ Reconstruction interrompue: '%s' restaurée depuis '%s'", name, source)
+        
+        for leftover in (rebuild_name, backup_name):
+            if leftover in names:
+                self.client.delete_collection(leftover)
+                logger.info("  ✓ Reste de reconstruction supprimé: '%s'", leftover)
+    
+    def _rebuild_as_cosine(self, description: str):
+        """
+        Recrée la collection courante en espace cosinus (appelant: verrou
+        exclusif tenu): migration dans {nom}_rebuild, ancienne collection
+        renommée {nom}_l2 (conservée), copie promue. Interrompue, la
+        migration est reprise ou terminée au démarrage suivant (_recover_rebuild).
+        """
+        name = self._collection_name
+        rebuild_name, old_name = f"{name}_rebuild", f"{name}_l2"
+        old = self.collection
+        
+        self.collection = self.client.create_collection(
+            name=rebuild_name,
+            metadata={"description": description, **HNSW_METADATA}
+        )
+        self._migrate_collection(name)
+        
+        if old_name in self._collection_names():
+            self.client.delete_collection(old_name)  # Copie d'une migration précédente
+        old.modify(name=old_name)
+        self.collection.modify(name=name)
+    
+    def _migrate_collection(self, source_name: str) -> int:
+        """
+        Recopie une ancienne collection dans la collection courante, par pages
+        (appelant: verrou exclusif tenu). Embeddings MiniLM stockés repris
+        (renormalisés, tronqués), ré-encodés avec model2vec; ids recalculés
+        (_doc_id). La source est conservée.
+        
+        Returns:
+            Nombre de documents migrés
+        """
+        source = self.client.get_collection(source_name)
+        total = source.count()
+        if total == 0:
+            return 0
+        
+        logger.warning(
+            "⚠ Collection '%s' (%s documents) migrée vers '%s', conservée telle quelle",
+            source_name, total, self._collection_name
+        )
+        
+        page_size = self.client.get_max_batch_size()
+        offset = migrated = 0
+        while True:
+            data = source.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=offset)
+            if not data["ids"]:
+                break
+            offset += len(data["ids"])
+            
+            documents = data["documents"]
+            metadatas = [metadata or {} for metadata in data["metadatas"]]
+            vectors = np.asarray(data["embeddings"], dtype=np.float32)
+            if self.fast or vectors.shape[1] < self.embedding_dim:
+                vectors = self._encode([self._embedding_input(text) for text in documents])
+            else:
+                vectors = self._truncate(self._normalize(vectors))
+            
+            # Ids dupliqués refusés dans un même upsert (premier gardé)
+            rows = {}
+            for i, (text, metadata) in enumerate(zip(documents, metadatas)):
+                rows.setdefault(self._doc_id(metadata.get("ticker") or "", metadata, text), i)
+            self.collection.upsert(
+                ids=list(rows),
+                embeddings=vectors[list(rows.values())],
+                documents=[documents[i] for i in rows.values()],
+                metadatas=[metadatas[i] for i in rows.values()]
+            )
+            migrated += len(rows)
+        
+        logger.warning("  ✓ %s documents migrés depuis '%s'", migrated, source_name)
+        return migrated
+    
+    def _collection_names(self) -> List[str]:
+        """Noms des collections du client (objets Collection ou noms selon la version)."""
+        return [c if isinstance(c, str) else c.name for c in self.client.list_collections()]
+    
+    def _fragmentation(self) -> Optional[float]:
+        """
+        Éléments de l'index HNSW persisté (supprimés / remplacés compris) par
+        document de la collection; None si l'index n'est pas (encore) sur disque.
+        """
+        count = self.collection.count()
+        if count == 0:
+            return None
+        
+        try:
+            sqlite_path = os.path.join(self.db_path, "chroma.sqlite3")
+            with closing(sqlite3.connect(f"file:{sqlite_path}?mode=ro", uri=True)) as conn:
+                row = conn.execute(
+                    "SELECT id FROM segments WHERE collection = ? AND scope = 'VECTOR'",
+                    (str(self.collection.id),)
+                ).fetchone()
+            # En-tête hnswlib: offsetLevel0, max_elements, cur_element_count (size_t)
+            with open(os.path.join(self.db_path, row[0], "header.bin"), "rb") as f:
+                f.seek(16)
+                elements = struct.unpack("<Q", f.read(8))[0]
+        except (sqlite3.Error, OSError, TypeError, struct.error):
+            return None
+        
+        return elements / count
+    
+    def _reattach_collection(self):
+        """
+        Reprend la collection par son nom (reconstruite par un autre process:
+        nouvel identifiant), après la fin d'un échange en cours.
+        """
+        with _file_lock(self._lock_file, shared=True):
+            self.collection = self.client.get_collection(self._collection_name)
+    
+    def _encode(self, texts, **kwargs) -> np.ndarray:
+        """
+        Embeddings stockés / recherchés: tronqués à embedding_dim dimensions
+        puis renormalisés (norme L2 = 1).
+        """
+        if self.fast:
+            vectors = self.fast_embedder.encode(texts, max_length=FAST_MAX_TOKENS)
+            return self._truncate(self._normalize(vectors))
+        
+        vectors = self.embedding_model.encode(
+            texts, convert_to_numpy=True, normalize_embeddings=True, **kwargs
         )
+        return self._truncate(vectors)
+    
+    def _store(self, ids: List[str], embeddings: np.ndarray, texts: List[str], metadatas: List[Dict]):
+        """Écrit un lot dans ChromaDB et dans l'index en mémoire (thread d'écriture)."""
+        # Tableau numpy 2-D passé tel quel (pas de liste de floats Python);
+        # verrou partagé: attend la fin d'une reconstruction (defragment)
+        with _file_lock(self._lock_file, shared=True):
+            try:
+                self.collection.add(ids=ids, embeddings=embeddings, documents=texts, metadatas=metadatas)
+            except Exception:
+                # Collection reconstruite par un autre process depuis le dernier accès
+                self.collection = self.client.get_collection(self._collection_name)
+                self.collection.add(ids=ids, embeddings=embeddings, documents=texts, metadatas=metadatas)
         
-        print(f"    ✓ Embedding créé ({len(embedding)} dimensions)")
-        print(f"    ✓ Stocké dans ChromaDB")
+        self._index_add(ids, embeddings, metadatas)
+    
+    def _embedding_buffer(self, rows: int) -> np.ndarray:
+        """
+        Tampon (rows, embedding_dim) réutilisé par flush(), agrandi au besoin
+        (appelant: _embedding_buffer_lock tenu).
+        """
+        if len(self._embedding_buf) < rows:
+            self._embedding_buf = np.empty(
+                (max(rows, 2 * len(self._embedding_buf)), self.embedding_dim),
+                dtype=np.float32
+            )
+        return self._embedding_buf[:rows]
+    
+    def _encode_batch(self, texts: List[str], batch_size: int = 32, out: np.ndarray = None) -> np.ndarray:
+        """
+        Embeddings d'un lot de textes (textes déjà vus repris du cache):
+        tokenisation en un seul appel au tokenizer, puis passes du modèle par mini-batch de textes de longueurs
+        voisines (padding par batch), écrites directement dans out.
+        Même résultat que _encode (pooling + normalisation du modèle).
+        """
+        if out is None:
+            out = np.empty((len(texts), self.embedding_dim), dtype=np.float32)
+        
+        if self.fast:
+            out[:] = self._encode(texts)  # Pas de passe de transformer à grouper
+            return out
+        
+        # Texte déjà encodé: embedding repris du cache; texte répété dans le
+        # lot: encodé une fois puis copié
+        keys = [hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest() for text in texts]
+        first_rows = {}  # empreinte -> ligne encodée
+        copies = []  # (ligne, ligne encodée de même texte)
+        with self._text_cache_lock:
+            for i, key in enumerate(keys):
+                cached = self._text_cache.get(key)
+                if cached is not None:
+                    self._text_cache.move_to_end(key)
+                    out[i] = cached
+                elif key in first_rows:
+                    copies.append((i, first_rows[key]))
+                else:
+                    first_rows[key] = i
+        
+        if first_rows:
+            self._encode_rows(texts, list(first_rows.values()), out, batch_size)
+        for i, source in copies:
+            out[i] = out[source]
+        
+        with self._text_cache_lock:
+            for key, i in first_rows.items():
+                self._text_cache[key] = out[i].copy()  # out peut être un tampon réutilisé
+            while len(self._text_cache) > self.TEXT_CACHE_SIZE:
+                self._text_cache.popitem(last=False)
+        
+        return out
+    
+    def _encode_rows(self, texts: List[str], rows: List[int], out: np.ndarray, batch_size: int):
+        """Encode texts[i] pour i dans rows, écrit dans out[i]."""
+        model = self.embedding_model
+        encoded = model.tokenizer(
+            [texts[i].strip() for i in rows],
+            truncation=True,
+            max_length=model.max_seq_length
+        )
+        
+        # Batches de longueurs voisines (tri par nombre de tokens): moins de padding
+        order = sorted(range(len(rows)), key=lambda j: len(encoded["input_ids"][j]))
+        
+        # Vue torch de out (même mémoire): sorties copiées sans tableau intermédiaire
+        target = torch.from_numpy(out)
+        with torch.inference_mode():
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                features = model.tokenizer.pad(
+                    {key: [values[j] for j in batch] for key, values in encoded.items()},
+                    return_tensors="pt"
+                )
+                features = {key: value.to(model.device) for key, value in features.items()}
+                embeddings = model(features)["sentence_embedding"].float()
+                if self.embedding_dim < embeddings.shape[-1]:
+                    embeddings = torch.nn.functional.normalize(embeddings[:, :self.embedding_dim], dim=-1)
+                # Remis à la position d'origine des textes
+                target.index_copy_(0, torch.tensor([rows[j] for j in batch]), embeddings.cpu())
+    
+    def _truncate(self, vectors: np.ndarray) -> np.ndarray:
+        """Troncature à embedding_dim dimensions puis renormalisation."""
+        if self.embedding_dim >= vectors.shape[-1]:
+            return vectors
+        
+        return self._normalize(vectors[..., :self.embedding_dim])
+    
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        """Vecteurs ramenés à une norme L2 de 1."""
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+    
+    def embed(self, text: str):
+        """Embedding normalisé (numpy) d'un texte, ex: question pour le cache QA."""
+        if self.fast:
+            return self._normalize(self.fast_embedder.encode(
+                self._embedding_input(text), max_length=FAST_MAX_TOKENS
+            ))
+        
+        return self.embedding_model.encode(
+            self._embedding_input(text),
+            normalize_embeddings=True
+        )
+
+    def _embedding_input(self, text: str) -> str:
+        """
+        Borne le texte envoyé au tokenizer selon la fenêtre du modèle
+        (max_seq_length tokens), sans copie si le texte est déjà court.
+        """
+        limit = self._max_input_chars
+        return text if len(text) <= limit else text[:limit]
+    
+    def _doc_id(self, ticker: str, metadata: Dict, text: str) -> str:
+        """
+        ID du document dans la collection: empreinte blake2b (128 bits) du
+        ticker, de la section, de l'année, du chemin, du passage et du début
+        du texte. Même document -> même ID (ignoré par ChromaDB s'il existe
+        déjà); deux documents de même section / année ne se confondent plus.
+        """
+        key = "|".join((
+            ticker,
+            str(metadata.get("section", "")),
+            str(metadata.get("year", "")),
+            str(metadata.get("path", "")),
+            str(metadata.get("chunk_idx", "")),
+            text[:64]
+        ))
+        return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
     
     def add_10k_sections(self, ticker: str, sections_data: Dict):
         """
@@ -77,26 +810,61 @@ class VectorStoreAgent:
             sections_data: Output de SECParserAgent.get_10k_sections()
         """
         if "error" in sections_data:
-            print(f"  ✗ Erreur : {sections_data['error']}")
+            logger.error("✗ Erreur : %s", sections_data['error'])
             return
         
         sections = sections_data.get("sections", {})
         filing_url = sections_data.get("filing_url")
         
-        for section_name, text in sections.items():
-            if text and text != "Erreur extraction" and text != "Section non trouvée":
-                self.add_document(
-                    ticker=ticker,
-                    text=text,
-                    metadata={
+        # Sections découpées en passages, mis en attente puis envoyés en un
+        # seul encode() et un seul add ChromaDB pour tout le 10-K
+        with self._pending_lock:
+            for section_name, text in sections.items():
+                if not text or text == "Erreur extraction" or text == "Section non trouvée":
+                    continue
+                
+                for chunk_idx, (start, end) in enumerate(self._chunk_offsets(text)):
+                    metadata = {
+                        "ticker": ticker,
                         "section": section_name,
                         "source": "10-K",
                         "url": filing_url,
-                        "year": "2024"  # Tu peux extraire l'année du filing
+                        "year": "2024",  # Tu peux extraire l'année du filing
+                        "chunk_idx": chunk_idx
                     }
-                )
+                    passage = text[start:end]
+                    self._pending_ids.append(self._doc_id(ticker, metadata, passage))
+                    self._pending_texts.append(passage)
+                    self._pending_metas.append(metadata)
+        
+        added = self.flush()
         
-        print(f"\n  ✓ {len(sections)} sections ajoutées pour {ticker}")
+        logger.info("✓ %s passages ajoutés pour %s", added, ticker)
+    
+    def _chunk_offsets(
+        self,
+        text: str,
+        max_chars: int = SECTION_CHUNK_CHARS,
+        overlap: int = SECTION_CHUNK_OVERLAP
+    ) -> List[tuple]:
+        """
+        Bornes (début, fin) des passages d'un texte: coupe en fin de phrase
+        (". ") dans la seconde moitié de la fenêtre si possible, sinon à
+        max_chars; passages consécutifs recouverts de overlap caractères.
+        """
+        offsets = []
+        start = 0
+        while start < len(text):
+            end = min(start + max_chars, len(text))
+            if end < len(text):
+                boundary = text.rfind(". ", start + max_chars // 2, end)
+                if boundary != -1:
+                    end = boundary + 1
+            offsets.append((start, end))
+            if end >= len(text):
+                break
+            start = max(end - overlap, start + 1)
+        return offsets
     
     def search(
         self, 
@@ -115,10 +883,37 @@ class VectorStoreAgent:
         Returns:
             Dict avec documents, metadatas, distances
         """
-        print(f"\n🔍 Recherche : '{query}'")
+        logger.debug("🔍 Recherche : '%s'", query)
+        
+        # Collection modifiée par un autre process (worker gunicorn, ingestion)
+        self._sync_with_collection()
+        
+        # Même question déjà posée: ni embedding ni requête ChromaDB
+        cache_key = (query, n_results, ticker_filter)
+        with self._query_cache_lock:
+            cached = self._query_cache.get(cache_key)
+            if cached is not None:
+                self._query_cache.move_to_end(cache_key)
+                logger.debug("  ✓ Résultats en cache")
+                return self._copy_results(cached[1])
         
-        # Créer l'embedding de la question
-        query_embedding = self.embedding_model.encode(query).tolist()
+        # Créer l'embedding de la question (normalisé par le modèle)
+        query_vector = self._encode(query)
+        
+        # Question quasi identique déjà posée: résultats réutilisés
+        cached = self._similar_query(query_vector, n_results, ticker_filter)
+        if cached is not None:
+            self._cache_query(cache_key, query_vector, cached)
+            logger.debug("  ✓ Résultats en cache (question similaire)")
+            return self._copy_results(cached)
+        
+        # Index en mémoire: plus proches voisins sans requête HNSW, puis
+        # lecture de leurs textes par id
+        if self._index_enabled:
+            results = self._index_search(query_vector, n_results, ticker_filter)
+            logger.debug("  ✓ %s résultats trouvés", len(results['documents']))
+            self._cache_query(cache_key, query_vector, results)
+            return self._copy_results(results)
         
         # Construire le filtre
         where_filter = None
@@ -127,24 +922,230 @@ class VectorStoreAgent:
         
         # Rechercher
         results = self.collection.query(
-            query_embeddings=[query_embedding],
+            query_embeddings=[query_vector],
             n_results=n_results,
             where=where_filter
         )
         
-        print(f"  ✓ {len(results['documents'][0])} résultats trouvés")
+        logger.debug("  ✓ %s résultats trouvés", len(results['documents'][0]))
         
-        return {
+        results = {
             "documents": results['documents'][0],
             "metadatas": results['metadatas'][0],
             "distances": results['distances'][0]
         }
+        self._cache_query(cache_key, query_vector, results)
+        return self._copy_results(results)
+    
+    def _load_index(self) -> bool:
+        """
+        (Re)charge les vecteurs de la collection dans l'index en mémoire, par
+        pages (False si trop grande: recherches via ChromaDB).
+        """
+        count = self.collection.count()
+        with self._index_lock:
+            self._index_ids, self._index_rows, self._index_ticker_rows = [], {}, {}
+            self._index_vectors = np.empty((0, self.embedding_dim), dtype=np.float32)
+            self._synced_count = count
+        
+        if count > self.LOCAL_INDEX_MAX_DOCUMENTS:
+            return False
+        
+        page_size = self.client.get_max_batch_size()
+        offset = 0
+        while True:
+            data = self.collection.get(include=["embeddings", "metadatas"], limit=page_size, offset=offset)
+            if not data["ids"]:
+                break
+            with self._index_lock:
+                self._index_append(data["ids"], np.asarray(data["embeddings"], dtype=np.float32), data["metadatas"])
+            offset += len(data["ids"])
+        
+        # Écritures concurrentes pendant la lecture: rechargement au prochain alignement
+        with self._index_lock:
+            self._synced_count = len(self._index_ids)
+        return True
+    
+    def _collection_stamp(self):
+        """
+        Empreinte (mtime, taille) des fichiers SQLite de ChromaDB: inchangée,
+        la collection n'a pas été modifiée (None si illisible).
+        """
+        stamp = []
+        for suffix in ("", "-wal"):
+            try:
+                stat = os.stat(os.path.join(self.db_path, "chroma.sqlite3" + suffix))
+                stamp.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                stamp.append(None)
+            except OSError:
+                return None
+        return tuple(stamp)
+    
+    def _sync_with_collection(self):
+        """
+        Recharge l'index en mémoire et vide le cache des recherches si la
+        collection n'a plus la taille connue (écritures d'un autre process).
+        count() seulement si les fichiers SQLite ont changé.
+        """
+        stamp = self._collection_stamp()
+        with self._index_lock:
+            if stamp is not None and stamp == self._synced_stamp:
+                return
+        
+        try:
+            count = self.collection.count()
+        except Exception:
+            # Collection reconstruite par un autre process (defragment):
+            # même nom, nouvel identifiant
+            self._reattach_collection()
+            count = -1
+        
+        with self._index_lock:
+            self._synced_stamp = stamp
+            if count == self._synced_count:
+                return
+        
+        logger.info("🔄 Collection modifiée hors de ce process, index rechargé")
+        self._clear_query_cache()
+        self._index_enabled = self._load_index()
+    
+    def _index_add(self, ids: List[str], vectors: np.ndarray, metadatas: List[Dict]):
+        """Ajoute des vecteurs à l'index en mémoire (ids existants ignorés, comme ChromaDB)."""
+        if not self._index_enabled:
+            count = self.collection.count()  # Écritures de ce process: pas de rechargement
+            with self._index_lock:
+                self._synced_count = count
+            return
+        
+        with self._index_lock:
+            self._index_append(ids, vectors, metadatas)
+            self._synced_count = len(self._index_ids)
+    
+    def _index_append(self, ids: List[str], vectors: np.ndarray, metadatas: List[Dict]):
+        """Ajout à l'index (appelant: _index_lock tenu); capacité doublée au besoin."""
+        new_rows = [i for i, doc_id in enumerate(ids) if doc_id not in self._index_rows]
+        if not new_rows:
+            return
+        
+        count = len(self._index_ids)
+        needed = count + len(new_rows)
+        if needed > len(self._index_vectors):
+            grown = np.empty((max(needed, 2 * len(self._index_vectors)), self.embedding_dim), dtype=np.float32)
+            grown[:count] = self._index_vectors[:count]
+            self._index_vectors = grown
+        # Lignes au-delà de count: jamais lues par une recherche en cours
+        self._index_vectors[count:needed] = np.asarray(vectors, dtype=np.float32)[new_rows]
+        
+        for row, i in enumerate(new_rows, start=count):
+            self._index_rows[ids[i]] = row
+            self._index_ids.append(ids[i])
+            ticker = (metadatas[i] or {}).get("ticker")
+            self._index_ticker_rows.setdefault(ticker, []).append(row)
+    
+    def _index_search(self, query_vector, n_results: int, ticker_filter: str = None) -> Dict:
+        """
+        Recherche exacte dans l'index en mémoire (produit matrice-vecteur),
+        distances calculées comme ChromaDB (cosinus: 1 - sim).
+        Avec ticker_filter, seules les lignes du ticker sont comparées.
+        Textes et métadonnées des k meilleurs lus dans ChromaDB.
+        """
+        with self._index_lock:
+            vectors = self._index_vectors
+            ids = self._index_ids
+            count = len(ids)
+            rows = None
+            if ticker_filter:
+                rows = np.array(self._index_ticker_rows.get(ticker_filter, []), dtype=np.intp)
+        
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        if rows is None:
+            similarities = vectors[:count] @ query_vector
+        else:
+            similarities = vectors[rows] @ query_vector
+        
+        k = min(n_results, len(similarities))
+        if k == 0:
+            return {"documents": [], "metadatas": [], "distances": []}
+        
+        # k meilleurs sans trier tout le tableau, puis tri des k
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top])]
+        
+        distances = 1 - similarities[top]
+        if rows is not None:
+            top = rows[top]  # Positions dans le ticker -> lignes de l'index
+        
+        top_ids = [ids[i] for i in top]
+        data = self.collection.get(ids=top_ids, include=["documents", "metadatas"])
+        found = {
+            doc_id: (document, metadata)
+            for doc_id, document, metadata in zip(data["ids"], data["documents"], data["metadatas"])
+        }
+        
+        # Ordre des distances; ids supprimés entre-temps ignorés
+        kept = [(found[doc_id], float(d)) for doc_id, d in zip(top_ids, distances) if doc_id in found]
+        return {
+            "documents": [document for (document, _), _ in kept],
+            "metadatas": [metadata for (_, metadata), _ in kept],
+            "distances": [d for _, d in kept]
+        }
+    
+    def _similar_query(self, query_vector, n_results: int, ticker_filter: str):
+        """Résultats d'une recherche en cache de même paramètres et de question très proche."""
+        with self._query_cache_lock:
+            candidates = [
+                (vector, results) for (_, n, ticker), (vector, results) in self._query_cache.items()
+                if n == n_results and ticker == ticker_filter
+            ]
+        
+        if not candidates:
+            return None
+        
+        # Similarité cosinus de toutes les entrées en un produit matrice-vecteur
+        similarities = np.stack([vector for vector, _ in candidates]) @ query_vector
+        best = int(np.argmax(similarities))
+        if similarities[best] >= self.QUERY_CACHE_THRESHOLD:
+            return candidates[best][1]
+        return None
+    
+    def _cache_query(self, key, query_vector, results: Dict):
+        """Ajoute une recherche au cache (éviction LRU)."""
+        with self._query_cache_lock:
+            self._query_cache[key] = (query_vector, results)
+            self._query_cache.move_to_end(key)
+            while len(self._query_cache) > self.QUERY_CACHE_SIZE:
+                self._query_cache.popitem(last=False)
+    
+    def _clear_query_cache(self):
+        """Vide le cache des recherches (collection modifiée)."""
+        with self._query_cache_lock:
+            self._query_cache.clear()
+    
+    def _copy_results(self, results: Dict) -> Dict:
+        """Copie des listes de résultats (le cache n'est pas modifié par l'appelant)."""
+        return {key: list(values) for key, values in results.items()}
     
     def get_stats(self) -> Dict:
         """Statistiques du vector store."""
         return {
             "total_documents": self.collection.count(),
-            "collection_name": self.collection.name
+            "collection_name": self.collection.name,
+            "embedding_dim": self.embedding_dim,
+            "embedding_model": FAST_EMBEDDING_MODEL if self.fast else EMBEDDING_MODEL
         }
 
 
+if __name__ == "__main__":
+    import sys
+    
+    # Maintenance: python app/vector_store_agent.py defragment [--force]
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    
+    if len(sys.argv) < 2 or sys.argv[1] != "defragment":
+        print("Usage: python app/vector_store_agent.py defragment [--force]")
+        sys.exit(1)
+    
+    agent = VectorStoreAgent()
+    copied = agent.defragment(force="--force" in sys.argv[2:])
+    print(f"✅ {copied} documents recopiés")
@@ -0,0 +1,10 @@
+# app/wsgi.py
+"""
+Point d'entrée WSGI pour la production (gunicorn + workers gevent).
+
+Depuis la racine du projet:
+    gunicorn --pythonpath app -k gevent -w 4 --worker-connections 100 \
+        -b 0.0.0.0:5000 wsgi:app
+"""
+
+from api import app  # noqa: F401
@@ -0,0 +1,40 @@
+# tests/test_ticker_agent.py
+"""Reconnaissance des tickers écrits tels quels (TickerAgent._match_symbol)."""
+
+import pytest
+
+pytest.importorskip("pandas")
+pytest.importorskip("yfinance")
+pytest.importorskip("ollama")
+
+from ticker_agent import TickerAgent
+
+
+@pytest.fixture
+def agent():
+    """Agent sans chargement du fichier Excel, avec des symboles ambigus."""
+    agent = TickerAgent.__new__(TickerAgent)
+    agent._symbols = {"AAPL", "MSFT", "MA", "IT", "ON", "ALL", "NOW", "BE", "SO", "A"}
+    return agent
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("IT spending at AAPL", "AAPL"),
+    ("Is NOW a good time to buy MSFT?", "MSFT"),
+    ("ALL ON BOARD with SO much growth", None),
+    ("What BE the outlook", None),
+    ("Compare MA and MSFT", "MSFT"),
+    ("MSFT or AAPL", "AAPL"),
+    ("Tell me about MSFT", "MSFT"),
+])
+def test_match_symbol_skips_common_words(agent, query, expected):
+    assert agent._match_symbol(query) == expected
+
+
+@pytest.mark.parametrize("query", ["IT", "NOW", " A ", "AAPL"])
+def test_match_symbol_whole_query(agent, query):
+    assert agent._match_symbol(query) == query.strip()
+
+
+def test_match_symbol_unknown(agent):
+    assert agent._match_symbol("Please analyse for me Mastercard") is None
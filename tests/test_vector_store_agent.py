@@ -0,0 +1,101 @@
+# tests/test_vector_store_agent.py
+"""Encodage batché (VectorStoreAgent._encode_rows) identique à SentenceTransformer.encode."""
+
+import platform
+import threading
+from collections import OrderedDict
+
+import pytest
+
+np = pytest.importorskip("numpy")
+torch = pytest.importorskip("torch")
+pytest.importorskip("chromadb")
+pytest.importorskip("sentence_transformers")
+
+from sentence_transformers import SentenceTransformer
+
+from vector_store_agent import (
+    EMBEDDING_MODEL,
+    FULL_EMBEDDING_DIM,
+    ONNX_INT8_FILES,
+    VectorStoreAgent,
+    _upcast_token_embeddings,
+)
+
+
+TEXTS = [
+    "Apple designs, manufactures and markets smartphones.",
+    "Risk factors",
+    "Our revenue depends on a small number of customers. " * 80,  # > max_seq_length
+    "Apple designs, manufactures and markets smartphones.",  # répété dans le lot
+    "Net income increased 12% compared to the prior fiscal year, driven by services.",
+]
+
+# Écart toléré par backend: mêmes poids, mais padding par batch différent
+# (et activations quantifiées / BF16 sensibles au padding)
+TOLERANCES = {"torch": 1e-5, "onnx": 2e-2, "bf16": 2e-2}
+
+
+def load_model(backend: str) -> SentenceTransformer:
+    """Modèle MiniLM sur CPU pour un backend (test ignoré si indisponible)."""
+    try:
+        if backend == "onnx":
+            file_name = ONNX_INT8_FILES.get(platform.machine())
+            if not file_name:
+                pytest.skip(f"Pas de poids ONNX int8 pour {platform.machine()}")
+            return SentenceTransformer(EMBEDDING_MODEL, backend="onnx", model_kwargs={"file_name": file_name})
+
+        model = SentenceTransformer(EMBEDDING_MODEL, device="cpu")
+    except Exception as e:
+        pytest.skip(f"Modèle {backend} indisponible: {e}")
+
+    if backend == "bf16":
+        model[0].to(dtype=torch.bfloat16)
+        model[0].register_forward_hook(_upcast_token_embeddings)
+    return model
+
+
+@pytest.fixture(scope="module", params=list(TOLERANCES))
+def backend(request):
+    return request.param, load_model(request.param)
+
+
+def make_agent(model, embedding_dim: int) -> VectorStoreAgent:
+    """Agent sans ChromaDB, seulement ce dont l'encodage a besoin."""
+    agent = VectorStoreAgent.__new__(VectorStoreAgent)
+    agent.embedding_model = model
+    agent.embedding_dim = embedding_dim
+    agent.fast = False
+    agent._text_cache = OrderedDict()
+    agent._text_cache_lock = threading.Lock()
+    return agent
+
+
+def reference(model, embedding_dim: int) -> np.ndarray:
+    """model.encode normalisé, tronqué et renormalisé comme les vecteurs stockés."""
+    vectors = model.encode(TEXTS, convert_to_numpy=True, normalize_embeddings=True)[:, :embedding_dim]
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+@pytest.mark.parametrize("embedding_dim", [FULL_EMBEDDING_DIM, 192])
+def test_encode_rows_matches_encode(backend, embedding_dim):
+    name, model = backend
+    agent = make_agent(model, embedding_dim)
+
+    out = np.zeros((len(TEXTS), embedding_dim), dtype=np.float32)
+    agent._encode_rows(TEXTS, list(range(len(TEXTS))), out, batch_size=2)
+
+    np.testing.assert_allclose(out, reference(model, embedding_dim), atol=TOLERANCES[name])
+
+
+@pytest.mark.parametrize("embedding_dim", [FULL_EMBEDDING_DIM, 192])
+def test_encode_batch_matches_encode(backend, embedding_dim):
+    name, model = backend
+    agent = make_agent(model, embedding_dim)
+    expected = reference(model, embedding_dim)
+
+    first = agent._encode_batch(TEXTS, batch_size=2)
+    np.testing.assert_allclose(first, expected, atol=TOLERANCES[name])
+
+    # Second appel: tout vient du cache des textes
+    np.testing.assert_array_equal(agent._encode_batch(TEXTS, batch_size=2), first)